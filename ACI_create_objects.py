@@ -14,14 +14,30 @@
 #
 
 # list of packages that should be imported for this code to work
+import math
+import time
+from collections import namedtuple
+
 import cobra.mit.access
 import cobra.mit.naming
 import cobra.mit.request
 import cobra.mit.session
+import cobra.model.fabric
+import cobra.model.fv
 import cobra.model.infra
 from cobra.internal.codec.xmlcodec import toXMLStr
+
+from run_metrics import instrumented
+
+# Defaults for the batched commit engine, may be overridden in config.py
+static_path_batch_size = 500    # Max fvRsPathAtt objects per ConfigRequest
+static_path_batches_per_tenant = None   # If set, split each tenant's paths into this many ConfigRequests instead
+
 from config import *
 
+# Outcome of a single ConfigRequest pushed by commit_in_batches()
+BatchResult = namedtuple('BatchResult', ['group', 'objects', 'seconds', 'committed'])
+
 
 def filter_dict_keys(org_dict, keep_keys):
     """Helper function to keep only certain keys from config.
@@ -36,25 +52,29 @@ def filter_dict_keys(org_dict, keep_keys):
     return newDict
 
 
-def create_switch_profile(node_name, from_block, to_block, int_profile_tDn=None, policy_group_tDn=None):
+@instrumented('create_switch_profile', mos=lambda result, *args, **kwargs: 1)
+def create_switch_profile(session, node_name, from_block, to_block, int_profile_tDn=None, policy_group_tDn=None,
+                          name_prefix=None):
     '''Function to create a switch profile (dn = "uni/infra/<nprof-<node>")
+    :param session = shared ApicSession
     :param node_name = naming of the underlay node (ex: Leaf101) to be used throughout
     :param to_block = block ID of the node. Same as from_blk when creating not vpc
     :param from_block = block ID of the node. Same as to_blk when creating not vpc
     :param policy_group_tDn = complete tDn of the desired associated policy group (ex:uni/infra/funcprof/accnodepgrp-SwPg)
+    :param name_prefix = switch profile prefix of this node, switch_profile_prefix of config.py if None
     '''
-    # log into an APIC and create a directory object
-    ls = cobra.mit.session.LoginSession(apic, user, password)
-    md = cobra.mit.access.MoDirectory(ls)
-    md.login()
+    name = f'{switch_profile_prefix if name_prefix is None else name_prefix}{node_name}'
+
+    # reuse the shared, logged in directory object
+    md = session.mo_directory()
 
     # the top level object on which operations will be made
-    topDn = cobra.mit.naming.Dn.fromString(f'uni/infra/nprof-{switch_profile_prefix}{node_name}')
+    topDn = cobra.mit.naming.Dn.fromString(f'uni/infra/nprof-{name}')
     topParentDn = topDn.getParent()
     topMo = md.lookupByDn(topParentDn)
 
     # build the request using cobra syntax
-    infraNodeP = cobra.model.infra.NodeP(topMo, annotation='', descr='', name=f'{switch_profile_prefix}{node_name}',
+    infraNodeP = cobra.model.infra.NodeP(topMo, annotation='', descr='', name=name,
                                          nameAlias='', ownerKey='', ownerTag='')
     if int_profile_tDn:
         infraRsAccPortP = cobra.model.infra.RsAccPortP(infraNodeP, annotation='',
@@ -76,18 +96,16 @@ def create_switch_profile(node_name, from_block, to_block, int_profile_tDn=None,
         md.commit(c)
     except Exception as e:
         print(e)
-        return
+        return False
 
-    print(f"Created Switch Profile {switch_profile_prefix}{node_name}")
-    md.logout()
-    return
+    print(f"Created Switch Profile {name}")
+    return True
 
 
-def create_int_profile(name, port_selector_dicts):
-    # log into an APIC and create a directory object
-    ls = cobra.mit.session.LoginSession(apic, user, password)
-    md = cobra.mit.access.MoDirectory(ls)
-    md.login()
+@instrumented('create_int_profile', mos=lambda result, session, name, port_selectors: 1 + len(port_selectors))
+def create_int_profile(session, name, port_selectors):
+    # reuse the shared, logged in directory object
+    md = session.mo_directory()
 
     # the top level object on which operations will be made
     # topDn = cobra.mit.naming.Dn.fromString('uni/infra/accportprof-Leaf101')
@@ -99,21 +117,9 @@ def create_int_profile(name, port_selector_dicts):
     infraAccPortP = cobra.model.infra.AccPortP(topMo, annotation='', descr='', name=name, nameAlias='', ownerKey='',
                                                ownerTag='')
 
-    # Keep only the keys which you can pass on to configuration
-    limit_keys = ['annotation', 'descr', 'name', 'nameAlias', 'ownerKey', 'ownerTag', 'type', 'tDn', 'fexId',
-                  'fromCard', 'fromPort', 'toCard', 'toPort']
-
-    # Can have a range of port selectors
-    # for i in range(len(port_selector_dicts)):
-    for sel in port_selector_dicts:
-        port_selector = filter_dict_keys(sel['attributes'], limit_keys)
-        infraHPortS = cobra.model.infra.HPortS(infraAccPortP, **port_selector)
-        if 'policy' in sel.keys():
-            access_group = filter_dict_keys(sel['policy'], limit_keys)
-            infraRsAccBaseGrp = cobra.model.infra.RsAccBaseGrp(infraHPortS, **access_group)
-        for block in sel['blocks']:
-            port_block = filter_dict_keys(block, limit_keys)
-            infraPortBlk = cobra.model.infra.PortBlk(infraHPortS, **port_block)
+    # Can have a range of port selectors, each PortSelector builds its infraHPortS with its policy group and blocks
+    for sel in port_selectors:
+        sel.cobra_mo(infraAccPortP)
 
     # commit the generated code to APIC
     # print(toXMLStr(topMo))
@@ -123,18 +129,16 @@ def create_int_profile(name, port_selector_dicts):
         md.commit(c)
     except Exception as e:
         print(e)
-        return
+        return False
 
     print(f"Created Interface Profile {name}")
-    md.logout()
-    return
+    return True
 
 
-def create_vpc_group(name, id, nodes=[], podId='1'):
-    # log into an APIC and create a directory object
-    ls = cobra.mit.session.LoginSession(apic, user, password)
-    md = cobra.mit.access.MoDirectory(ls)
-    md.login()
+@instrumented('create_vpc_group', mos=lambda result, session, name, id, nodes=[], podId='1': 1 + len(nodes))
+def create_vpc_group(session, name, id, nodes=[], podId='1'):
+    # reuse the shared, logged in directory object
+    md = session.mo_directory()
 
     # the top level object on which operations will be made
     # Replace the text below with the dn of your top object
@@ -155,55 +159,159 @@ def create_vpc_group(name, id, nodes=[], podId='1'):
     # print(toXMLStr(topMo))
     c = cobra.mit.request.ConfigRequest()
     c.addMo(topMo)
-    md.commit(c)
     try:
         md.commit(c)
     except Exception as e:
         print(f"ILLEGAL CONFIGURATION ERROR: {e}")
         # md.logout()
+        return False
     print(f"Created VPC Explicit Group {name} with ID {id} in pod {podId}")
-    md.logout()
-
-
-def create_static_paths(path_dicts):
+    return True
+
+
+def chunk_list(items, batch_size=None, batch_count=None):
+    '''Splits items into consecutive chunks, either of at most batch_size items or into batch_count chunks'''
+    if batch_count:
+        batch_size = max(1, math.ceil(len(items) / batch_count))
+    batch_size = batch_size or len(items) or 1
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+def commit_in_batches(commit, mo_groups, batch_size=None, batches_per_group=None, on_commit=None):
+    '''Commits MOs in a few requests per group (ex: per tenant) instead of one commit per MO.
+    A failed request is bisected and retried until only the offending MOs are left, so a single
+    bad object does not reject the rest of its batch.
+    :param commit = function committing a list of MOs in one request, raising an exception if it is rejected (ex: cobra_commit(md))
+    :param mo_groups = dict of group name -> list of MOs. MOs in a group are committed together and should share a parent (ex: a tenant)
+    :param batch_size = max MOs per request
+    :param batches_per_group = if set, number of requests per group (takes precedence over batch_size)
+    :param on_commit = optional function called with the list of MOs of every accepted request (ex: to checkpoint them)
+    Returns (list of BatchResult, list of (mo, error) for the MOs that could not be committed)'''
+    results = []
+    failures = []
+
+    def _commit(group, mos):
+        start = time.perf_counter()
+        try:
+            commit(mos)
+            committed = True
+        except Exception as e:
+            committed = False
+            if len(mos) == 1:
+                failures.append((mos[0], e))
+        results.append(BatchResult(group, len(mos), time.perf_counter() - start, committed))
+        if committed and on_commit:
+            on_commit(mos)
+        if not committed and len(mos) > 1:
+            # Bisect the failed batch so only the bad objects are reported
+            middle = len(mos) // 2
+            _commit(group, mos[:middle])
+            _commit(group, mos[middle:])
+
+    for group, mos in mo_groups.items():
+        for batch in chunk_list(mos, batch_size, batches_per_group):
+            _commit(group, batch)
+    return results, failures
+
+
+def cobra_commit(md):
+    '''Returns a commit function for commit_in_batches() that pushes Cobra MOs in one ConfigRequest'''
+    def _commit(mos):
+        c = cobra.mit.request.ConfigRequest()
+        for mo in mos:
+            c.addMo(mo)
+        md.commit(c)
+    return _commit
+
+
+def print_batch_report(results):
+    '''Prints per-batch latency and object counts so the batch size can be tuned'''
+    for result in results:
+        state = 'OK' if result.committed else 'FAILED'
+        print(f"  [{state}] {result.group}: {result.objects} objects in {result.seconds:.2f}s")
+    committed = sum(result.objects for result in results if result.committed)
+    total_time = sum(result.seconds for result in results)
+    print(f"  {len(results)} ConfigRequests, {committed} objects committed in {total_time:.2f}s")
+
+
+@instrumented('create_static_paths', mos=lambda result, session, paths, *args, **kwargs: len(paths))
+def create_static_paths(session, paths, batch_size=None, batches_per_tenant=None, on_commit=None):
+    '''Creates fvRsPathAtt static paths, batched into a few ConfigRequests per tenant.
+    :param session = shared ApicSession
+    :param paths = list of StaticBindings of the new paths
+    :param batch_size = max static paths per ConfigRequest (defaults to static_path_batch_size)
+    :param batches_per_tenant = number of ConfigRequests per tenant (defaults to static_path_batches_per_tenant)
+    :param on_commit = optional function called with the dns of the static paths of every committed ConfigRequest
+    Returns the list of (mo, error) for the static paths that could not be committed
+    '''
+    batch_size = batch_size or static_path_batch_size
+    batches_per_tenant = batches_per_tenant or static_path_batches_per_tenant
 
-    limit_keys = ['annotation', 'descr', 'encap', 'instrImedcy', 'mode', 'primaryEncap', 'tDn']
+    # reuse the shared, logged in directory object
+    md = session.mo_directory()
 
-    # log into an APIC and create a directory object
-    ls = cobra.mit.session.LoginSession(apic, user, password)
-    md = cobra.mit.access.MoDirectory(ls)
-    md.login()
+    # Build the MOs directly under their parent EPG dn (no lookup per parent), grouped by tenant
+    paths_by_tenant = {}
+    for path in paths:
+        # ex: uni/tn-<tenant>/ap-<ap>/epg-<epg>
+        tenant = path.parent_dn.split('/')[1]
+        paths_by_tenant.setdefault(tenant, []).append(path.cobra_mo(path.parent_dn))
 
-    path_names = [] # Track path names for printing
+    committed = (lambda mos: on_commit([str(mo.dn) for mo in mos])) if on_commit else None
+    results, failures = commit_in_batches(cobra_commit(md), paths_by_tenant, batch_size, batches_per_tenant, committed)
+    for mo, e in failures:
+        print(f"ILLEGAL CONFIGURATION ERROR: {mo.dn}: {e}")
 
-    # the top level object on which operations will be made
-    # Confirm the dn below is for your top dn
-    for path_dict in path_dicts:
-        path_attributes = path_dict['fvRsPathAtt']['attributes']
-        path_names.append(path_attributes['dn'])
-        # topDn = cobra.mit.naming.Dn.fromString('uni/tn-InfrastructureMgmt_Services/ap-AP_InfrastructureMgmt_Services/epg-EPG_IMS_AIX/rspathAtt-[topology/pod-1/protpaths-107-108/pathep-[VPC1-DEN4A1F09-9040-MR9-SN78E7C0X]]')
-        topDn = cobra.mit.naming.Dn.fromString(path_attributes['dn'])
-        topParentDn = topDn.getParent()
-        topMo = md.lookupByDn(topParentDn)
-
-        # build the request using cobra syntax
-        # fvRsPathAtt = cobra.model.fv.RsPathAtt(topMo, annotation='', descr='', encap='vlan-312', instrImedcy='immediate', mode='regular', primaryEncap='unknown', tDn='topology/pod-1/protpaths-107-108/pathep-[VPC1-DEN4A1F09-9040-MR9-SN78E7C0X]')
-        path_attributes = filter_dict_keys(path_attributes, limit_keys)
-        fvRsPathAtt = cobra.model.fv.RsPathAtt(topMo, **path_attributes)
-
-        # commit the generated code to APIC
-        # print(toXMLStr(topMo))
-        c = cobra.mit.request.ConfigRequest()
-        c.addMo(topMo)
-        try:
-            md.commit(c)
-            # print(f"Created Static Path {path_attributes['dn']}")
-        except Exception as e:
-            print(f"ILLEGAL CONFIGURATION ERROR: {e}")
-            # md.logout()
+    print_batch_report(results)
+    print(f"Successfully Created {len(paths) - len(failures)} of {len(paths)} Static Paths")
+    return failures
 
-    print(f"Successfully Created Static Paths:\n {str(path_names)}")
-    md.logout()
-    return
 
+# ----- REST payloads -----
+# The same objects the create_* functions build with Cobra, as {class: {'attributes': {}, 'children': []}} dicts.
+# Used by the planner to compute and store the change set without committing anything.
 
+def switch_profile_payload(node_name, from_block, to_block, int_profile_tDn=None, policy_group_tDn=None,
+                           name_prefix=None):
+    '''Returns (parent dn, infraNodeP payload) matching create_switch_profile()'''
+    leaf_children = []
+    if policy_group_tDn:
+        leaf_children.append({'infraRsAccNodePGrp': {'attributes': {'annotation': '', 'tDn': policy_group_tDn}}})
+    leaf_children.append({'infraNodeBlk': {'attributes': {'annotation': '', 'descr': '', 'from_': str(from_block),
+                                                          'name': f'{block_prefix}{node_name}', 'nameAlias': '',
+                                                          'to_': str(to_block)}}})
+    children = []
+    if int_profile_tDn:
+        children.append({'infraRsAccPortP': {'attributes': {'annotation': '', 'tDn': int_profile_tDn}}})
+    children.append({'infraLeafS': {'attributes': {'annotation': '', 'descr': '', 'name': f'{switch_selector_prefix}{node_name}',
+                                                   'nameAlias': '', 'ownerKey': '', 'ownerTag': '', 'type': 'range'},
+                                    'children': leaf_children}})
+    name = f'{switch_profile_prefix if name_prefix is None else name_prefix}{node_name}'
+    return 'uni/infra', {'infraNodeP': {'attributes': {'dn': f'uni/infra/nprof-{name}', 'annotation': '', 'descr': '',
+                                                       'name': name, 'nameAlias': '', 'ownerKey': '', 'ownerTag': ''},
+                                        'children': children}}
+
+
+def int_profile_payload(name, port_selectors):
+    '''Returns (parent dn, infraAccPortP payload) matching create_int_profile()'''
+    selectors = [sel.payload() for sel in port_selectors]
+    return 'uni/infra', {'infraAccPortP': {'attributes': {'dn': f'uni/infra/accportprof-{name}', 'annotation': '',
+                                                          'descr': '', 'name': name, 'nameAlias': '', 'ownerKey': '',
+                                                          'ownerTag': ''},
+                                           'children': selectors}}
+
+
+def vpc_group_payload(name, id, nodes, podId='1'):
+    '''Returns (parent dn, fabricExplicitGEp payload) matching create_vpc_group()'''
+    children = [{'fabricRsVpcInstPol': {'attributes': {'annotation': '', 'tnVpcInstPolName': ''}}}]
+    for node in nodes:
+        children.append({'fabricNodePEp': {'attributes': {'annotation': '', 'descr': '', 'id': str(node), 'name': '',
+                                                          'nameAlias': '', 'podId': str(podId)}}})
+    return 'uni/fabric/protpol', {'fabricExplicitGEp': {'attributes': {'dn': f'uni/fabric/protpol/expgep-{name}',
+                                                                       'annotation': '', 'id': str(id), 'name': name},
+                                                        'children': children}}
+
+
+def static_path_payload(path):
+    '''Returns (parent epg dn, fvRsPathAtt payload) matching create_static_paths()'''
+    return path.parent_dn, path.payload()
@@ -0,0 +1,92 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Exports a plan computed with "fabric_migration.py --plan" for Ansible: the changes are split into the same batched
+# hierarchical payloads --apply pushes (under uni/infra, uni/fabric/protpol and every tenant), one JSON file each, and
+# an inventory with one host per payload. Ansible_Code/ACI-Bulk-Apply.yml pushes every payload with a single aci_rest
+# POST, the payloads of a step running in parallel up to the playbook's forks.
+# Usage: python3 ansible_export.py plan.ndjson OUTPUT_DIR [--batch-size 500]
+
+import argparse
+import json
+import os
+import re
+from urllib.parse import urlparse
+
+from ACI_create_objects import chunk_list, static_path_batch_size
+from migration_plan import group_changes, nest_changes, read_plan
+
+INVENTORY_FILE = 'inventory.json'
+PAYLOAD_DIR = 'payloads'
+
+# Inventory group of the payloads pushed under each root, the playbook runs one play per group in this order
+ROOT_GROUPS = {'uni/infra': 'access_policies', 'uni/fabric/protpol': 'vpc_groups'}
+TENANT_GROUP = 'tenants'
+GROUP_ORDER = ('access_policies', 'vpc_groups', TENANT_GROUP)
+
+
+def _host_name(number, root):
+    # ex: b0003_tn-Tenant1, only the characters inventory host names accept
+    return f"b{number:04d}_{re.sub(r'[^A-Za-z0-9_-]', '_', root.split('/')[-1])}"
+
+
+def apic_vars(apic):
+    '''aci_rest connection variables of an APIC address (ex: https://10.0.0.1:8443)'''
+    url = urlparse(apic if '://' in apic else f'https://{apic}')
+    return {'aci_host': url.hostname, 'aci_port': url.port or (443 if url.scheme == 'https' else 80),
+            'aci_use_ssl': url.scheme == 'https'}
+
+
+def export_plan(changes, output_dir, apic=None, batch_size=None):
+    '''Writes the payloads of a plan and their inventory to output_dir.
+    :param changes = plan changes, from read_plan()
+    :param apic = APIC address written to the inventory, may be overridden with --extra-vars aci_host=...
+    :param batch_size = max objects per payload (defaults to static_path_batch_size)
+    Returns the inventory dict'''
+    os.makedirs(os.path.join(output_dir, PAYLOAD_DIR), exist_ok=True)
+    groups = {group: {'hosts': {}} for group in GROUP_ORDER}
+    number = 0
+    for root, root_changes in group_changes(changes).items():
+        for batch in chunk_list(root_changes, batch_size or static_path_batch_size):
+            number += 1
+            host = _host_name(number, root)
+            payload = os.path.join(PAYLOAD_DIR, f'{host}.json')
+            with open(os.path.join(output_dir, payload), 'w') as fp:
+                json.dump(nest_changes(root, batch), fp, separators=(',', ':'))
+            groups[ROOT_GROUPS.get(root, TENANT_GROUP)]['hosts'][host] = {
+                'aci_path': f'/api/mo/{root}.json', 'aci_payload': payload, 'aci_objects': len(batch)}
+    inventory = {'all': {'vars': apic_vars(apic) if apic else {}, 'children': groups}}
+    with open(os.path.join(output_dir, INVENTORY_FILE), 'w') as fp:
+        json.dump(inventory, fp, indent=2)
+    return inventory
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a fabric_migration.py plan as aci_rest bulk payloads for '
+                                                 'Ansible_Code/ACI-Bulk-Apply.yml')
+    parser.add_argument('plan_file', help='Plan written by fabric_migration.py --plan')
+    parser.add_argument('output_dir', help='Directory of the inventory and payloads')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help=f'Max objects per payload (default: static_path_batch_size, {static_path_batch_size})')
+    args = parser.parse_args()
+
+    header, changes = read_plan(args.plan_file)
+    inventory = export_plan(changes, args.output_dir, header.get('apic'), args.batch_size)
+    for group in GROUP_ORDER:
+        hosts = inventory['all']['children'][group]['hosts']
+        print(f"  {group:<16} {len(hosts):>5} payloads, {sum(host['aci_objects'] for host in hosts.values()):>7} objects")
+    payloads = sum(len(inventory['all']['children'][group]['hosts']) for group in GROUP_ORDER)
+    print(f'{len(changes)} objects of {args.plan_file} in {payloads} aci_rest POSTs, written to {args.output_dir}')
+    print(f'Push them with: ansible-playbook -i {os.path.join(args.output_dir, INVENTORY_FILE)} '
+          f'Ansible_Code/ACI-Bulk-Apply.yml -f 8 --extra-vars \'{{"runtime_user":"aciuser","runtime_pass":"acipass"}}\'')
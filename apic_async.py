@@ -0,0 +1,255 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# asyncio client for the APIC REST API (requires aiohttp: pip3 install aiohttp).
+# Independent reads and commits overlap instead of running back to back, bounded by a concurrency limit.
+
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+
+from apic_queries import (FABRIC_NODES_URL, LEAF_INTERFACE_PROFILES_URL, LEAF_SWITCH_PROFILES_URL, STATIC_BINDINGS_URL,
+                          VPC_GROUPS_URL, fabric_node_url, static_paths_url)
+from apic_session import DEFAULT_TOKEN_LIFETIME, TOKEN_REFRESH_MARGIN
+from run_metrics import METRICS
+
+# Responses that are retried with exponential backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ApicRequestError(Exception):
+    '''Request the APIC rejected, or that still failed after every retry'''
+
+    def __init__(self, status, text):
+        super().__init__(f'{status}: {text}')
+        self.status = status
+        self.text = text
+
+
+class AsyncApicSession:
+    '''asyncio counterpart of apic_session.ApicSession: one keep-alive connection pool and one token shared by
+    every concurrent request. Use it as an async context manager.
+    :param apic = APIC address (ex: https://10.10.10.1)
+    :param concurrency = max requests in flight towards the APIC
+    :param retries = retries of a request answered with 429/5xx or failing at the connection level. Config POSTs
+                     are retried too, they create or merge objects so pushing them twice is harmless
+    :param backoff = first retry delay in seconds, doubled on every retry (a Retry-After header takes precedence)'''
+
+    def __init__(self, apic, user, password, concurrency=8, verify=False, retries=4, backoff=0.5, timeout=90):
+        self.apic = apic
+        self.base = f'{apic}/api'
+        self.user = user
+        self.password = password
+        self.verify = verify
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.concurrency = concurrency
+
+        # Counters
+        self.login_count = 0
+        self.refresh_count = 0
+        self.retry_count = 0
+
+        self._token = None
+        self._token_time = 0
+        self._token_lifetime = DEFAULT_TOKEN_LIFETIME
+        self._token_lock = None
+        self._semaphore = None
+        self._http = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        # Created here so they belong to the running event loop
+        self._token_lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ssl=None if self.verify else False)
+        self._http = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    def _store_token(self, body):
+        attributes = body['imdata'][0]['aaaLogin']['attributes']
+        self._token = attributes['token']
+        self._token_time = time.time()
+        self._token_lifetime = int(attributes.get('refreshTimeoutSeconds') or DEFAULT_TOKEN_LIFETIME)
+
+    async def login(self):
+        payload = {"aaaUser": {"attributes": {"name": self.user, "pwd": self.password}}}
+        async with self._http.post(f'{self.base}/aaaLogin.json', json=payload) as response:
+            self.login_count += 1
+            # The body of a refused login may not be JSON (ex: an HTML page from a proxy), it is only parsed on success
+            if response.status != 200:
+                raise ApicRequestError(response.status, 'Authentication failed, please check configured user+pass')
+            body = await response.json(content_type=None)
+        self._store_token(body)
+        return self._token
+
+    async def refresh(self):
+        async with self._http.get(f'{self.base}/aaaRefresh.json', headers=self._headers()) as response:
+            if response.status != 200:
+                return await self.login()
+            body = await response.json(content_type=None)
+        self.refresh_count += 1
+        self._store_token(body)
+        return self._token
+
+    async def token(self, expired=None):
+        '''Returns a valid token. Concurrent callers wait for a single login or refresh.
+        :param expired = token the APIC just refused, forces a new login unless another task already replaced it'''
+        async with self._token_lock:
+            if expired is not None and expired == self._token:
+                return await self.login()
+            age = time.time() - self._token_time
+            if self._token is None or age >= self._token_lifetime:
+                return await self.login()
+            if age >= self._token_lifetime - TOKEN_REFRESH_MARGIN:
+                return await self.refresh()
+            return self._token
+
+    def _headers(self):
+        return {'Cookie': f'APIC-Cookie={self._token}'}
+
+    async def request(self, method, path, payload=None):
+        '''Sends one request to a path relative to /api and returns the decoded JSON body.
+        Retries 429/5xx responses and connection errors with exponential backoff, logs in again once if the token
+        was refused. Raises ApicRequestError for any other error status'''
+        data = json.dumps(payload).encode() if payload is not None else None
+        relogged = False
+        attempt = 0
+        while True:
+            token = await self.token()
+            try:
+                async with self._semaphore:
+                    start = time.perf_counter()
+                    async with self._http.request(method, f'{self.base}{path}', data=data,
+                                                  headers={'Cookie': f'APIC-Cookie={token}',
+                                                           'Content-Type': 'application/json'}) as response:
+                        body = await response.read()
+                        METRICS.record_request(time.perf_counter() - start, len(data) if data else 0, len(body))
+                        status = response.status
+                        retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status, body, retry_after = None, str(e).encode(), None
+
+            if status == 200:
+                return json.loads(body) if body else {}
+            if status == 403 and not relogged:
+                relogged = True
+                await self.token(expired=token)
+                continue
+            if (status is None or status in RETRY_STATUSES) and attempt < self.retries:
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else \
+                    self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                attempt += 1
+                self.retry_count += 1
+                await asyncio.sleep(delay)
+                continue
+            raise ApicRequestError(status, body.decode(errors='replace'))
+
+    async def get(self, path):
+        return await self.request('GET', path)
+
+    async def post(self, path, payload):
+        return await self.request('POST', path, payload)
+
+    async def query_all(self, path, page_size=None):
+        '''Returns the imdata of a query. With a page_size, the first page gives the total count and the remaining
+        pages are fetched concurrently'''
+        if not page_size:
+            return (await self.get(path))['imdata']
+        separator = '&' if '?' in path else '?'
+        first = await self.get(f'{path}{separator}page=0&page-size={page_size}')
+        pages = -(-int(first.get('totalCount', 0)) // page_size)
+        rest = await asyncio.gather(*(self.get(f'{path}{separator}page={page}&page-size={page_size}')
+                                      for page in range(1, pages)))
+        return [mo for body in [first] + list(rest) for mo in body['imdata']]
+
+    def stats(self):
+        return {
+            'logins': self.login_count,
+            'token_refreshes': self.refresh_count,
+            'retries': self.retry_count,
+        }
+
+    async def close(self):
+        '''Logs out and closes the connection pool'''
+        if self._http is None:
+            return
+        if self._token is not None:
+            try:
+                async with self._http.post(f'{self.base}/aaaLogout.json', headers=self._headers(),
+                                           json={'aaaUser': {'attributes': {'name': self.user}}}):
+                    pass
+            except aiohttp.ClientError:
+                pass
+            self._token = None
+        await self._http.close()
+        self._http = None
+
+
+# ----- Reads, same surface and return values as the get_* functions of fabric_migration.py -----
+
+async def get_fabric_nodes(session):
+    return await session.get(FABRIC_NODES_URL)
+
+
+async def get_fabric_node_by_id(session, node_id):
+    return await session.get(fabric_node_url(node_id))
+
+
+async def get_leaf_switch_profiles(session):
+    return await session.get(LEAF_SWITCH_PROFILES_URL)
+
+
+async def get_leaf_interface_profiles(session):
+    return await session.get(LEAF_INTERFACE_PROFILES_URL)
+
+
+async def get_vpc_groups(session):
+    return await session.get(VPC_GROUPS_URL)
+
+
+async def get_static_paths(session, source_leaf_list):
+    '''One query per node like fabric_migration.get_static_paths(), all in flight at once. Returns the responses
+    in source_leaf_list order'''
+    return list(await asyncio.gather(*(session.get(static_paths_url(node)) for node in source_leaf_list)))
+
+
+async def get_fabric_state(session, page_size=None, static_bindings=True):
+    '''Fetches the fabric nodes, switch profiles, interface profiles, VPC groups and (optionally) every static binding
+    concurrently. Returns a dict of name -> list of MO dicts, ready for FabricInventory.from_mos() and
+    StaticBindingIndex.from_bindings()'''
+    queries = {'fabric_nodes': FABRIC_NODES_URL, 'switch_profiles': LEAF_SWITCH_PROFILES_URL,
+               'interface_profiles': LEAF_INTERFACE_PROFILES_URL, 'vpc_groups': VPC_GROUPS_URL}
+    if static_bindings:
+        queries['static_bindings'] = STATIC_BINDINGS_URL
+    results = await asyncio.gather(*(session.query_all(path, page_size) for path in queries.values()))
+    return dict(zip(queries, results))
+
+
+# ----- Writes -----
+
+async def post_mo(session, parent_dn, payload):
+    '''Posts one MO payload (ex: from ACI_create_objects.switch_profile_payload()) under its parent, the raw REST
+    equivalent of a Cobra ConfigRequest'''
+    return await session.post(f'/mo/{parent_dn}.json', payload)
+
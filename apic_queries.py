@@ -0,0 +1,47 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Queries shared by the get_* functions of fabric_migration.py, their streamed, paginated equivalents
+# (apic_stream.iter_query) and the asyncio client (apic_async)
+
+FABRIC_NODES_URL = "/node/class/fabricNode.json?query-target-filter=ne(fabricNode.role, %22controller%22)"
+LEAF_SWITCH_PROFILES_URL = "/node/mo/uni/infra.json?query-target=children&target-subtree-class=infraNodeP&query-target-filter" \
+                           "=not(wcard(infraNodeP.dn,%22__ui_%22))&rsp-subtree=full&rsp-subtree-class=infraLeafS,infraRsAccPortP," \
+                           "infraRsAccCardP,infraNodeBlk,infraRsAccNodePGrp&order-by=infraNodeP.name"
+LEAF_INTERFACE_PROFILES_URL = '/node/mo/uni/infra.json?query-target=subtree&target-subtree-class=infraAccPortP&query-target-filter' \
+                              '=not(wcard(infraAccPortP.dn,"__ui_"))&query-target=children&target-subtree-class=infraAccPortP&rsp' \
+                              '-subtree=full&rsp-subtree-class=infraHPortS,infraPortBlk,infraRsAccBaseGrp,' \
+                              'infraSubPortBlk&order-by=infraAccPortP.name'
+VPC_GROUPS_URL = '/node/mo/uni/fabric/protpol.json?query-target=subtree'
+# Every static binding of the fabric, ordered so pages stay stable while paginating
+STATIC_BINDINGS_URL = '/class/fvRsPathAtt.json?order-by=fvRsPathAtt.dn'
+
+
+def fabric_node_url(node_id):
+    return f"/node/class/fabricNode.json?query-target-filter=and(ne(fabricNode.role, %22controller%22),eq(fabricNode.id,%22{node_id}%22))"
+
+
+def static_paths_url(node_id):
+    '''Static paths on the single node and VPC paths of a node'''
+    return f'/class/fvRsPathAtt.json?query-target-filter=or(wcard(fvRsPathAtt.tDn,"/paths-{node_id}"),wcard(fvRsPathAtt.tDn,"/protpaths-{node_id}"))'
+
+
+def vpc_static_paths_url(node_id):
+    '''Static paths on the VPC paths of a node'''
+    return f'/class/fvRsPathAtt.json?query-target-filter=wcard(fvRsPathAtt.tDn,"/protpaths-{node_id}")'
+
+
+def snapshot_jobs_url(export_dn):
+    '''Jobs (configJob) of a configExportP policy, one per export run'''
+    return f'/node/mo/uni/backupst/jobs-[{export_dn}].json?query-target=children&target-subtree-class=configJob'
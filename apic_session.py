@@ -0,0 +1,225 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
+
+from run_metrics import METRICS, instrumented
+
+# Tokens are valid for 300 seconds unless the APIC says otherwise in refreshTimeoutSeconds
+DEFAULT_TOKEN_LIFETIME = 300
+# Refresh the token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 60
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    '''HTTPS connection that reports how long the TCP connect + TLS handshake took'''
+    on_connect = None
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        if self.on_connect:
+            self.on_connect(time.perf_counter() - start)
+
+
+class _TimedAdapter(HTTPAdapter):
+    '''Keep-alive adapter whose HTTPS pools use _TimedHTTPSConnection'''
+
+    def __init__(self, on_connect, **kwargs):
+        connection_cls = type('TimedHTTPSConnection', (_TimedHTTPSConnection,), {'on_connect': staticmethod(on_connect)})
+        self._pool_cls = type('TimedHTTPSConnectionPool', (HTTPSConnectionPool,), {'ConnectionCls': connection_cls})
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = dict(self.poolmanager.pool_classes_by_scheme, https=self._pool_cls)
+
+
+class RateLimiter:
+    '''Thread safe token bucket shared by every thread talking to the same APIC
+    :param rate = max requests per second
+    :param burst = max requests allowed back to back'''
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0
+            self._tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+
+
+class _LimitedSession(requests.Session):
+    '''requests.Session that passes every request, including the ones Cobra makes, through a RateLimiter
+    and records it in the run metrics. Streamed bodies are counted by their reader (apic_stream.iter_query)'''
+    rate_limiter = None
+
+    def request(self, *args, **kwargs):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        start = time.perf_counter()
+        response = super().request(*args, **kwargs)
+        body = response.request.body
+        METRICS.record_request(time.perf_counter() - start, len(body) if body else 0,
+                               0 if kwargs.get('stream') else len(response.content))
+        return response
+
+
+class ApicSession:
+    '''One APIC session shared by every fetch and create function.
+    Owns a keep-alive requests.Session pool and a single Cobra MoDirectory that reuses the same token
+    and connection pool. The token is refreshed through aaaRefresh before it expires.
+    :param apic = APIC address (ex: https://10.10.10.1)
+    :param pool_size = max keep-alive connections to the APIC
+    :param requests_per_second = optional global request rate limit towards the APIC'''
+
+    def __init__(self, apic, user, password, pool_size=10, verify=False, requests_per_second=None):
+        self.apic = apic
+        self.base = f'{apic}/api'
+        self.user = user
+        self.password = password
+        self.verify = verify
+
+        # Counters
+        self.login_count = 0
+        self.refresh_count = 0
+        self.tls_handshakes = 0
+        self.tls_handshake_seconds = 0.0
+
+        self._token = None
+        self._token_time = 0
+        self._token_lifetime = DEFAULT_TOKEN_LIFETIME
+        self._token_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._md = None
+
+        requests.packages.urllib3.disable_warnings()
+        self.http = _LimitedSession()
+        self.http.verify = verify
+        if requests_per_second:
+            self.http.rate_limiter = RateLimiter(requests_per_second)
+        adapter = _TimedAdapter(self._record_handshake, pool_connections=1, pool_maxsize=pool_size)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def _record_handshake(self, seconds):
+        with self._counter_lock:
+            self.tls_handshakes += 1
+            self.tls_handshake_seconds += seconds
+
+    def _store_token(self, response):
+        attributes = response.json()['imdata'][0]['aaaLogin']['attributes']
+        self._token = attributes['token']
+        self._token_time = time.time()
+        self._token_lifetime = int(attributes.get('refreshTimeoutSeconds') or DEFAULT_TOKEN_LIFETIME)
+        if self._md is not None:
+            self._md.session.cookie = self._token
+
+    @instrumented('auth')
+    def login(self):
+        '''Logs into the APIC and stores the token. Returns the token or -1 if authentication failed'''
+        payload = {
+            "aaaUser": {
+                "attributes": {
+                    "name": self.user,
+                    "pwd": self.password
+                }
+            }
+        }
+        response = self.http.post(f"{self.base}/aaaLogin.json", json=payload)
+        self.login_count += 1
+        if response.status_code != 200:
+            print('ERROR during Authentication! Token could not be retrieved. Please check configured user+pass')
+            print('Received response was' + response.text)
+            return -1
+        self._store_token(response)
+        return self._token
+
+    @instrumented('auth')
+    def refresh(self):
+        '''Extends the current token through aaaRefresh, falling back to a new login if the refresh is refused'''
+        response = self.http.get(f"{self.base}/aaaRefresh.json", headers={"Cookie": f"APIC-Cookie={self._token}"})
+        if response.status_code != 200:
+            return self.login()
+        self.refresh_count += 1
+        self._store_token(response)
+        return self._token
+
+    def token(self):
+        '''Returns a valid token, logging in or refreshing it ahead of expiry as needed'''
+        with self._token_lock:
+            age = time.time() - self._token_time
+            if self._token is None or age >= self._token_lifetime:
+                return self.login()
+            if age >= self._token_lifetime - TOKEN_REFRESH_MARGIN:
+                return self.refresh()
+            return self._token
+
+    def headers(self):
+        return {"Cookie": f"APIC-Cookie={self.token()}"}
+
+    def get(self, path, **kwargs):
+        '''GET a path relative to /api (ex: /node/class/fabricNode.json) over the pooled connection'''
+        return self.http.get(f"{self.base}{path}", headers=self.headers(), **kwargs)
+
+    def post(self, path, payload, **kwargs):
+        '''POST a JSON payload to a path relative to /api over the pooled connection'''
+        return self.http.post(f"{self.base}{path}", headers=self.headers(), json=payload, **kwargs)
+
+    def mo_directory(self):
+        '''Returns the shared Cobra MoDirectory. It reuses this session's token and connection pool, so
+        Cobra commits do not log in again'''
+        import cobra.mit.access
+        import cobra.mit.session
+
+        token = self.token()
+        if self._md is None:
+            ls = cobra.mit.session.LoginSession(self.apic, self.user, self.password, secure=self.verify)
+            ls.cookie = token
+            self._md = cobra.mit.access.MoDirectory(ls)
+            # Cobra keeps its own requests.Session, point it at the shared keep-alive pool instead
+            self._md._accessImpl._requests = self.http
+        return self._md
+
+    def stats(self):
+        return {
+            'logins': self.login_count,
+            'token_refreshes': self.refresh_count,
+            'tls_handshakes': self.tls_handshakes,
+            'tls_handshake_seconds': round(self.tls_handshake_seconds, 3),
+        }
+
+    @instrumented('auth')
+    def close(self):
+        '''Logs out and closes the pooled connections'''
+        if self._token is not None:
+            self.http.post(f"{self.base}/aaaLogout.json", json={"aaaUser": {"attributes": {"name": self.user}}},
+                           headers={"Cookie": f"APIC-Cookie={self._token}"})
+            self._token = None
+        self.http.close()
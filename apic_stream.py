@@ -0,0 +1,114 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+import codecs
+import json
+
+from run_metrics import METRICS
+
+# Default number of MOs per page of a streamed query
+DEFAULT_PAGE_SIZE = 10000
+# Size of the chunks read from the response body
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_imdata(chunks):
+    '''Incrementally parses an APIC response body ({"totalCount": "N", "imdata": [...]}) and yields the
+    imdata items one at a time, so only one MO and one chunk are held in memory instead of the whole body.
+    :param chunks = iterable of str or utf-8 bytes chunks of the body (ex: response.iter_content())'''
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    position = 0
+    exhausted = False
+
+    def read_more():
+        nonlocal buffer, position, exhausted
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            return False
+        if isinstance(chunk, bytes):
+            chunk = utf8.decode(chunk)
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    # Skip to the opening bracket of the imdata list
+    while True:
+        start = buffer.find('"imdata"')
+        if start != -1:
+            bracket = buffer.find('[', start)
+            if bracket != -1:
+                position = bracket + 1
+                break
+        if not read_more():
+            return
+
+    while True:
+        # Skip whitespace and item separators
+        while position < len(buffer) and buffer[position] in _WHITESPACE + ',':
+            position += 1
+        if position >= len(buffer):
+            if not read_more():
+                raise ValueError('Unexpected end of APIC response body inside imdata')
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The item is incomplete, read until the buffer has at least doubled before decoding again so very
+            # large items are not re-parsed once per chunk
+            target = 2 * (len(buffer) - position)
+            while len(buffer) - position < target and read_more():
+                pass
+            if exhausted and len(buffer) - position < target:
+                item, end = decoder.raw_decode(buffer, position)
+            else:
+                continue
+        position = end
+        yield item
+
+
+def iter_query(session, path, page_size=DEFAULT_PAGE_SIZE):
+    '''Runs a class or MO query page by page and lazily yields the MO dicts of every page.
+    Each page is streamed and parsed incrementally, so memory stays bounded by one page chunk and one MO
+    regardless of the size of the fabric.
+    :param session = ApicSession
+    :param path = query path relative to /api, with or without query options (ex: /class/fvRsPathAtt.json)
+    Raises RuntimeError when the APIC answers a page with an error status'''
+    separator = '&' if '?' in path else '?'
+    page = 0
+    while True:
+        response = session.get(f'{path}{separator}page={page}&page-size={page_size}', stream=True)
+        if response.status_code != 200:
+            # An error body (ex: 403 once the token expired) has no MOs, it must not read as an empty page
+            with response:
+                raise RuntimeError(f'APIC query {path} failed on page {page}: {response.status_code} {response.text}')
+        count = 0
+        try:
+            for item in iter_imdata(response.iter_content(chunk_size=CHUNK_SIZE)):
+                count += 1
+                yield item
+        finally:
+            METRICS.record_bytes_received(response.raw.tell())
+            response.close()
+        METRICS.record_mos(count)
+        if count < page_size:
+            return
+        page += 1
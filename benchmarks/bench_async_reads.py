@@ -0,0 +1,84 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Compares the per-node static path queries and the fabric state reads made back to back with the synchronous
+# session against the same requests overlapped by the asyncio client, on the mock APIC with injected latency.
+# Requires aiohttp. Run from the repository root with:
+#   python benchmarks/bench_async_reads.py [--leaves 40] [--latency 0.02] [--concurrency 8]
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from apic_async import AsyncApicSession, get_fabric_state, get_static_paths
+from apic_queries import (FABRIC_NODES_URL, LEAF_INTERFACE_PROFILES_URL, LEAF_SWITCH_PROFILES_URL, VPC_GROUPS_URL,
+                          static_paths_url)
+from apic_session import ApicSession
+from apic_stream import iter_query
+from mock_apic import MockApic
+from synthetic_fabric import build_fabric
+
+PAGE_SIZE = 500
+
+
+def sync_reads(mock, nodes):
+    session = ApicSession(mock.url, mock.user, mock.password)
+    bindings = sum(len(session.get(static_paths_url(node)).json()['imdata']) for node in nodes)
+    objects = sum(1 for url in (FABRIC_NODES_URL, LEAF_SWITCH_PROFILES_URL, LEAF_INTERFACE_PROFILES_URL,
+                                VPC_GROUPS_URL, '/class/fvRsPathAtt.json')
+                  for _ in iter_query(session, url, PAGE_SIZE))
+    session.close()
+    return bindings, objects
+
+
+async def async_reads(mock, nodes, concurrency):
+    async with AsyncApicSession(mock.url, mock.user, mock.password, concurrency=concurrency) as session:
+        bindings = sum(len(response['imdata']) for response in await get_static_paths(session, nodes))
+        state = await get_fabric_state(session, page_size=PAGE_SIZE)
+        return bindings, sum(len(mos) for mos in state.values())
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--leaves', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    with MockApic(latency=args.latency) as mock:
+        fabric = build_fabric(mock.store, leaves=args.leaves)
+        nodes = [node for pair in fabric.source_pairs for node in pair]
+
+        sync_time, sync_result = timed(sync_reads, mock, nodes)
+        requests = sum(phase['requests'] for phase in mock.counters.snapshot().values())
+        mock.counters.reset()
+        async_time, async_result = timed(lambda: asyncio.run(async_reads(mock, nodes, args.concurrency)))
+        async_requests = sum(phase['requests'] for phase in mock.counters.snapshot().values())
+        assert sync_result == async_result, (sync_result, async_result)
+
+    print(f'{len(nodes)} source nodes, {fabric.bindings} static bindings, {args.latency * 1000:.0f} ms APIC latency')
+    print(f'  synchronous: {sync_time:.2f}s, {requests} requests')
+    print(f'  asyncio:     {async_time:.2f}s, {async_requests} requests, concurrency {args.concurrency} '
+          f'({sync_time / async_time:.1f}x)')
@@ -0,0 +1,67 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Compares the throughput of the static path DN rewriter with the previous json.dumps/str.replace/json.loads rewrite.
+# Its correctness is covered by tests/test_static_bindings.py.
+# Run from the repository root with: python benchmarks/bench_dn_rewrite.py [binding_count]
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fabric_model import StaticBinding
+from static_bindings import node_mapping, rewrite_binding
+
+EPG = 'uni/tn-T1/ap-AP/epg-EPG1'
+
+
+def binding(tDn, descr=''):
+    return {'fvRsPathAtt': {'attributes': {'dn': f'{EPG}/rspathAtt-[{tDn}]', 'tDn': tDn, 'encap': 'vlan-10',
+                                           'mode': 'regular', 'descr': descr}}}
+
+
+def legacy_rewrite(bindings, source_nodes, dest_nodes):
+    overlay_source_nodes = source_nodes + [f'{source_nodes[0]}-{source_nodes[1]}']
+    overlay_dest_nodes = dest_nodes + [f'{dest_nodes[0]}-{dest_nodes[1]}']
+    new_path_dicts = []
+    for path in bindings:
+        new_path = json.dumps(path.copy())
+        for j in range(len(overlay_dest_nodes)):
+            new_path = new_path.replace(f'/paths-{overlay_source_nodes[j]}/', f'/paths-{overlay_dest_nodes[j]}/')
+            new_path = new_path.replace(f'/protpaths-{overlay_source_nodes[j]}/', f'/protpaths-{overlay_dest_nodes[j]}/')
+        new_path_dicts.append(json.loads(new_path))
+    return new_path_dicts
+
+
+def structured_rewrite(bindings, source_nodes, dest_nodes):
+    # Bindings are indexed as StaticBindings when read, the conversion is not part of the rewrite
+    mapping = node_mapping(source_nodes, dest_nodes)
+    return [new_path for new_path in (rewrite_binding(path, mapping) for path in bindings) if new_path]
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tDns = ['topology/pod-1/paths-101/pathep-[eth1/{}]', 'topology/pod-1/paths-102/pathep-[eth1/{}]',
+            'topology/pod-1/protpaths-101-102/pathep-[VPC{}]']
+    bindings = [binding(tDns[i % 3].format(i % 48 + 1)) for i in range(count)]
+    models = [StaticBinding.from_mo(binding) for binding in bindings]
+    for name, func, inputs in (('json.dumps/str.replace/json.loads', legacy_rewrite, bindings),
+                               ('structured DN rewrite', structured_rewrite, models)):
+        start = time.perf_counter()
+        result = func(inputs, ['101', '102'], ['501', '502'])
+        elapsed = time.perf_counter() - start
+        print(f'{name:<34} {len(result)} bindings in {elapsed:.2f}s ({len(result) / elapsed:,.0f} bindings/s)')
@@ -0,0 +1,127 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Times full MigrationTargets.txt runs of fabric_migration.py end to end against the local mock APIC
+# (benchmarks/mock_apic.py) serving a synthetic fabric, and records the API calls of every run per phase.
+# Each scenario gets a freshly generated fabric, so runs are independent and reproducible.
+# Run from the repository root with:
+#   python benchmarks/bench_end_to_end.py --leaves 20 --latency 0.01 [--scenarios sequential,bulk] [--json report.json]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_apic import PHASES, MockApic
+from synthetic_fabric import build_fabric
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Scenario name -> list of fabric_migration.py invocations (plan then apply is two runs against the same fabric)
+SCENARIOS = {
+    'sequential': [[]],
+    'bulk': [['--bulk-static-paths']],
+    'workers4': [['--workers', '4', '--bulk-static-paths']],
+    'plan-apply': [['--plan', 'plan.json'], ['--apply', 'plan.json']],
+    # The second plan reads the fabric state from the cache filled by the first
+    'plan-cached': [['--plan', 'plan.json', '--cache'], ['--plan', 'plan.json', '--cache'], ['--apply', 'plan.json']],
+    # Nets out to no created object, the commit phase counts the apply and the rollback requests
+    'apply-rollback': [['--plan', 'plan.json'], ['--apply', 'plan.json'], ['--rollback']],
+    # Coalesced port selectors and shared interface profiles, compare created and commit bytes with plan-apply
+    'plan-apply-optimized': [['--plan', 'plan.json', '--coalesce-selectors', '--share-int-profiles'],
+                             ['--apply', 'plan.json']],
+}
+
+CONFIG = '''user = {user!r}
+password = {password!r}
+apic = {apic!r}
+base = apic + '/api'
+spec_file = 'MigrationTargets.txt'
+vpc_group_prefix = 'VPC_ExGrp_'
+switch_profile_prefix = 'SwPro_'
+interface_profile_prefix = 'IntProf_'
+switch_selector_prefix = 'SwSel_'
+block_prefix = 'Block_'
+apic_requests_per_second = {rate!r}
+'''
+
+
+def run_scenario(name, args):
+    mock = MockApic(latency=args.latency, write_latency=args.write_latency, export_seconds=args.export_seconds)
+    fabric = build_fabric(mock.store, leaves=args.leaves, selectors_per_leaf=args.selectors,
+                          bindings_per_leaf=args.bindings, port_groups=args.port_groups)
+    with mock, tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'config.py'), 'w') as fp:
+            fp.write(CONFIG.format(user=mock.user, password=mock.password, apic=mock.url, rate=args.rate))
+        fabric.write_targets(os.path.join(workdir, 'MigrationTargets.txt'))
+        objects_before = len(mock.store)
+
+        # config.py is picked up from the working directory through PYTHONPATH, the repository stays untouched
+        env = dict(os.environ, PYTHONPATH=workdir)
+        start = time.perf_counter()
+        for extra_args in SCENARIOS[name]:
+            process = subprocess.run([sys.executable, os.path.join(REPO_ROOT, 'fabric_migration.py')] + extra_args,
+                                     cwd=workdir, env=env, capture_output=True, text=True)
+            if process.returncode != 0:
+                return {'scenario': name, 'error': process.stderr.strip().splitlines()[-1:]}
+        seconds = time.perf_counter() - start
+    return {'scenario': name, 'seconds': round(seconds, 3), 'pairs': len(fabric.source_pairs),
+            'bindings': fabric.bindings,
+            # Deletions leave aaaModLR audit records behind, they are not configuration
+            'objects_created': len(mock.store) - len(mock.store.of_class('aaaModLR')) - objects_before,
+            'phases': mock.counters.snapshot()}
+
+
+def print_results(results):
+    print(f"{'scenario':<20} {'seconds':>8} {'created':>8} {'pushed KiB':>10}  " +
+          ' '.join(f'{phase:>12}' for phase in PHASES))
+    for result in results:
+        if 'error' in result:
+            print(f"{result['scenario']:<20} FAILED: {' '.join(result['error'])}")
+            continue
+        calls = ' '.join(f"{result['phases'][phase]['requests']:>12}" for phase in PHASES)
+        pushed = result['phases']['commit']['bytes_in'] / 1024
+        print(f"{result['scenario']:<20} {result['seconds']:>8.2f} {result['objects_created']:>8} {pushed:>10.1f}  {calls}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End to end migration benchmark against the mock APIC')
+    parser.add_argument('--leaves', type=int, default=20, help='Number of source leaves (migrated as VPC pairs)')
+    parser.add_argument('--selectors', type=int, default=24, help='Port selectors per leaf interface profile')
+    parser.add_argument('--bindings', type=int, default=50, help='Static bindings per leaf')
+    parser.add_argument('--port-groups', type=int, default=None,
+                        help='Access policy groups shared by consecutive ports (default: one per port)')
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds added to every APIC request')
+    parser.add_argument('--write-latency', type=float, default=0.0, help='Seconds added per MO committed')
+    parser.add_argument('--export-seconds', type=float, default=0.0, help='Duration of the config snapshot export')
+    parser.add_argument('--rate', type=float, default=None, help='apic_requests_per_second of the runs')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma separated scenarios to run')
+    parser.add_argument('--json', metavar='FILE', help='Also write the results to FILE')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenarios.split(','):
+        print(f'Running {name} on {args.leaves} leaves...')
+        results.append(run_scenario(name, args))
+    print()
+    print('API calls per phase:')
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=2)
@@ -0,0 +1,82 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Compares a cold --cache run (full fetch) with warm runs where a few objects changed in between, on the mock APIC
+# with injected latency: time, requests, MOs and bytes the APIC had to serve. Every run is checked against a live read of the same queries.
+# Run from the repository root with:
+#   python benchmarks/bench_fabric_cache.py [--leaves 40] [--latency 0.02] [--changes 5]
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from apic_session import ApicSession
+from apic_stream import iter_query
+from fabric_cache import CACHED_QUERIES, FabricCache
+from mock_apic import MockApic
+from synthetic_fabric import build_fabric
+
+
+def cached_read(session, path, fabric):
+    cache = FabricCache(path, fabric)
+    start = time.perf_counter()
+    state = {name: cache.mos(session, name) for name in CACHED_QUERIES}
+    elapsed = time.perf_counter() - start
+    cache.close()
+    return elapsed, state
+
+
+def change_fabric(store, changes):
+    '''Modifies a switch profile, deletes a static binding and a port block, changes times'''
+    for i in range(changes):
+        store.put('infraNodeP', {'dn': store.of_class('infraNodeP')[i], 'descr': f'change {i}'})
+        store.delete(store.of_class('fvRsPathAtt')[i])
+        store.delete(store.of_class('infraPortBlk')[i])
+
+
+def canonical(mos):
+    return sorted(json.dumps(mo, sort_keys=True) for mo in mos)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--leaves', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--changes', type=int, default=5)
+    args = parser.parse_args()
+
+    with MockApic(latency=args.latency) as mock, tempfile.TemporaryDirectory() as tmp:
+        fabric = build_fabric(mock.store, leaves=args.leaves)
+        session = ApicSession(mock.url, mock.user, mock.password)
+        path = os.path.join(tmp, 'fabric_cache.sqlite')
+        print(f'{args.leaves} leaves, {fabric.bindings} static bindings, {args.latency * 1000:.0f} ms APIC latency')
+        for label in ('cold', 'warm, unchanged', f'warm, {args.changes * 3} changes'):
+            if label.endswith('changes'):
+                change_fabric(mock.store, args.changes)
+            mock.counters.reset()
+            elapsed, state = cached_read(session, path, mock.url)
+            counters = mock.counters.snapshot().values()
+            requests = sum(phase['requests'] for phase in counters)
+            mos_read = sum(phase['mos_read'] for phase in counters)
+            bytes_out = sum(phase['bytes_out'] for phase in counters)
+            for name, query in CACHED_QUERIES.items():
+                assert canonical(state[name]) == canonical(iter_query(session, query.url)), name
+            print(f'  {label:<20} {elapsed:.2f}s, {requests} requests, {mos_read} MOs, {bytes_out / 1024:.0f} KiB read')
+        session.close()
@@ -0,0 +1,100 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Micro-benchmark of the MO tree walker against the previous find_values() json round-trip.
+# Run from the repository root with: python benchmarks/bench_mo_walker.py [profile_count] [dest_node_count]
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mo_walker import node_profile_record
+
+
+def find_values(id, json_repr):
+    '''The helper previously used by fabric_migration.py, kept here as the baseline'''
+    results = []
+
+    def _decode_dict(a_dict):
+        try:
+            results.append(a_dict[id])
+        except KeyError:
+            pass
+        return a_dict
+
+    json.loads(json_repr, object_hook=_decode_dict)
+    return results
+
+
+def synthetic_switch_profiles(count):
+    imdata = []
+    for i in range(count):
+        node = str(101 + i)
+        imdata.append({'infraNodeP': {
+            'attributes': {'dn': f'uni/infra/nprof-Leaf{node}', 'name': f'Leaf{node}', 'descr': '', 'status': '',
+                           'modTs': '2021-09-01T10:00:00.000+00:00', 'uid': '15374', 'lcOwn': 'local'},
+            'children': [
+                {'infraRsAccPortP': {'attributes': {'tDn': f'uni/infra/accportprof-Leaf{node}', 'status': ''}}},
+                {'infraLeafS': {'attributes': {'name': f'Leaf{node}', 'type': 'range'}, 'children': [
+                    {'infraRsAccNodePGrp': {'attributes': {'tDn': 'uni/infra/funcprof/accnodepgrp-SwPg'}}},
+                    {'infraNodeBlk': {'attributes': {'name': 'blk', 'from_': node, 'to_': node}}},
+                ]}},
+            ]}})
+    return {'imdata': imdata}
+
+
+def legacy_path(switch_profiles, dest_nodes):
+    # Same work as the old __main__ loop: one full scan with json round-trips per destination node
+    for node in dest_nodes:
+        source_profiles = []
+        for profile in switch_profiles['imdata']:
+            block_from = find_values('from_', json.dumps(profile))[0]
+            block_to = find_values('to_', json.dumps(profile))[0]
+            if block_from in node and block_to in node:
+                source_profiles.append(profile)
+        [obj['attributes']['tDn'] for obj in find_values('infraRsAccNodePGrp', json.dumps(source_profiles))]
+
+
+def walker_path(switch_profiles, dest_nodes):
+    # One walk to build typed records, then dict lookups per destination node
+    by_node = {}
+    for profile in switch_profiles['imdata']:
+        record = node_profile_record(profile)
+        block_from, block_to = record.node_blocks[0]
+        if block_from == block_to:
+            by_node.setdefault(block_from, []).append(record)
+    for node in dest_nodes:
+        [tDn for record in by_node.get(node, []) for tDn in record.policy_group_tDns]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    profile_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    dest_node_count = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    payload = synthetic_switch_profiles(profile_count)
+    dest_nodes = [str(101 + i) for i in range(dest_node_count)]
+
+    legacy = timed(legacy_path, payload, dest_nodes)
+    walker = timed(walker_path, payload, dest_nodes)
+    print(f'{profile_count} switch profiles, {dest_node_count} destination nodes')
+    print(f'find_values json round-trip: {legacy:.3f}s')
+    print(f'MO tree walker:              {walker:.3f}s ({legacy / walker:.1f}x faster)')
@@ -0,0 +1,100 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Measures the memory held (tracemalloc) by static bindings and interface profiles kept as the parsed imdata dicts,
+# against the slotted fabric_model objects built from the same streamed responses.
+# Run from the repository root with: python benchmarks/bench_model_memory.py [bindings] [interface_profiles]
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from apic_stream import iter_imdata
+from bench_stream_memory import synthetic_body_chunks
+from fabric_model import StaticBinding
+from mo_walker import interface_profile_record
+
+SELECTORS_PER_PROFILE = 48
+_READ_ONLY = {'status': '', 'modTs': '2021-09-01T10:00:00.000+00:00', 'lcOwn': 'local', 'uid': '15374',
+              'childAction': '', 'userdom': ':all:'}
+
+
+def synthetic_profiles(count):
+    '''Yields count infraAccPortP dicts of SELECTORS_PER_PROFILE selectors, each parsed from its own JSON document
+    like the objects of a streamed response'''
+    for i in range(count):
+        dn = f'uni/infra/accportprof-Leaf{101 + i}_IntProf'
+        selectors = []
+        for port in range(1, SELECTORS_PER_PROFILE + 1):
+            selector_dn = f'{dn}/hports-Port{port}-typ-range'
+            selectors.append({'infraHPortS': {
+                'attributes': dict(_READ_ONLY, dn=selector_dn, name=f'Port{port}', type='range', annotation='',
+                                   descr='', nameAlias='', ownerKey='', ownerTag=''),
+                'children': [
+                    {'infraRsAccBaseGrp': {'attributes': dict(
+                        _READ_ONLY, dn=f'{selector_dn}/rsaccBaseGrp', annotation='', fexId='101',
+                        tDn=f'uni/infra/funcprof/accportgrp-Access_Group{port % 8}')}},
+                    {'infraPortBlk': {'attributes': dict(
+                        _READ_ONLY, dn=f'{selector_dn}/portblk-block1', name='block1', annotation='', descr='',
+                        nameAlias='', fromCard='1', toCard='1', fromPort=str(port), toPort=str(port))}}]}})
+        yield json.loads(json.dumps({'infraAccPortP': {'attributes': dict(_READ_ONLY, dn=dn, name=f'Leaf{101 + i}_IntProf'),
+                                                       'children': selectors}}))
+
+
+def measure(func, *args):
+    '''(result, seconds, MiB still allocated while the result is alive)'''
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, held / 2 ** 20
+
+
+def binding_dicts(count):
+    return list(iter_imdata(synthetic_body_chunks(count)))
+
+
+def binding_models(count):
+    return [StaticBinding.from_mo(binding) for binding in iter_imdata(synthetic_body_chunks(count))]
+
+
+def profile_dicts(count):
+    return list(synthetic_profiles(count))
+
+
+def profile_models(count):
+    return [interface_profile_record(profile) for profile in synthetic_profiles(count)]
+
+
+if __name__ == '__main__':
+    binding_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    profile_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    for label, count, funcs in (('static bindings', binding_count, (binding_dicts, binding_models)),
+                                (f'interface profiles ({SELECTORS_PER_PROFILE} selectors)', profile_count,
+                                 (profile_dicts, profile_models))):
+        print(f'{count} {label}:')
+        for name, func in zip(('imdata dicts', 'fabric_model'), funcs):
+            result, elapsed, held = measure(func, count)
+            assert len(result) == count
+            print(f'  {name:<13} {held:8.1f} MiB held, {held * 2 ** 20 / count:8.0f} bytes per object, '
+                  f'built in {elapsed:.1f}s')
+            del result
@@ -0,0 +1,101 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Times multi_fabric.py on several mock APICs of different sizes, with the fabrics run one after another
+# (--parallel 1) and all at once. Every mock APIC is its own process, like independent APICs, and every fabric runs
+# the same fabric_migration.py arguments.
+# Run from the repository root with:
+#   python benchmarks/bench_multi_fabric.py [--fabrics 4] [--leaves 20] [--latency 0.01] [--args "--plan plan.ndjson"]
+
+import argparse
+import json
+import os
+import re
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_apic import MoStore
+from synthetic_fabric import build_fabric
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = {'vpc_group_prefix': 'VPC_ExGrp_', 'switch_profile_prefix': 'SwPro_', 'interface_profile_prefix': 'IntProf_',
+          'switch_selector_prefix': 'SwSel_', 'block_prefix': 'Block_'}
+
+
+def start_mock(leaves, latency):
+    '''Starts benchmarks/mock_apic.py in its own process. Returns (process, url, its fabric)'''
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, '-u', os.path.join(REPO_ROOT, 'benchmarks', 'mock_apic.py'),
+                                '--port', str(port), '--leaves', str(leaves), '--latency', str(latency)],
+                               stdout=subprocess.PIPE, text=True)
+    url = re.search(r'listening on (\S+)', process.stdout.readline()).group(1)
+    # The synthetic fabric is deterministic, the same one built locally gives its target lines
+    return process, url, build_fabric(MoStore(), leaves=leaves)
+
+
+def run(fabrics_file, workdir, parallel, migration_args):
+    report = os.path.join(workdir, f'report_{parallel}.json')
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, os.path.join(REPO_ROOT, 'multi_fabric.py'), fabrics_file, '--quiet',
+                              '--parallel', str(parallel), '--workdir', os.path.join(workdir, f'runs_{parallel}'),
+                              '--report', report, '--'] + migration_args, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        print(process.stdout[-3000:], process.stderr[-3000:])
+        raise SystemExit(f'multi_fabric.py --parallel {parallel} failed')
+    with open(report, 'r') as fp:
+        return seconds, json.load(fp)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sequential vs. parallel multi_fabric.py runs against mock APICs')
+    parser.add_argument('--fabrics', type=int, default=4)
+    parser.add_argument('--leaves', type=int, default=20, help='Source leaves of the largest fabric, the others have less')
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds added to every APIC request')
+    parser.add_argument('--args', default='--plan plan.ndjson', help='fabric_migration.py arguments of every fabric')
+    args = parser.parse_args()
+
+    processes = []
+    with tempfile.TemporaryDirectory() as workdir:
+        fabrics = []
+        for i in range(args.fabrics):
+            # Fabrics of different sizes, the window is bounded by the largest
+            process, url, fabric = start_mock(max(2, args.leaves * (args.fabrics - i) // args.fabrics), args.latency)
+            processes.append(process)
+            fabric.write_targets(os.path.join(workdir, f'fabric{i + 1}.txt'))
+            fabrics.append({'name': f'fabric{i + 1}', 'apic': url, 'user': 'admin', 'password': 'password',
+                            'spec_file': f'fabric{i + 1}.txt', 'config': CONFIG})
+        fabrics_file = os.path.join(workdir, 'fabrics.json')
+        with open(fabrics_file, 'w') as fp:
+            json.dump({'fabrics': fabrics}, fp)
+
+        migration_args = shlex.split(args.args)
+        print(f"{args.fabrics} fabrics of up to {args.leaves} leaves, {args.latency * 1000:.0f} ms APIC latency, "
+              f"fabric_migration.py {args.args}")
+        for parallel in (1, args.fabrics):
+            seconds, report = run(fabrics_file, workdir, parallel, migration_args)
+            per_fabric = ', '.join(f"{fabric['name']} {fabric['seconds']:.1f}s" for fabric in report['fabrics'])
+            print(f'  --parallel {parallel}: window {seconds:.1f}s ({per_fabric})')
+        for process in processes:
+            process.terminate()
+            process.wait()
@@ -0,0 +1,93 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Compares the total static binding query time of the per-node wildcard queries against the single bulk query
+# for 1, 10 and 100 source pairs, on the mock APIC with injected latency, or with --live on the APIC configured in
+# config.py (use a lab APIC).
+# Run from the repository root with:
+#   python benchmarks/bench_static_bindings.py [pair_count ...] [--leaves 200] [--latency 0.01] [--live]
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from apic_queries import FABRIC_NODES_URL, static_paths_url
+from apic_session import ApicSession
+from mock_apic import MockApic
+from static_bindings import StaticBindingIndex, iter_static_bindings
+from synthetic_fabric import build_fabric
+
+
+def leaf_pairs(session, count):
+    leaves = sorted((obj['fabricNode']['attributes']['id'] for obj in session.get(FABRIC_NODES_URL).json()['imdata']
+                     if obj['fabricNode']['attributes'].get('role') == 'leaf'), key=int)
+    pairs = [leaves[i:i + 2] for i in range(0, len(leaves) - 1, 2)]
+    # Reuse the fabric's leaves when it has fewer pairs than requested, like repeated target lines would
+    return [pairs[i % len(pairs)] for i in range(count)] if pairs else []
+
+
+def per_node_queries(session, pairs):
+    # Same queries as fabric_migration.get_static_paths()
+    return sum(len(session.get(static_paths_url(node)).json()['imdata']) for pair in pairs for node in pair)
+
+
+def bulk_query(session, pairs):
+    index = StaticBindingIndex.from_bindings(iter_static_bindings(session))
+    return sum(len(index.bindings_for_sources(pair)) for pair in pairs)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+@contextlib.contextmanager
+def apic_session(args):
+    '''ApicSession on the APIC of config.py with --live, otherwise on a mock APIC serving a synthetic fabric'''
+    if args.live:
+        from config import apic, user, password
+        session = ApicSession(apic, user, password)
+        yield session
+        session.close()
+        return
+    with MockApic(latency=args.latency) as mock:
+        fabric = build_fabric(mock.store, leaves=args.leaves)
+        print(f'Mock APIC: {args.leaves} source leaves, {fabric.bindings} static bindings, '
+              f'{args.latency * 1000:.0f} ms latency')
+        session = ApicSession(mock.url, mock.user, mock.password)
+        yield session
+        session.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-node vs. bulk static binding queries')
+    parser.add_argument('pair_counts', type=int, nargs='*', default=[1, 10, 100])
+    parser.add_argument('--leaves', type=int, default=200, help='Source leaves of the mock APIC fabric')
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds added to every mock APIC request')
+    parser.add_argument('--live', action='store_true', help='Query the APIC configured in config.py instead')
+    args = parser.parse_args()
+
+    with apic_session(args) as session:
+        for count in args.pair_counts:
+            pairs = leaf_pairs(session, count)
+            per_node_time, per_node_bindings = timed(per_node_queries, session, pairs)
+            bulk_time, bulk_bindings = timed(bulk_query, session, pairs)
+            print(f'{count:>4} pairs: per-node wcard queries {per_node_time:7.2f}s ({per_node_bindings} bindings), '
+                  f'bulk paginated query {bulk_time:7.2f}s ({bulk_bindings} bindings)')
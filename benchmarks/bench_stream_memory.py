@@ -0,0 +1,74 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Measures peak memory (tracemalloc) of the streaming imdata parser on a synthetic fvRsPathAtt response body,
+# against response.json() style parsing of the whole body.
+# Run from the repository root with: python benchmarks/bench_stream_memory.py [stream_objects] [full_body_objects]
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apic_stream import CHUNK_SIZE, iter_imdata
+
+
+def synthetic_body_chunks(count):
+    '''Yields a {"totalCount": .., "imdata": [..]} body of count fvRsPathAtt objects in CHUNK_SIZE pieces
+    without ever holding the whole body'''
+    pending = f'{{"totalCount":"{count}","imdata":['
+    for i in range(count):
+        node = 101 + i % 200
+        binding = {'fvRsPathAtt': {'attributes': {
+            'dn': f'uni/tn-T{i % 50}/ap-AP/epg-EPG{i % 1000}/rspathAtt-[topology/pod-1/paths-{node}/pathep-[eth1/{i % 48 + 1}]]',
+            'tDn': f'topology/pod-1/paths-{node}/pathep-[eth1/{i % 48 + 1}]', 'encap': f'vlan-{i % 4000 + 1}',
+            'instrImedcy': 'lazy', 'mode': 'regular', 'primaryEncap': 'unknown', 'descr': '', 'annotation': '',
+            'status': '', 'modTs': '2021-09-01T10:00:00.000+00:00', 'lcOwn': 'local', 'uid': '15374'}}}
+        pending += ('' if i == 0 else ',') + json.dumps(binding)
+        if len(pending) >= CHUNK_SIZE:
+            yield pending.encode()
+            pending = ''
+    yield (pending + ']}').encode()
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def streamed(count):
+    return sum(1 for _ in iter_imdata(synthetic_body_chunks(count)))
+
+
+def full_body(count):
+    return len(json.loads(b''.join(synthetic_body_chunks(count)))['imdata'])
+
+
+if __name__ == '__main__':
+    stream_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    full_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    parsed, elapsed, peak = measure(streamed, stream_count)
+    assert parsed == stream_count
+    print(f'streamed parser:  {parsed:>8} objects in {elapsed:6.1f}s, peak {peak / 2 ** 20:8.1f} MiB')
+    parsed, elapsed, peak = measure(full_body, full_count)
+    print(f'whole body parse: {parsed:>8} objects in {elapsed:6.1f}s, peak {peak / 2 ** 20:8.1f} MiB')
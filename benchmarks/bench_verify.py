@@ -0,0 +1,127 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Times --verify on a synthetic fabric whose pairs were migrated in the mock store (profiles copied under the
+# configured prefixes, static bindings rewritten to the destination nodes), then with a few differences injected.
+# Run from the repository root with:
+#   python benchmarks/bench_verify.py [--leaves 1000] [--bindings 100]      (1000 leaves x 100 = 100k bindings)
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from apic_queries import FABRIC_NODES_URL, LEAF_INTERFACE_PROFILES_URL, LEAF_SWITCH_PROFILES_URL, VPC_GROUPS_URL
+from apic_session import ApicSession
+from apic_stream import iter_query
+from fabric_inventory import FabricInventory
+from migration_runner import MigrationTarget
+from migration_verify import verify_targets
+from mock_apic import MockApic
+from static_bindings import StaticBindingIndex, iter_static_bindings, node_mapping, rewrite_binding
+from synthetic_fabric import build_fabric
+
+SWITCH_PROFILE_PREFIX = 'SwPro_'
+INTERFACE_PROFILE_PREFIX = 'IntProf_'
+VPC_GROUP_PREFIX = 'VPC_ExGrp_'
+
+
+def migrate_in_store(store, fabric):
+    '''Writes what the migration of every pair creates directly into the store'''
+    index = StaticBindingIndex.from_bindings(store.to_dict(dn) for dn in store.of_class('fvRsPathAtt'))
+    for vpc_id, (source_pair, dest_pair) in enumerate(zip(fabric.source_pairs, fabric.dest_pairs), 500):
+        for source, dest in zip(source_pair, dest_pair):
+            int_profile = f'{INTERFACE_PROFILE_PREFIX}{dest}'
+            store.put_tree({'infraNodeP': {'attributes': {'dn': f'uni/infra/nprof-{SWITCH_PROFILE_PREFIX}{dest}',
+                                                          'name': f'{SWITCH_PROFILE_PREFIX}{dest}'},
+                                           'children': [
+                                               {'infraRsAccPortP': {'attributes': {
+                                                   'tDn': f'uni/infra/accportprof-{int_profile}'}}},
+                                               {'infraLeafS': {'attributes': {'name': f'{dest}', 'type': 'range'},
+                                                               'children': [
+                                                                   {'infraRsAccNodePGrp': {'attributes': {
+                                                                       'tDn': 'uni/infra/funcprof/accnodepgrp-LeafPG'}}},
+                                                                   {'infraNodeBlk': {'attributes': {
+                                                                       'name': f'{dest}', 'from_': str(dest),
+                                                                       'to_': str(dest)}}}]}}]}})
+            source_profile = store.to_dict(f'uni/infra/accportprof-Leaf{source}_IntProf', subtree=True)
+            body = source_profile['infraAccPortP']
+            store.put_tree({'infraAccPortP': {'attributes': {'dn': f'uni/infra/accportprof-{int_profile}',
+                                                             'name': int_profile},
+                                              'children': [_without_dns(child) for child in body.get('children', [])]}})
+        vpc_name = f"{VPC_GROUP_PREFIX}{'-'.join(str(node) for node in dest_pair)}"
+        store.put_tree({'fabricExplicitGEp': {'attributes': {'dn': f'uni/fabric/protpol/expgep-{vpc_name}',
+                                                             'name': vpc_name, 'id': str(vpc_id)},
+                                              'children': [{'fabricNodePEp': {'attributes': {'id': str(node)}}}
+                                                           for node in dest_pair]}})
+        sources = [str(node) for node in source_pair]
+        mapping = node_mapping(sources, [str(node) for node in dest_pair])
+        for binding in index.bindings_for_sources(sources):
+            store.put('fvRsPathAtt', rewrite_binding(binding, mapping).payload()['fvRsPathAtt']['attributes'])
+
+
+def _without_dns(mo):
+    (class_name, body), = mo.items()
+    attributes = {key: value for key, value in body['attributes'].items() if key not in ('dn', 'modTs')}
+    return {class_name: {'attributes': attributes, 'children': [_without_dns(child) for child in body.get('children', [])]}}
+
+
+def verify(session, targets):
+    start = time.perf_counter()
+    inventory = FabricInventory.from_mos(iter_query(session, FABRIC_NODES_URL),
+                                         iter_query(session, LEAF_SWITCH_PROFILES_URL),
+                                         iter_query(session, LEAF_INTERFACE_PROFILES_URL),
+                                         iter_query(session, VPC_GROUPS_URL))
+    static_index = StaticBindingIndex.from_bindings(iter_static_bindings(session))
+    read = time.perf_counter() - start
+    start = time.perf_counter()
+    reports = verify_targets(inventory, static_index, targets, SWITCH_PROFILE_PREFIX, INTERFACE_PROFILE_PREFIX,
+                             VPC_GROUP_PREFIX)
+    return read, time.perf_counter() - start, reports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    # Above 1000 leaves, destination ids of the synthetic fabric overlap its source ids
+    parser.add_argument('--leaves', type=int, default=1000)
+    parser.add_argument('--bindings', type=int, default=100, help='Static bindings per leaf')
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    with MockApic(latency=args.latency) as mock:
+        fabric = build_fabric(mock.store, leaves=args.leaves, bindings_per_leaf=args.bindings)
+        migrate_in_store(mock.store, fabric)
+        targets = [MigrationTarget(line, [str(node) for node in source], [str(node) for node in dest], True)
+                   for line, (source, dest) in enumerate(zip(fabric.source_pairs, fabric.dest_pairs), 1)]
+        session = ApicSession(mock.url, mock.user, mock.password)
+        total = len(mock.store.of_class('fvRsPathAtt'))
+        print(f'{len(targets)} pairs, {total} static bindings after migration')
+
+        read, compare, reports = verify(session, targets)
+        assert all(report['equivalent'] for report in reports)
+        print(f'  migrated:  read {read:.2f}s, compare {compare:.2f}s, {len(reports)} of {len(reports)} lines equivalent')
+
+        # One changed encap and one deleted selector on the first destination pair
+        first_dest = fabric.dest_pairs[0]
+        changed = next(dn for dn in mock.store.of_class('fvRsPathAtt') if f'protpaths-{first_dest[0]}-' in dn)
+        mock.store.put('fvRsPathAtt', {'dn': changed, 'encap': 'vlan-3999'})
+        mock.store.delete(f'uni/infra/accportprof-{INTERFACE_PROFILE_PREFIX}{first_dest[1]}/hports-Port1-typ-range')
+        read, compare, reports = verify(session, targets)
+        different = [report['line'] for report in reports if not report['equivalent']]
+        assert different == [1], different
+        print(f'  tampered:  read {read:.2f}s, compare {compare:.2f}s, lines {different} different')
+        session.close()
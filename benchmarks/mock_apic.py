@@ -0,0 +1,544 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Local stand-in for the APIC REST API, implementing only the endpoints this project uses:
+#   aaaLogin/aaaRefresh/aaaLogout, class queries (node/class/fabricNode, class/fvRsPathAtt with wcard filters),
+#   MO queries (node/mo/uni/infra subtree queries, uni/fabric/protpol), JSON config POSTs (mo.json, mo/<dn>.json)
+#   and the XML lookups and config POSTs made by Cobra. A triggered configExportP creates a configJob that turns
+#   from running to success after export_seconds.
+# Objects live in memory, every request can be delayed to simulate APIC latency and API calls are counted per phase.
+# Run standalone with: python benchmarks/mock_apic.py --leaves 40 --latency 0.02
+# then point apic in config.py at the printed address (http://127.0.0.1:<port>).
+
+import argparse
+import itertools
+import json
+import re
+import secrets
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# Relative names of the classes this project reads and writes, used to place children posted without a dn
+RN_FORMATS = {
+    'infraInfra': 'infra',
+    'fabricInst': 'fabric',
+    'fabricProtPol': 'protpol',
+    'fvTenant': 'tn-{name}',
+    'fvAp': 'ap-{name}',
+    'fvAEPg': 'epg-{name}',
+    'fvRsPathAtt': 'rspathAtt-[{tDn}]',
+    'fabricNode': 'node-{id}',
+    'infraNodeP': 'nprof-{name}',
+    'infraLeafS': 'leaves-{name}-typ-{type}',
+    'infraNodeBlk': 'nodeblk-{name}',
+    'infraRsAccNodePGrp': 'rsaccNodePGrp',
+    'infraRsAccPortP': 'rsaccPortP-[{tDn}]',
+    'infraRsAccCardP': 'rsaccCardP-[{tDn}]',
+    'infraAccPortP': 'accportprof-{name}',
+    'infraHPortS': 'hports-{name}-typ-{type}',
+    'infraPortBlk': 'portblk-{name}',
+    'infraSubPortBlk': 'subportblk-{name}',
+    'infraRsAccBaseGrp': 'rsaccBaseGrp',
+    'fabricExplicitGEp': 'expgep-{name}',
+    'fabricNodePEp': 'nodepep-{id}',
+    'fabricRsVpcInstPol': 'rsvpcInstPol',
+    'configExportP': 'configexp-{name}',
+}
+
+# Phases the API calls are counted under
+PHASES = ('auth', 'snapshot', 'inventory', 'static_paths', 'lookup', 'commit')
+
+_FILTER_TOKEN = re.compile(r'\s*(?:(?P<name>[A-Za-z_][\w.]*)\s*\(|(?P<close>\))|(?P<comma>,)|"(?P<string>[^"]*)"'
+                           r'|(?P<prop>[A-Za-z_][\w.]*))')
+
+
+class ApicError(Exception):
+    def __init__(self, status, text):
+        super().__init__(text)
+        self.status = status
+
+
+def parse_filter(expression):
+    '''Parses an APIC query-target-filter (ex: and(ne(fabricNode.role,"controller"),wcard(fabricNode.dn,"x")))
+    into a predicate over MO attributes'''
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _FILTER_TOKEN.match(expression, position)
+        if not match:
+            raise ApicError(400, f'Invalid filter at position {position}: {expression}')
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    tokens = iter(tokens)
+
+    def parse(token):
+        kind, value = token
+        if kind == 'string':
+            return lambda attributes: value
+        if kind == 'prop':
+            prop = value.split('.', 1)[-1]
+            return lambda attributes: attributes.get(prop, '')
+        if kind != 'name':
+            raise ApicError(400, f'Invalid filter: {expression}')
+        args = []
+        for token in tokens:
+            if token[0] == 'close':
+                break
+            if token[0] != 'comma':
+                args.append(parse(token))
+        return _operator(value, args, expression)
+
+    return parse(next(tokens))
+
+
+def _operator(name, args, expression):
+    if name == 'and':
+        return lambda attributes: all(arg(attributes) for arg in args)
+    if name == 'or':
+        return lambda attributes: any(arg(attributes) for arg in args)
+    if name == 'not':
+        return lambda attributes: not args[0](attributes)
+    if name == 'wcard':
+        return lambda attributes: args[1](attributes) in args[0](attributes)
+    comparisons = {'eq': lambda a, b: a == b, 'ne': lambda a, b: a != b, 'lt': lambda a, b: a < b,
+                   'le': lambda a, b: a <= b, 'gt': lambda a, b: a > b, 'ge': lambda a, b: a >= b}
+    if name not in comparisons:
+        raise ApicError(400, f'Unsupported filter operator {name}: {expression}')
+    compare = comparisons[name]
+
+    def _compare(attributes):
+        left, right = args[0](attributes), args[1](attributes)
+        if left.isdigit() and right.isdigit():
+            left, right = int(left), int(right)
+        return compare(left, right)
+    return _compare
+
+
+def rn_of(class_name, attributes):
+    if 'dn' in attributes:
+        return _last_rn(attributes['dn'])
+    rn_format = RN_FORMATS.get(class_name)
+    if rn_format is None:
+        raise ApicError(400, f'Cannot name {class_name} without a dn')
+    return rn_format.format(**attributes)
+
+
+def _last_rn(dn):
+    '''Last rn of a dn, ignoring the slashes inside [...] (ex: rspathAtt-[topology/pod-1/paths-101/pathep-[eth1/1]])'''
+    depth = 0
+    for i in range(len(dn) - 1, -1, -1):
+        if dn[i] == ']':
+            depth += 1
+        elif dn[i] == '[':
+            depth -= 1
+        elif dn[i] == '/' and depth == 0:
+            return dn[i + 1:]
+    return dn
+
+
+class MoStore:
+    '''In-memory management information tree: dn -> (class, attributes) plus the ordered children of every dn.
+    Every write stamps modTs and every delete is recorded as an aaaModLR audit log record, like the APIC does'''
+
+    def __init__(self):
+        self.mos = {}
+        self.children = {}
+        self._lock = threading.RLock()
+        self._mod_counter = itertools.count()
+
+    def __len__(self):
+        return len(self.mos)
+
+    def _timestamp(self):
+        # Strictly increasing, so gt/ge modTs filters behave like on the APIC
+        return f'{time.strftime("%Y-%m-%dT%H:%M:%S")}.{next(self._mod_counter):06d}'
+
+    def put(self, class_name, attributes, parent_dn=None):
+        '''Creates or merges one MO. Returns its dn'''
+        attributes = {key: str(value) for key, value in attributes.items()}
+        status = attributes.pop('status', '')
+        dn = attributes.get('dn') or f'{parent_dn}/{rn_of(class_name, attributes)}'
+        parent_dn = parent_dn or dn[:-len(_last_rn(dn)) - 1]
+        with self._lock:
+            if 'deleted' in status:
+                self.delete(dn)
+                return dn
+            if dn in self.mos:
+                self.mos[dn][1].update(attributes)
+            else:
+                self.mos[dn] = (class_name, dict(attributes, dn=dn))
+                self.children.setdefault(parent_dn, []).append(dn)
+            self.mos[dn][1]['modTs'] = self._timestamp()
+        return dn
+
+    def put_tree(self, mo, parent_dn=None):
+        '''Creates or merges a {class: {'attributes': {}, 'children': []}} tree. Returns the number of MOs written'''
+        (class_name, body), = mo.items()
+        dn = self.put(class_name, body.get('attributes', {}), parent_dn)
+        if dn not in self.mos:
+            return 1
+        return 1 + sum(self.put_tree(child, dn) for child in body.get('children', []))
+
+    def delete(self, dn, audit=True):
+        with self._lock:
+            for child in list(self.children.get(dn, [])):
+                self.delete(child, audit=False)
+            self.children.pop(dn, None)
+            if self.mos.pop(dn, None) is not None:
+                parent_dn = dn[:-len(_last_rn(dn)) - 1]
+                self.children[parent_dn].remove(dn)
+                if audit:
+                    created = self._timestamp()
+                    self.put('aaaModLR', {'dn': f'subj-[{dn}]/mod-{created}', 'affected': dn, 'ind': 'deletion',
+                                          'created': created})
+
+    def of_class(self, class_name):
+        return [dn for dn, (mo_class, _) in self.mos.items() if mo_class == class_name]
+
+    def descendants(self, dn):
+        stack = list(reversed(self.children.get(dn, [])))
+        while stack:
+            child = stack.pop()
+            yield child
+            stack.extend(reversed(self.children.get(child, [])))
+
+    def to_dict(self, dn, subtree=False, subtree_classes=None):
+        class_name, attributes = self.mos[dn]
+        body = {'attributes': dict(attributes)}
+        if subtree:
+            children = [self.to_dict(child, True, subtree_classes) for child in self.children.get(dn, [])
+                        if not subtree_classes or self.mos[child][0] in subtree_classes]
+            if children:
+                body['children'] = children
+        return {class_name: body}
+
+
+def _option(options, name, default=None):
+    values = options.get(name)
+    # The interface profile query passes query-target twice, the APIC honours the last one
+    return values[-1] if values else default
+
+
+def run_query(store, kind, target, options):
+    '''Answers a class query (kind='class', target=class name) or an MO query (kind='mo', target=dn).
+    Returns (total count, page of MO dicts)'''
+    predicate = parse_filter(_option(options, 'query-target-filter')) if options.get('query-target-filter') else None
+    with store._lock:
+        if kind == 'class':
+            dns = store.of_class(target)
+        else:
+            if target not in store.mos:
+                return 0, []
+            scope = _option(options, 'query-target', 'self')
+            if scope == 'self':
+                dns = [target]
+            elif scope == 'children':
+                dns = list(store.children.get(target, []))
+            else:
+                dns = [target] + list(store.descendants(target))
+            subtree_class = _option(options, 'target-subtree-class')
+            if subtree_class and scope != 'self':
+                wanted = set(subtree_class.split(','))
+                dns = [dn for dn in dns if store.mos[dn][0] in wanted]
+        if predicate:
+            dns = [dn for dn in dns if predicate(store.mos[dn][1])]
+        order_by = _option(options, 'order-by')
+        if order_by:
+            prop, _, direction = order_by.partition('|')
+            prop = prop.split('.', 1)[-1]
+            dns.sort(key=lambda dn: store.mos[dn][1].get(prop, ''), reverse=direction == 'desc')
+        total = len(dns)
+        page_size = _option(options, 'page-size')
+        if page_size:
+            page = int(_option(options, 'page', '0'))
+            dns = dns[page * int(page_size):(page + 1) * int(page_size)]
+        subtree = _option(options, 'rsp-subtree') in ('full', 'children')
+        subtree_classes = set(_option(options, 'rsp-subtree-class', '').split(',')) - {''}
+        return total, [store.to_dict(dn, subtree, subtree_classes) for dn in dns]
+
+
+def _xml_element(mo):
+    (class_name, body), = mo.items()
+    element = ElementTree.Element(class_name, body['attributes'])
+    for child in body.get('children', []):
+        element.append(_xml_element(child))
+    return element
+
+
+def _from_xml(element):
+    return {element.tag: {'attributes': dict(element.attrib), 'children': [_from_xml(child) for child in element]}}
+
+
+class PhaseCounters:
+    '''Thread safe API call counters per phase: requests, seconds spent answering, bytes and MOs in and out'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.phases = {phase: {'requests': 0, 'seconds': 0.0, 'bytes_in': 0, 'bytes_out': 0, 'mos_read': 0,
+                                   'mos_written': 0} for phase in PHASES}
+
+    def record(self, phase, seconds, bytes_in, bytes_out, mos_read=0, mos_written=0):
+        with self._lock:
+            counters = self.phases[phase]
+            counters['requests'] += 1
+            counters['seconds'] += seconds
+            counters['bytes_in'] += bytes_in
+            counters['bytes_out'] += bytes_out
+            counters['mos_read'] += mos_read
+            counters['mos_written'] += mos_written
+
+    def snapshot(self):
+        with self._lock:
+            return {phase: dict(counters, seconds=round(counters['seconds'], 3))
+                    for phase, counters in self.phases.items()}
+
+
+def _phase(method, path, payload):
+    if path.startswith(('aaaLogin', 'aaaRefresh', 'aaaLogout')):
+        return 'auth'
+    if method == 'POST':
+        return 'snapshot' if payload and 'configExportP' in payload else 'commit'
+    if path.startswith(('mo/uni/backupst', 'node/mo/uni/backupst')):
+        return 'snapshot'
+    if path.endswith('.xml'):
+        return 'lookup'
+    if 'fvRsPathAtt' in path:
+        return 'static_paths'
+    return 'inventory'
+
+
+class MockApic:
+    '''Mock APIC server on a background thread.
+    :param latency = seconds added to every request
+    :param write_latency = seconds added per MO written by a config POST
+    :param token_lifetime = refreshTimeoutSeconds returned on login
+    :param throttle_every = if set, every Nth authenticated request is answered 429 to exercise client retries
+    :param export_seconds = time a triggered config snapshot export runs before its job reports success'''
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, write_latency=0.0, token_lifetime=600,
+                 user='admin', password='password', throttle_every=0, export_seconds=0.0):
+        self.store = MoStore()
+        self.counters = PhaseCounters()
+        self.latency = latency
+        self.write_latency = write_latency
+        self.token_lifetime = token_lifetime
+        self.throttle_every = throttle_every
+        self.export_seconds = export_seconds
+        self._export_counter = itertools.count()
+        self._request_counter = itertools.count(1)
+        self.user = user
+        self.password = password
+        self.tokens = set()
+        for dn, class_name in (('uni', 'polUni'), ('uni/infra', 'infraInfra'), ('uni/fabric', 'fabricInst'),
+                               ('uni/fabric/protpol', 'fabricProtPol'), ('topology', 'topSystem'),
+                               ('topology/pod-1', 'fabricPod')):
+            self.store.put(class_name, {'dn': dn})
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        apic = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                apic._handle(self, 'GET')
+
+            def do_POST(self):
+                apic._handle(self, 'POST')
+
+        return Handler
+
+    def _handle(self, handler, method):
+        start = time.perf_counter()
+        url = urlsplit(handler.path)
+        path = unquote(url.path)[len('/api/'):] if url.path.startswith('/api/') else url.path
+        options = parse_qs(url.query, keep_blank_values=True)
+        body = handler.rfile.read(int(handler.headers.get('Content-Length') or 0))
+        xml = path.endswith('.xml')
+        payload = None
+        total = None
+        mos_read = mos_written = 0
+        try:
+            if method == 'POST' and body:
+                payload = _from_xml(ElementTree.fromstring(body)) if xml else json.loads(body)
+            if self.latency:
+                time.sleep(self.latency)
+            if path.startswith('aaaLogin'):
+                status, imdata = self._login(payload)
+            elif path.startswith('aaaLogout'):
+                self.tokens.discard(self._cookie(handler))
+                status, imdata = 200, []
+            else:
+                token = self._cookie(handler)
+                if token not in self.tokens:
+                    raise ApicError(403, 'Token was invalid (Error: Token timeout)')
+                if self.throttle_every and next(self._request_counter) % self.throttle_every == 0:
+                    raise ApicError(429, 'Too many requests')
+                if path.startswith('aaaRefresh'):
+                    status, imdata = self._refresh(token)
+                elif method == 'POST':
+                    mos_written = self._post(path, payload)
+                    status, imdata = 200, []
+                else:
+                    total, imdata = self._get(path, options)
+                    mos_read = len(imdata)
+                    status = 200
+        except ApicError as e:
+            status, imdata = e.status, [{'error': {'attributes': {'code': str(e.status), 'text': str(e)}}}]
+        except (ValueError, KeyError, ElementTree.ParseError) as e:
+            status, imdata = 400, [{'error': {'attributes': {'code': '400', 'text': f'{type(e).__name__}: {e}'}}}]
+
+        total = len(imdata) if total is None else total
+        if xml:
+            root = ElementTree.Element('imdata', {'totalCount': str(total)})
+            for mo in imdata:
+                root.append(_xml_element(mo))
+            response = ElementTree.tostring(root, encoding='utf-8', xml_declaration=True)
+            content_type = 'text/xml'
+        else:
+            response = json.dumps({'totalCount': str(total), 'imdata': imdata}).encode()
+            content_type = 'application/json'
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(response)))
+        handler.end_headers()
+        handler.wfile.write(response)
+        self.counters.record(_phase(method, path, payload), time.perf_counter() - start, len(body), len(response),
+                             mos_read, mos_written)
+
+    @staticmethod
+    def _cookie(handler):
+        for cookie in (handler.headers.get('Cookie') or '').split(';'):
+            name, _, value = cookie.strip().partition('=')
+            if name == 'APIC-cookie' or name == 'APIC-Cookie':
+                return value
+        return None
+
+    def _token_response(self, token):
+        return [{'aaaLogin': {'attributes': {'token': token, 'refreshTimeoutSeconds': str(self.token_lifetime),
+                                             'userName': self.user}}}]
+
+    def _login(self, payload):
+        attributes = (payload or {}).get('aaaUser', {}).get('attributes', {})
+        if attributes.get('name') != self.user or attributes.get('pwd') != self.password:
+            raise ApicError(401, 'Username or password is incorrect - FAILED local authentication')
+        token = secrets.token_hex(16)
+        self.tokens.add(token)
+        return 200, self._token_response(token)
+
+    def _refresh(self, token):
+        self.tokens.discard(token)
+        token = secrets.token_hex(16)
+        self.tokens.add(token)
+        return 200, self._token_response(token)
+
+    def _get(self, path, options):
+        path = path[len('node/'):] if path.startswith('node/') else path
+        kind, _, target = path.partition('/')
+        target = target.rsplit('.', 1)[0]
+        if kind not in ('class', 'mo'):
+            raise ApicError(400, f'Unsupported query {path}')
+        return run_query(self.store, kind, target, options)
+
+    def _start_export(self, export_dn):
+        '''Creates the configJob of an export run, completed by a timer after export_seconds'''
+        container_dn = f'uni/backupst/jobs-[{export_dn}]'
+        self.store.put('configJobCont', {'dn': container_dn})
+        run = time.strftime('%Y-%m-%dT%H-%M-%S') + f'.{next(self._export_counter):06d}'
+        job_dn = f'{container_dn}/run-{run}'
+        self.store.put('configJob', {'dn': job_dn, 'operSt': 'running', 'executeTime': run})
+        timer = threading.Timer(self.export_seconds, self.store.put, ('configJob', {'dn': job_dn, 'operSt': 'success'}))
+        timer.daemon = True
+        timer.start()
+
+    def _post(self, path, payload):
+        path = path[len('node/'):] if path.startswith('node/') else path
+        root_dn = path[len('mo/'):].rsplit('.', 1)[0] if path.startswith('mo/') else None
+        (class_name, body), = payload.items()
+        attributes = body.setdefault('attributes', {})
+        if root_dn:
+            attributes.setdefault('dn', root_dn)
+        elif 'dn' not in attributes:
+            raise ApicError(400, 'Posted MO has no dn')
+        written = self.store.put_tree(payload)
+        if class_name == 'configExportP' and attributes.get('adminSt') == 'triggered':
+            self._start_export(attributes['dn'])
+        if self.write_latency:
+            time.sleep(self.write_latency * written)
+        return written
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from synthetic_fabric import build_fabric
+
+    parser = argparse.ArgumentParser(description='Local mock APIC serving a synthetic fabric')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--leaves', type=int, default=20, help='Number of source leaves')
+    parser.add_argument('--selectors', type=int, default=24, help='Port selectors per leaf interface profile')
+    parser.add_argument('--bindings', type=int, default=50, help='Static bindings per leaf')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--write-latency', type=float, default=0.0, help='Seconds added per MO committed')
+    parser.add_argument('--export-seconds', type=float, default=0.0, help='Duration of a config snapshot export')
+    args = parser.parse_args()
+
+    mock = MockApic(port=args.port, latency=args.latency, write_latency=args.write_latency,
+                    export_seconds=args.export_seconds)
+    fabric = build_fabric(mock.store, leaves=args.leaves, selectors_per_leaf=args.selectors,
+                          bindings_per_leaf=args.bindings)
+    print(f'Mock APIC with {len(mock.store)} objects listening on {mock.url} (user {mock.user}, password {mock.password})')
+    print('Migration targets for this fabric:')
+    print('\n'.join(fabric.target_lines()))
+    try:
+        mock._server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(mock.counters.snapshot(), indent=2))
@@ -0,0 +1,122 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Generates a synthetic fabric of configurable size into a mock APIC store (benchmarks/mock_apic.py):
+# source leaf pairs with switch profiles, interface profiles and port selectors, VPC protection groups,
+# and tenants/EPGs with static bindings on the single leaf and VPC paths of every source leaf.
+# The same arguments always produce the same fabric, so benchmark runs are reproducible.
+
+from collections import namedtuple
+
+# Source leaves are numbered from FIRST_LEAF, their destination is the same id + DEST_OFFSET
+FIRST_LEAF = 101
+DEST_OFFSET = 1000
+
+
+class SyntheticFabric(namedtuple('SyntheticFabric', ['source_pairs', 'dest_pairs', 'objects', 'bindings'])):
+    '''Description of a generated fabric: the leaf pairs to migrate and the number of MOs and bindings created'''
+
+    def target_lines(self):
+        '''MigrationTargets.txt lines migrating every source pair to its destination pair'''
+        return [f'{a},{b},{c},{d}' for (a, b), (c, d) in zip(self.source_pairs, self.dest_pairs)]
+
+    def write_targets(self, path):
+        with open(path, 'w') as fp:
+            fp.write('# Generated by benchmarks/synthetic_fabric.py\n')
+            fp.write('\n'.join(self.target_lines()) + '\n')
+
+
+def build_fabric(store, leaves=20, selectors_per_leaf=24, bindings_per_leaf=50, tenants=4, epgs_per_tenant=25,
+                 vpc_binding_ratio=0.5, port_groups=None):
+    '''Populates store with a synthetic fabric and returns a SyntheticFabric.
+    :param store = mock_apic.MoStore
+    :param leaves = number of source leaves, paired into VPC pairs (rounded up to an even number)
+    :param selectors_per_leaf = port selectors of each source leaf interface profile, one port block each
+    :param bindings_per_leaf = static bindings per source leaf, spread over every EPG
+    :param vpc_binding_ratio = share of the bindings of a pair that are on its VPC path rather than on a single leaf
+    :param port_groups = optional number of access policy groups shared by runs of consecutive ports (ex: 4 with 24
+                         selectors: ports 1-6, 7-12...), instead of one policy group per port'''
+    leaves += leaves % 2
+    source_ids = [FIRST_LEAF + i for i in range(leaves)]
+    dest_ids = [leaf + DEST_OFFSET for leaf in source_ids]
+    start = len(store)
+
+    store.put('fabricNode', {'dn': 'topology/pod-1/node-1', 'id': '1', 'name': 'apic1', 'role': 'controller'})
+    for node_id in source_ids + dest_ids:
+        store.put('fabricNode', {'dn': f'topology/pod-1/node-{node_id}', 'id': str(node_id), 'name': f'leaf{node_id}',
+                                 'role': 'leaf', 'podId': '1', 'fabricSt': 'active'})
+
+    for node_id in source_ids:
+        int_profile_dn = f'uni/infra/accportprof-Leaf{node_id}_IntProf'
+        store.put_tree({'infraNodeP': {'attributes': {'dn': f'uni/infra/nprof-Leaf{node_id}_SwProf',
+                                                      'name': f'Leaf{node_id}_SwProf'},
+                                       'children': [
+                                           {'infraRsAccPortP': {'attributes': {'tDn': int_profile_dn}}},
+                                           {'infraLeafS': {'attributes': {'name': f'Leaf{node_id}', 'type': 'range'},
+                                                           'children': [
+                                                               {'infraRsAccNodePGrp': {'attributes': {
+                                                                   'tDn': 'uni/infra/funcprof/accnodepgrp-LeafPG'}}},
+                                                               {'infraNodeBlk': {'attributes': {
+                                                                   'name': f'blk{node_id}', 'from_': str(node_id),
+                                                                   'to_': str(node_id)}}}]}}]}})
+        selectors = []
+        for port in range(1, selectors_per_leaf + 1):
+            if port_groups:
+                policy_group = f'accportgrp-Access_Group{(port - 1) * port_groups // selectors_per_leaf + 1}'
+            else:
+                policy_group = f'accbundle-VPC_Port{port}' if port % 2 else f'accportgrp-Access_Port{port}'
+            selectors.append({'infraHPortS': {'attributes': {'name': f'Port{port}', 'type': 'range', 'descr': ''},
+                                              'children': [
+                                                  {'infraRsAccBaseGrp': {'attributes': {
+                                                      'tDn': f'uni/infra/funcprof/{policy_group}'}}},
+                                                  {'infraPortBlk': {'attributes': {
+                                                      'name': 'block1', 'fromCard': '1', 'toCard': '1',
+                                                      'fromPort': str(port), 'toPort': str(port)}}}]}})
+        store.put_tree({'infraAccPortP': {'attributes': {'dn': int_profile_dn, 'name': f'Leaf{node_id}_IntProf'},
+                                          'children': selectors}})
+
+    source_pairs = [(source_ids[i], source_ids[i + 1]) for i in range(0, leaves, 2)]
+    for group_id, (node1, node2) in enumerate(source_pairs, 1):
+        store.put_tree({'fabricExplicitGEp': {'attributes': {'dn': f'uni/fabric/protpol/expgep-VPC{node1}-{node2}',
+                                                             'name': f'VPC{node1}-{node2}', 'id': str(group_id)},
+                                              'children': [
+                                                  {'fabricNodePEp': {'attributes': {'id': str(node1), 'podId': '1'}}},
+                                                  {'fabricNodePEp': {'attributes': {'id': str(node2), 'podId': '1'}}}]}})
+
+    epg_dns = []
+    for tenant in range(1, tenants + 1):
+        store.put('fvTenant', {'dn': f'uni/tn-Tenant{tenant}', 'name': f'Tenant{tenant}'})
+        store.put('fvAp', {'dn': f'uni/tn-Tenant{tenant}/ap-App', 'name': 'App'})
+        for epg in range(1, epgs_per_tenant + 1):
+            epg_dn = f'uni/tn-Tenant{tenant}/ap-App/epg-EPG{epg}'
+            store.put('fvAEPg', {'dn': epg_dn, 'name': f'EPG{epg}'})
+            epg_dns.append(epg_dn)
+
+    bindings = 0
+    vpc_bindings = int(bindings_per_leaf * vpc_binding_ratio)
+    for node1, node2 in source_pairs:
+        paths = [f'topology/pod-1/paths-{node}/pathep-[eth1/{port}]'
+                 for node in (node1, node2) for port in range(1, bindings_per_leaf - vpc_bindings + 1)]
+        paths += [f'topology/pod-1/protpaths-{node1}-{node2}/pathep-[VPC_Port{port}]'
+                  for port in range(1, 2 * vpc_bindings + 1)]
+        for i, tDn in enumerate(paths):
+            # Walk the EPGs so every path is bound in a different EPG (and VLAN) than its neighbours
+            epg = (i * 7 + node1) % len(epg_dns)
+            store.put('fvRsPathAtt', {'dn': f'{epg_dns[epg]}/rspathAtt-[{tDn}]', 'tDn': tDn,
+                                      'encap': f'vlan-{100 + epg}', 'mode': 'regular', 'instrImedcy': 'lazy',
+                                      'primaryEncap': 'unknown', 'descr': ''})
+        bindings += len(paths)
+
+    dest_pairs = [(node1 + DEST_OFFSET, node2 + DEST_OFFSET) for node1, node2 in source_pairs]
+    return SyntheticFabric(source_pairs, dest_pairs, len(store) - start, bindings)
@@ -0,0 +1,135 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+import threading
+import time
+
+from apic_queries import snapshot_jobs_url
+from run_metrics import METRICS
+
+# configExportP triggered by save_aci_config_snapshot()
+SNAPSHOT_EXPORT_DN = 'uni/fabric/configexp-defaultOneTime'
+
+# configJob operSt values once the export is over
+SNAPSHOT_SUCCESS = 'success'
+SNAPSHOT_FAILED = ('failed', 'fail-partial', 'cancelled')
+
+
+class SnapshotWatcher:
+    '''Triggers the config snapshot and tracks its export job on a background thread, so the export runs while the
+    fabric is read and the targets are validated. wait() is the gate to pass before the first write.
+    The job is polled with an adaptive interval: it doubles while the job state does not change, up to
+    max_interval, and drops back to poll_interval whenever the state changes.
+    :param session = shared ApicSession, the polls go through its rate limit
+    :param trigger = function posting the configExportP (ex: lambda: save_aci_config_snapshot(session)),
+                     returning the HTTP status code
+    :param timeout = seconds after which wait() gives up on the export'''
+
+    def __init__(self, session, trigger, export_dn=SNAPSHOT_EXPORT_DN, poll_interval=0.5, max_interval=15,
+                 timeout=1800):
+        self.session = session
+        self.trigger = trigger
+        self.export_dn = export_dn
+        self.poll_interval = poll_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+
+        self.state = None       # operSt of the job, 'trigger-failed' or 'timeout'
+        self.job_dn = None
+        self.polls = 0
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def _jobs(self):
+        '''Returns a dict of dn -> attributes of the export jobs. Raises RuntimeError when the APIC answers with an
+        error status'''
+        response = self.session.get(snapshot_jobs_url(self.export_dn))
+        if response.status_code != 200:
+            raise RuntimeError(f'{response.status_code}: {response.text}')
+        return {job['configJob']['attributes']['dn']: job['configJob']['attributes']
+                for job in response.json()['imdata'] if 'configJob' in job}
+
+    def start(self):
+        '''Triggers the export and starts tracking it. The jobs of earlier exports are read first, so the new job is
+        recognised without comparing APIC and local clocks'''
+        with METRICS.phase('snapshot'):
+            try:
+                previous = set(self._jobs())
+            except Exception as e:
+                # Without the earlier jobs the new one cannot be told apart, the export is not triggered
+                print(f'Snapshot jobs of {self.export_dn} could not be read: {e}')
+                self.state = 'trigger-failed'
+                self._done.set()
+                return self
+        self.started = time.perf_counter()
+        status = self.trigger()
+        if status != 200:
+            self.state = 'trigger-failed'
+            self._done.set()
+            return self
+        self._thread = threading.Thread(target=self._watch, args=(previous,), daemon=True)
+        self._thread.start()
+        return self
+
+    def _watch(self, previous):
+        interval = self.poll_interval
+        deadline = self.started + self.timeout
+        with METRICS.phase('snapshot_export'):
+            while time.perf_counter() < deadline:
+                time.sleep(min(interval, max(0, deadline - time.perf_counter())))
+                self.polls += 1
+                try:
+                    jobs = {dn: job for dn, job in self._jobs().items() if dn not in previous}
+                except Exception as e:
+                    # A failed poll is retried at the next interval, the export itself is not affected
+                    print(f'Snapshot job poll failed: {e}')
+                    jobs = {}
+                state = None
+                if jobs:
+                    self.job_dn = min(jobs)
+                    state = jobs[self.job_dn].get('operSt')
+                if state in (SNAPSHOT_SUCCESS,) + SNAPSHOT_FAILED:
+                    self.state = state
+                    break
+                interval = self.poll_interval if state != self.state else min(interval * 2, self.max_interval)
+                self.state = state
+            else:
+                self.state = 'timeout'
+        self.finished = time.perf_counter()
+        self._done.set()
+
+    @property
+    def duration(self):
+        '''Seconds from the trigger to the end of the export as observed by the polls (within one poll interval)'''
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def wait(self):
+        '''Blocks until the export is over. Returns True if it succeeded'''
+        if not self._done.is_set():
+            print('Waiting for the config snapshot export to complete before the first write...')
+        with METRICS.phase('snapshot_wait'):
+            self._done.wait()
+        if self.state == SNAPSHOT_SUCCESS:
+            print(f'Config snapshot export completed in {self.duration:.1f}s ({self.polls} polls)')
+            return True
+        print(f'ERROR! Config snapshot export did not complete: {self.state}')
+        return False
+
+    def summary(self):
+        return {'state': self.state, 'job': self.job_dn, 'polls': self.polls,
+                'seconds': round(self.duration, 3) if self.duration is not None else None}
@@ -0,0 +1,209 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+import json
+import sqlite3
+import time
+from collections import namedtuple
+
+from apic_queries import LEAF_INTERFACE_PROFILES_URL, LEAF_SWITCH_PROFILES_URL, STATIC_BINDINGS_URL, VPC_GROUPS_URL
+from apic_stream import iter_query
+
+# A cached query. Its MOs are stored per top-level object (ex: one infraNodeP with its subtree), so a change anywhere
+# in the subtree only refetches that object.
+#   url = full query
+#   top_rn = rn prefix of the top-level objects
+#   root = dn under which changed objects are searched, None for a class query (single class)
+#   classes = classes whose modTs is checked for changes (the top class and its subtree classes)
+#   refetch_url = query returning one top-level object by dn, in the same shape as the full query
+#   exclude = dn substring of objects the full query filters out
+CachedQuery = namedtuple('CachedQuery', ['url', 'top_rn', 'root', 'classes', 'refetch_url', 'exclude'])
+
+_SWITCH_PROFILE_CLASSES = ('infraLeafS', 'infraRsAccPortP', 'infraRsAccCardP', 'infraNodeBlk', 'infraRsAccNodePGrp')
+_INTERFACE_PROFILE_CLASSES = ('infraHPortS', 'infraPortBlk', 'infraRsAccBaseGrp', 'infraSubPortBlk')
+
+CACHED_QUERIES = {
+    'switch_profiles': CachedQuery(LEAF_SWITCH_PROFILES_URL, 'nprof-', 'uni/infra',
+                                   ('infraNodeP',) + _SWITCH_PROFILE_CLASSES,
+                                   '/node/mo/{dn}.json?rsp-subtree=full&rsp-subtree-class=' + ','.join(_SWITCH_PROFILE_CLASSES),
+                                   '__ui_'),
+    'interface_profiles': CachedQuery(LEAF_INTERFACE_PROFILES_URL, 'accportprof-', 'uni/infra',
+                                      ('infraAccPortP',) + _INTERFACE_PROFILE_CLASSES,
+                                      '/node/mo/{dn}.json?rsp-subtree=full&rsp-subtree-class=' + ','.join(_INTERFACE_PROFILE_CLASSES),
+                                      '__ui_'),
+    # protpol is queried flat (query-target=subtree), a group is stored with its node and policy MOs
+    'vpc_groups': CachedQuery(VPC_GROUPS_URL, 'expgep-', 'uni/fabric/protpol',
+                              ('fabricExplicitGEp', 'fabricNodePEp', 'fabricRsVpcInstPol'),
+                              '/node/mo/{dn}.json?query-target=subtree', None),
+    'static_bindings': CachedQuery(STATIC_BINDINGS_URL, 'rspathAtt-', None, ('fvRsPathAtt',),
+                                   '/node/mo/{dn}.json', None),
+}
+
+# Deletions do not leave a modTs behind, they are read from the audit log
+_DELETIONS_URL = '/class/aaaModLR.json?query-target-filter=and(eq(aaaModLR.ind,"deletion"),ge(aaaModLR.created,"{since}"))'
+
+# Above this many changed objects, a full fetch is cheaper than refetching them one by one
+MAX_REFETCH = 500
+
+
+def changes_url(query, since):
+    '''Query of the objects of a CachedQuery created or modified since the modTs since, in a single request'''
+    if query.root is None:
+        class_name, = query.classes
+        return f'/class/{class_name}.json?query-target-filter=ge({class_name}.modTs,"{since}")'
+    modified = ','.join(f'ge({class_name}.modTs,"{since}")' for class_name in query.classes)
+    return f'/node/mo/{query.root}.json?query-target=subtree&target-subtree-class={",".join(query.classes)}' \
+           f'&query-target-filter=or({modified})'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS mos (fabric TEXT, query TEXT, dn TEXT, body TEXT, PRIMARY KEY (fabric, query, dn));
+CREATE TABLE IF NOT EXISTS syncs (fabric TEXT, query TEXT, synced_at REAL, mod_ts TEXT, full_at REAL,
+                                  PRIMARY KEY (fabric, query));
+'''
+
+
+def _mo_dn(mo):
+    return next(iter(mo.values()))['attributes']['dn']
+
+
+def _split_rn(dn):
+    '''(parent dn, last rn), ignoring the slashes inside [...] (ex: the tDn of an rspathAtt rn)'''
+    depth = 0
+    for i in range(len(dn) - 1, -1, -1):
+        if dn[i] == ']':
+            depth += 1
+        elif dn[i] == '[':
+            depth -= 1
+        elif dn[i] == '/' and depth == 0:
+            return dn[:i], dn[i + 1:]
+    return None, dn
+
+
+def _top_dn(dn, top_rn):
+    '''dn of the top-level object holding dn (itself included), None when dn is not under one'''
+    while dn is not None:
+        parent, rn = _split_rn(dn)
+        if rn.startswith(top_rn):
+            return dn
+        dn = parent
+    return None
+
+
+def _max_mod_ts(mos, mod_ts=''):
+    '''Latest modTs of a list of MO dicts and their children, APIC timestamps compare as strings'''
+    stack = list(mos)
+    while stack:
+        body = next(iter(stack.pop().values()))
+        mod_ts = max(mod_ts, body['attributes'].get('modTs', ''))
+        stack.extend(body.get('children', []))
+    return mod_ts
+
+
+class FabricCache:
+    '''SQLite cache of the fabric access policies and static bindings, keyed by fabric and query.
+    The first run (or the first run max_age seconds after the last full fetch) fetches every query in full. Later runs only read the objects
+    changed since the last sync: modTs filters find created and modified objects, the aaaModLR audit log the
+    deleted ones, and only the affected top-level objects are refetched.
+    :param path = SQLite file
+    :param fabric = fabric identifier (ex: the APIC address)
+    :param max_age = seconds after the last full fetch of a query when it is fully fetched again'''
+
+    def __init__(self, path, fabric, max_age=24 * 3600):
+        self.fabric = fabric
+        self.max_age = max_age
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+        # Caches written before full_at was tracked are fully refreshed on their next run
+        if 'full_at' not in [column[1] for column in self.db.execute('PRAGMA table_info(syncs)')]:
+            self.db.execute('ALTER TABLE syncs ADD COLUMN full_at REAL')
+        self.stats = {}   # query -> 'full'/'incremental', changed objects
+        self._deletions = None    # (since, deleted dns with their timestamp), one audit log read per run
+
+    def mos(self, session, name):
+        '''Refreshes a cached query and returns its MO dicts, in dn order like the ordered APIC queries'''
+        self.refresh(session, name)
+        rows = self.db.execute('SELECT body FROM mos WHERE fabric = ? AND query = ? ORDER BY dn', (self.fabric, name))
+        return [mo for (body,) in rows for mo in json.loads(body)]
+
+    def refresh(self, session, name):
+        query = CACHED_QUERIES[name]
+        row = self.db.execute('SELECT mod_ts, full_at FROM syncs WHERE fabric = ? AND query = ?',
+                              (self.fabric, name)).fetchone()
+        # The age is counted from the last full fetch, incremental syncs do not postpone it
+        if row is None or not row[0] or row[1] is None or time.time() - row[1] > self.max_age:
+            return self._full_fetch(session, name, query)
+        changed = self._changed_tops(session, query, row[0])
+        if changed is None:
+            return self._full_fetch(session, name, query)
+        mod_ts, full_at = row
+        with self.db:
+            for dn in changed:
+                mos = session.get(query.refetch_url.format(dn=dn)).json()['imdata']
+                if not mos:
+                    self.db.execute('DELETE FROM mos WHERE fabric = ? AND query = ? AND dn = ?', (self.fabric, name, dn))
+                    continue
+                self.db.execute('INSERT OR REPLACE INTO mos VALUES (?, ?, ?, ?)',
+                                (self.fabric, name, dn, json.dumps(mos, separators=(',', ':'))))
+                mod_ts = _max_mod_ts(mos, mod_ts)
+            self._synced(name, mod_ts, full_at)
+        self.stats[name] = ('incremental', len(changed))
+
+    def _changed_tops(self, session, query, since):
+        '''Returns the dns of the top-level objects created, modified or deleted since the modTs since,
+        or None when a full fetch is cheaper'''
+        # ge rather than gt: an object written in the same millisecond as the last one read must not be missed,
+        # the price is refetching that last object
+        changed = set()
+        for mo in iter_query(session, changes_url(query, since)):
+            top = _top_dn(_mo_dn(mo), query.top_rn)
+            if top and not (query.exclude and query.exclude in top):
+                changed.add(top)
+            if len(changed) > MAX_REFETCH:
+                return None
+        for created, dn in self._deleted_since(session, since):
+            top = _top_dn(dn, query.top_rn)
+            if top:
+                changed.add(top)
+        return changed if len(changed) <= MAX_REFETCH else None
+
+    def _deleted_since(self, session, since):
+        '''(timestamp, dn) of the objects deleted since the modTs since. The audit log is read once, from the oldest
+        cursor of the fabric, and shared by every query'''
+        if self._deletions is None or self._deletions[0] > since:
+            oldest, = self.db.execute('SELECT MIN(mod_ts) FROM syncs WHERE fabric = ?', (self.fabric,)).fetchone()
+            oldest = min(oldest or since, since)
+            records = [record['aaaModLR']['attributes'] for record in
+                       iter_query(session, _DELETIONS_URL.format(since=oldest))]
+            self._deletions = (oldest, [(record['created'], record['affected']) for record in records])
+        return [(created, dn) for created, dn in self._deletions[1] if created >= since]
+
+    def _full_fetch(self, session, name, query):
+        # Group the MOs by top-level object, MOs outside of any (ex: fabricProtPol itself) are stored on their own
+        groups = {}
+        for mo in iter_query(session, query.url):
+            dn = _mo_dn(mo)
+            groups.setdefault(_top_dn(dn, query.top_rn) or dn, []).append(mo)
+        with self.db:
+            self.db.execute('DELETE FROM mos WHERE fabric = ? AND query = ?', (self.fabric, name))
+            self.db.executemany('INSERT INTO mos VALUES (?, ?, ?, ?)',
+                                ((self.fabric, name, dn, json.dumps(mos, separators=(',', ':'))) for dn, mos in groups.items()))
+            self._synced(name, _max_mod_ts(mo for mos in groups.values() for mo in mos), time.time())
+        self.stats[name] = ('full', len(groups))
+
+    def _synced(self, name, mod_ts, full_at):
+        self.db.execute('INSERT OR REPLACE INTO syncs (fabric, query, synced_at, mod_ts, full_at) VALUES (?, ?, ?, ?, ?)',
+                        (self.fabric, name, time.time(), mod_ts, full_at))
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,128 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+from fabric_model import InterfaceProfile, NodeProfile, VpcGroup
+from mo_walker import interface_profile_record, node_profile_record
+
+
+class FabricInventory:
+    '''In-memory snapshot of the fabric access objects the migration reads.
+    Built once per run from the fetch functions in fabric_migration.py and indexed so that every
+    MigrationTargets.txt line is answered from memory. Objects created during the run are recorded
+    back into the same indexes so later lines see them.'''
+
+    def __init__(self):
+        self.nodes = {}                    # node id -> fabricNode attributes
+        self.switch_profiles_by_node = {}  # node id -> [NodeProfile] whose leaf block is that node
+        self.switch_profiles_by_dn = {}    # infraNodeP dn -> NodeProfile
+        self.int_profiles_by_dn = {}       # infraAccPortP dn -> InterfaceProfile
+        self.vpc_groups_by_name = {}       # fabricExplicitGEp name -> VpcGroup
+        self.vpc_group_by_node = {}        # node id -> VpcGroup
+
+    @classmethod
+    def from_responses(cls, fabric_nodes, switch_profiles, interface_profiles, vpc_groups):
+        '''Build the inventory from the raw responses of get_fabric_nodes(), get_leaf_switch_profiles(),
+        get_leaf_interface_profiles() and get_vpc_groups()'''
+        return cls.from_mos(fabric_nodes['imdata'], switch_profiles['imdata'], interface_profiles['imdata'],
+                            vpc_groups['imdata'])
+
+    @classmethod
+    def from_mos(cls, fabric_nodes, switch_profiles, interface_profiles, vpc_groups):
+        '''Build the inventory from iterables of MO dicts (ex: the lazy generators of apic_stream.iter_query()).
+        Every MO is consumed once, only the indexed records are kept'''
+        inventory = cls()
+        for obj in fabric_nodes:
+            attributes = obj['fabricNode']['attributes']
+            inventory.nodes[attributes['id']] = attributes
+        for profile in switch_profiles:
+            inventory._index_switch_profile(node_profile_record(profile))
+        for profile in interface_profiles:
+            record = interface_profile_record(profile)
+            inventory.int_profiles_by_dn[record.dn] = record
+
+        # protpol is queried with query-target=subtree, so groups and their nodes come back flat
+        node_peps = []
+        for obj in vpc_groups:
+            if 'fabricExplicitGEp' in obj:
+                attributes = obj['fabricExplicitGEp']['attributes']
+                inventory.vpc_groups_by_name[attributes['name']] = VpcGroup(name=attributes['name'],
+                                                                            dn=attributes['dn'], id=attributes['id'])
+            elif 'fabricNodePEp' in obj:
+                node_peps.append(obj['fabricNodePEp']['attributes'])
+        groups_by_dn = {group.dn: group for group in inventory.vpc_groups_by_name.values()}
+        for node_pep in node_peps:
+            group = groups_by_dn.get(node_pep['dn'].rsplit('/nodepep-', 1)[0])
+            if group:
+                inventory.vpc_group_by_node[node_pep['id']] = group
+        return inventory
+
+    def _index_switch_profile(self, record):
+        self.switch_profiles_by_dn[record.dn] = record
+        # A profile belongs to a node when its first leaf selector block covers exactly that node
+        if record.node_blocks:
+            block_from, block_to = record.node_blocks[0]
+            if block_from == block_to:
+                self.switch_profiles_by_node.setdefault(block_from, []).append(record)
+
+    def has_node(self, node_id):
+        return str(node_id) in self.nodes
+
+    def node_pod(self, node_id):
+        '''Pod id of a node, from the dn of its fabricNode (topology/pod-1/node-101). None for unknown nodes'''
+        attributes = self.nodes.get(str(node_id))
+        if attributes is None:
+            return None
+        dn = attributes.get('dn', '')
+        if dn.startswith('topology/pod-'):
+            return dn[len('topology/pod-'):].split('/', 1)[0]
+        return attributes.get('podId')
+
+    def switch_profiles_for_node(self, node_id):
+        return self.switch_profiles_by_node.get(str(node_id), [])
+
+    def interface_profiles(self, dns):
+        '''Returns the InterfaceProfiles for the given dns, skipping any that do not exist'''
+        return [self.int_profiles_by_dn[dn] for dn in dns if dn in self.int_profiles_by_dn]
+
+    def port_selectors(self, dn):
+        '''Returns the PortSelectors of the interface profile with the given dn'''
+        record = self.int_profiles_by_dn.get(dn)
+        return record.port_selectors if record else []
+
+    def vpc_group_for_node(self, node_id):
+        return self.vpc_group_by_node.get(str(node_id))
+
+    def used_vpc_ids(self):
+        return {int(group.id) for group in self.vpc_groups_by_name.values()}
+
+    # ----- Writes made during the run -----
+
+    def record_switch_profile(self, name, node_id, int_profile_tDn=None, policy_group_tDn=None):
+        record = NodeProfile(name, f'uni/infra/nprof-{name}', [(str(node_id), str(node_id))],
+                             [policy_group_tDn] if policy_group_tDn else [], [int_profile_tDn] if int_profile_tDn else [])
+        self._index_switch_profile(record)
+        return record
+
+    def record_int_profile(self, name, port_selectors):
+        '''Records an interface profile created from the PortSelectors passed to create_int_profile()'''
+        record = InterfaceProfile(name, f'uni/infra/accportprof-{name}', port_selectors)
+        self.int_profiles_by_dn[record.dn] = record
+        return record
+
+    def record_vpc_group(self, name, id, nodes):
+        group = VpcGroup(name=name, dn=f'uni/fabric/protpol/expgep-{name}', id=str(id))
+        self.vpc_groups_by_name[name] = group
+        for node in nodes:
+            self.vpc_group_by_node[str(node)] = group
+        return group
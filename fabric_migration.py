@@ -12,78 +12,42 @@
 # or implied.
 #
 
-import requests
+import argparse
+import asyncio
+import atexit
 import json
-from cobra.mit.access import MoDirectory
-from cobra.mit.session import LoginSession
-import time
 
 from ACI_create_objects import *
+from apic_queries import (FABRIC_NODES_URL, LEAF_INTERFACE_PROFILES_URL, LEAF_SWITCH_PROFILES_URL, VPC_GROUPS_URL,
+                          fabric_node_url, static_paths_url, vpc_static_paths_url)
+from apic_session import ApicSession
+from apic_stream import DEFAULT_PAGE_SIZE, iter_query
+from config_snapshot import SnapshotWatcher
+from fabric_cache import FabricCache
+from fabric_inventory import FabricInventory
+from fabric_model import StaticBinding
+from migration_journal import CreatedObjectsLog, MigrationJournal, read_created_objects
+from migration_plan import (LiveWriter, PlanWriter, apply_plan, apply_plan_async, apply_rollback, print_plan_diff,
+                            read_plan, rollback_changes, write_plan)
+from migration_runner import allocate_vpc_ids, parse_targets, run_targets, target_prefixes, validate_targets
+from migration_verify import print_verify_report, verify_targets
+from port_selectors import SelectorOptimizer
+from run_metrics import METRICS, instrumented
+from static_bindings import StaticBindingIndex, iter_static_bindings, node_mapping, rewrite_binding
+
+# Defaults, may be overridden in config.py
+apic_requests_per_second = 20   # Global request rate limit towards the APIC
+journal_file = 'migration_journal.jsonl'    # Checkpoints of the committed steps, replayed by --resume
+created_objects_file = 'created_objects.jsonl'    # Objects created by the last run, deleted by --rollback
+snapshot_timeout = 1800    # Seconds to wait for the config snapshot export, nothing is written if it does not complete
+fabric_cache_max_age = 24 * 3600    # Seconds after which --cache fetches the whole fabric state again
 
 from config import *
 
-SAVED_TOKEN = ""
-SESSION_TIME = 0
 
-def find_values(id, json_repr):
-    ''' Helper function to find all values associated with a particular key in a JSON tree including in the subtree.'''
-    # Ex: json_repr = '{"P1": "ss", "Id": 1234, "P2": {"P1": "cccc"}, "P3": [{"P1": "aaa"}]}'
-    # print(find_values('P1', json_repr))
-    # ['cccc', 'aaa', 'ss']
-    results = []
-
-    def _decode_dict(a_dict):
-        try:
-            results.append(a_dict[id])
-        except KeyError:
-            pass
-        return a_dict
-
-    json.loads(json_repr, object_hook=_decode_dict) # Return value ignored.
-    return results
-
-
-# Get authentication token for APIC.
-# Auth Walkthrough https://blog.wimwauters.com/networkprogrammability/2020-03-19-aci_python_requests/
-# Tokens are valid for 300 seconds or 5 minutes
-def get_token():
-    '''Function to retrieve the auth token required to authenticate further requests'''
-    time.sleep(1)
-    global SESSION_TIME
-    global SAVED_TOKEN
-
-    if time.time() < (SESSION_TIME + 300): # If token is still valid (under 5 mins since last token)
-        return SAVED_TOKEN
-
-    else:
-        url = f"{base}/aaaLogin.json"
-        payload = {
-            "aaaUser": {
-                "attributes": {
-                    "name": user,
-                    "pwd": password
-                }
-            }
-        }
-        headers = {'Content-Type': 'text/plain'}
-        requests.packages.urllib3.disable_warnings()
-        response = requests.request("POST", url, headers=headers, json=payload, verify=False)
-        if response.status_code == 200:
-            SAVED_TOKEN = response.json()['imdata'][0]['aaaLogin']['attributes']['token']
-            SESSION_TIME = time.time()
-            return SAVED_TOKEN
-        else:
-            print('ERROR during Authentication! Token could not be retrieved. Please check configured user+pass')
-            print('Received response was' + response.text)
-            return -1
-        # print(response.json())
-
-
-
-
-def save_aci_config_snapshot(description="API Generated Snapshot"):
+@instrumented('snapshot')
+def save_aci_config_snapshot(session, description="API Generated Snapshot"):
     '''Saves a snapshot of the ACI configuration accessed via the Admin Tab in APIC'''
-    token = get_token()
     payload = {
                  "configExportP": {
                         "attributes": {
@@ -93,294 +57,421 @@ def save_aci_config_snapshot(description="API Generated Snapshot"):
                         }
                  }
             }
-    url = f'{base}/mo.json'
-    headers = {
-        "Cookie": f"APIC-Cookie={token}",
-    }
-
-    requests.packages.urllib3.disable_warnings()
-    response = requests.post(url, headers=headers, json=payload, verify=False)
+    response = session.post('/mo.json', payload)
     if response.status_code == 200:
-        print('Saved ACI Config Snapshot!')
+        print('Triggered ACI Config Snapshot!')
         return response.status_code
     else:
         print('ERROR! Unable to save ACI Snapshot')
         return response.status_code
 
 
-def get_fabric_nodes():
+@instrumented('fabric_nodes', mos=lambda response, *args: len(response['imdata']))
+def get_fabric_nodes(session):
     '''Gets all Non-Controller nodes (including both leafs and spines)'''
 
-    token = get_token()
-    url = f"{base}/node/class/fabricNode.json?query-target-filter=ne(fabricNode.role, %22controller%22)"
-    # url = f'{base}/node/class/fabricNode.json?query-target-filter=and(ne(fabricNode.role, %22controller%22), ge(fabricNode.id,%22101%22),le(fabricNode.id,%22202%22))'
-
-    headers = {
-        "Cookie": f"APIC-Cookie={token}",
-    }
-
-    requests.packages.urllib3.disable_warnings()
-    response = requests.get(url, headers=headers, verify=False)
+    # url = f'/node/class/fabricNode.json?query-target-filter=and(ne(fabricNode.role, %22controller%22), ge(fabricNode.id,%22101%22),le(fabricNode.id,%22202%22))'
+    response = session.get(FABRIC_NODES_URL)
 
     return response.json()
 
 
-def get_fabric_node_by_id(node_id):
+@instrumented('fabric_nodes', mos=lambda response, *args: len(response['imdata']))
+def get_fabric_node_by_id(session, node_id):
     '''Gets a specific node with id equal to the value passed in
     :param node_id: the node_id of the desired node'''
-    token = get_token()
-    url = f"{base}/node/class/fabricNode.json?query-target-filter=and(ne(fabricNode.role, %22controller%22),eq(fabricNode.id,%22{node_id}%22))"
-    # url = f'{base}/node/class/fabricNode.json?query-target-filter=and(ne(fabricNode.role, %22controller%22), ge(fabricNode.id,%22101%22),le(fabricNode.id,%22202%22))'
-
-    headers = {
-        "Cookie": f"APIC-Cookie={token}",
-    }
-
-    requests.packages.urllib3.disable_warnings()
-    response = requests.get(url, headers=headers, verify=False)
+    url = fabric_node_url(node_id)
+    # url = f'/node/class/fabricNode.json?query-target-filter=and(ne(fabricNode.role, %22controller%22), ge(fabricNode.id,%22101%22),le(fabricNode.id,%22202%22))'
+    response = session.get(url)
 
     return response.json()
 
 
-def get_leaf_switch_profiles():
-    token = get_token()
+@instrumented('switch_profiles', mos=lambda response, *args: len(response['imdata']))
+def get_leaf_switch_profiles(session):
 
     # Get Leaf Switch Profiles
-    url = f"{base}/node/mo/uni/infra.json?query-target=children&target-subtree-class=infraNodeP&query-target-filter" \
-          f"=not(wcard(infraNodeP.dn,%22__ui_%22))&rsp-subtree=full&rsp-subtree-class=infraLeafS,infraRsAccPortP," \
-          f"infraRsAccCardP,infraNodeBlk,infraRsAccNodePGrp&order-by=infraNodeP.name"
-
-    headers = {
-        "Cookie": f"APIC-Cookie={token}",
-    }
-
-    requests.packages.urllib3.disable_warnings()
-    response = requests.get(url, headers=headers, verify=False)
+    response = session.get(LEAF_SWITCH_PROFILES_URL)
 
     return response.json()
 
 
-def get_leaf_interface_profiles():
-    token = get_token()
+@instrumented('interface_profiles', mos=lambda response, *args: len(response['imdata']))
+def get_leaf_interface_profiles(session):
 
     # Get Leaf Interface Profiles
-    url = f'{base}/node/mo/uni/infra.json?query-target=subtree&target-subtree-class=infraAccPortP&query-target-filter' \
-          f'=not(wcard(infraAccPortP.dn,"__ui_"))&query-target=children&target-subtree-class=infraAccPortP&rsp' \
-          f'-subtree=full&rsp-subtree-class=infraHPortS,infraPortBlk,infraRsAccBaseGrp,' \
-          f'infraSubPortBlk&order-by=infraAccPortP.name'
-
-
-    headers = {
-        "Cookie": f"APIC-Cookie={token}",
-    }
-
-    requests.packages.urllib3.disable_warnings()
-    response = requests.get(url, headers=headers, verify=False)
+    response = session.get(LEAF_INTERFACE_PROFILES_URL)
 
     return response.json()
 
 
-def get_vpc_groups():
-    token = get_token()
+@instrumented('vpc_groups', mos=lambda response, *args: len(response['imdata']))
+def get_vpc_groups(session):
 
     # Get VPC Groups
-    url = f'{base}/node/mo/uni/fabric/protpol.json?query-target=subtree'
-
-    headers = {
-        "Cookie": f"APIC-Cookie={token}",
-    }
-
-    requests.packages.urllib3.disable_warnings()
-    response = requests.get(url, headers=headers, verify=False)
+    response = session.get(VPC_GROUPS_URL)
 
     return response.json()
 
 
-def get_static_paths(source_leaf_list):
-    token = get_token()
-    headers = {
-        "Cookie": f"APIC-Cookie={token}",
-    }
-
+@instrumented('static_paths', mos=lambda responses, *args: sum(len(response['imdata']) for response in responses))
+def get_static_paths(session, source_leaf_list):
     responses = []
     # Get VPC Groups
     for path in source_leaf_list:
-        path_url = f"/paths-{path}"
-        vpc_path_url = f"/protpaths-{path}"
-        url = f'{base}/class/fvRsPathAtt.json?query-target-filter=or(wcard(fvRsPathAtt.tDn,"{path_url}"),wcard(fvRsPathAtt.tDn,"{vpc_path_url}"))'
-        requests.packages.urllib3.disable_warnings()
-        response = requests.get(url, headers=headers, verify=False)
+        response = session.get(static_paths_url(path))
         responses.append(response.json())
 
     return responses
 
-def get_vpc_static_paths(source_leaf_list):
-    token = get_token()
-    headers = {
-        "Cookie": f"APIC-Cookie={token}",
-    }
-
+@instrumented('static_paths', mos=lambda responses, *args: sum(len(response['imdata']) for response in responses))
+def get_vpc_static_paths(session, source_leaf_list):
     responses = []
     # Get VPC Groups
     for path in source_leaf_list:
-        path_url = f"/protpaths-{path}"
-        url = f'{base}/class/fvRsPathAtt.json?query-target-filter=wcard(fvRsPathAtt.tDn,"{path_url}")'
-        requests.packages.urllib3.disable_warnings()
-        response = requests.get(url, headers=headers, verify=False)
+        response = session.get(vpc_static_paths_url(path))
         responses.append(response.json())
 
     return responses
 
 
+@instrumented('migrate_target')
+def migrate_target(session, inventory, target, vpc_id=None, static_index=None, writer=None, optimizer=None):
+    '''Migrates the fabric access policies and static paths of one MigrationTargets.txt line.
+    :param inventory = FabricInventory of the fabric, updated with the objects created
+    :param target = MigrationTarget with the source and destination nodes, and optional pod and prefix overrides
+    :param vpc_id = pre-allocated VPC protection group id, required when target.vpc
+    :param static_index = optional StaticBindingIndex of all static bindings, queried per source node if not given
+    :param writer = LiveWriter to create the objects on the APIC (default) or PlanWriter to only record them
+    :param optimizer = optional SelectorOptimizer coalescing the port selectors and sharing identical interface profiles
+    Returns False if the migration could not be started'''
+    writer = writer or LiveWriter(session)
+
+    # 1. Get the source and dest nodes, check they exist
+    source_nodes = target.source_nodes
+    dest_nodes = target.dest_nodes
+    vpc = target.vpc
+    sw_prefix, int_prefix, vpc_prefix = target_prefixes(target, switch_profile_prefix, interface_profile_prefix,
+                                                        vpc_group_prefix)
+
+    # Check that Source Nodes Exist!
+    target_nodes = source_nodes.copy()
+    for node in target_nodes:
+        if inventory.has_node(node):
+            print(f'Found node (id={node})')
+        else:
+            print(f'Could NOT find Node with id={node}')
+            return False
+
+    # 2a. -----Switch profiles -------
+    # Create Switch and Interface Profile for each Destination node
+    for i in range(len(dest_nodes)):
+        source_profiles = inventory.switch_profiles_for_node(source_nodes[i])
+
+        # 4a. If dest leaf switch profile undefined, create new one.
+        # 5a. Within leaf switch profile, create a switch selector with associated block and policy group
+        # 	Block is the destination NodeID and policy group would be the same policy group as the source leaf.
+        # 	(Current CU config shows no defined policy group so would just use fabric defaults)
+        # 6b. Within leaf switch profile, create a switch selector with associated block and policy group, and add new leaf interface profile.
+        policy_group = [tDn for profile in source_profiles for tDn in profile.policy_group_tDns]
+        policy_group = policy_group[0] if policy_group else None
+        int_profile_name = f"{int_prefix}{dest_nodes[i]}"  # Needs to match when creating both switch profile and int profile
+        if optimizer:
+            int_profile_name = optimizer.int_profile_name(dest_nodes[i], int_profile_name)
+        int_profile_tDn = f'uni/infra/accportprof-{int_profile_name}'
+        # The inventory only records what was written, a failed object is created again by the next line needing it
+        if writer.switch_profile(f'{dest_nodes[i]}', dest_nodes[i], dest_nodes[i], int_profile_tDn=int_profile_tDn,
+                                 policy_group_tDn=policy_group, name_prefix=sw_prefix):
+            inventory.record_switch_profile(f'{sw_prefix}{dest_nodes[i]}', dest_nodes[i],
+                                            int_profile_tDn=int_profile_tDn, policy_group_tDn=policy_group)
+
+        # 6. -----Interface Profiles------
+        # 7. Read source switch int profile, storing int profile and int selectors
+        # GET associated int profiles based on switch profile
+        source_int_profiles_tDns = [tDn for profile in source_profiles for tDn in profile.int_profile_tDns]
+        int_profiles = inventory.interface_profiles(source_int_profiles_tDns)
+
+        # 8. Copy selector data from source int profile and create same selector data in dest int profile (exactly the same as source)
+        port_selectors = [sel for profile in int_profiles for sel in profile.port_selectors] # List of PortSelectors
+        if optimizer:
+            port_selectors = optimizer.port_selectors(port_selectors)
+            if dest_nodes[i] in optimizer.shared_names and int_profile_tDn in inventory.int_profiles_by_dn:
+                print(f'Interface profile {int_profile_name} is shared, already created')
+                continue
+        if writer.int_profile(int_profile_name, port_selectors):
+            inventory.record_int_profile(int_profile_name, port_selectors)
+
+    # If a pair is provided, create VPC protection group
+    if vpc:
+        vpc_name = f"{vpc_prefix}{'-'.join([str(element) for element in dest_nodes])}"
+        pod = target.pod or inventory.node_pod(dest_nodes[0]) or '1'
+
+        # Create VPC Protection
+        if writer.vpc_group(vpc_name, vpc_id, dest_nodes, podId=pod):
+            inventory.record_vpc_group(vpc_name, vpc_id, dest_nodes)
+
+    # 9. ----Overlay----
+    # 10. Cycle through Tenants and EPGs locating static path references to Paths from source leafs (will be in the the path data).
+    # Create new paths using same encapsulation data but with updated path the new leaf.
+    if static_index is not None:
+        static_bindings = static_index.bindings_for_sources(source_nodes)
+    else:
+        static_bindings = [StaticBinding.from_mo(path) for resp in get_static_paths(session, source_nodes)
+                           for path in resp['imdata']]
+
+    # Create equivalent path for destination nodes. Only the node ids in the dn/tDn of each path are swapped
+    # (paths-<node> for single nodes, protpaths-<node1>-<node2> for VPC pairs)
+    mapping = node_mapping(source_nodes, dest_nodes)
+    new_paths = [new_path for new_path in (rewrite_binding(path, mapping) for path in static_bindings) if new_path]
+    writer.static_paths(new_paths)
+    if static_index is not None:
+        static_index.add(new_paths)
+    print(f'Fabric Access Migration Complete for source nodes {source_nodes} and destination nodes {dest_nodes}')
+    return True
 
 
 if __name__ == '__main__':
-    # # Dump current config into backup file
-    save_aci_config_snapshot()
-
-    # Initialize Session with Cobra SDK and APIC
-    ls = cobra.mit.session.LoginSession(apic, user, password)
-    md = cobra.mit.access.MoDirectory(ls)
-    md.login()
-
-
-    # Process input file
-    with open(spec_file, 'r') as fp:
-        Lines = fp.readlines()
-        for line in Lines:
-            line = line.replace(' ', '').replace('\n', '')
-            if line and not line.startswith('#'): # Skip commented and blank lines
-
-                # 1. Get the source and dest nodes, check they exist
-                source_nodes = []
-                dest_nodes = []
-                vpc = False
-
-                line = line.split(',')
-                if len(line) == 2:
-                    source_nodes.append(line[0])
-                    dest_nodes.append(line[1])
-                elif len(line) == 4:
-                    source_nodes.append(line[0])
-                    source_nodes.append(line[1])
-                    dest_nodes.append(line[2])
-                    dest_nodes.append(line[3])
-                    vpc = True
-                    source_nodes.sort(
-                        key=int)  # Ensure the list is in ascending order (first node ID cannot be lower than 2nd ID)
-                    dest_nodes.sort(
-                        key=int)  # Ensure the list is in ascending order (first node ID cannot be lower than 2nd ID)
-                else:
-                    print(f'ERROR: Incorrect number of nodes!)'
-                          f'Input received was {line}')
-                    print('Please specify either 1 or 2 source/destination node IDs')
-                    exit()
-
-                # Check that Source Nodes Exist!
-                target_nodes = source_nodes.copy()
-                for node in target_nodes:
-                    search_result = get_fabric_node_by_id(node)
-                    if search_result['imdata']:
-                        print(f'Found node (id={node})')
-                    else:
-                        print(f'Could NOT find Node with id={node}')
-                        print('Exiting migration')
-                        exit()
-
-                # 2a. -----Switch profiles -------
-                switch_profiles = get_leaf_switch_profiles()
-                all_interface_profiles = get_leaf_interface_profiles()
-
-                # Create Switch and Interface Profile for each Destination node
-                for i in range(len(dest_nodes)):
-                    # Initialize a list to store json data of destination profiles if they exist
-                    dest_profiles = []
-                    source_profiles = []
-                    # 3a. Check if dest leaf has defined switch profile (checked via Leaf Selector Blocks)
-                    for profile in switch_profiles['imdata']:
-                        block_from = find_values('from_', json.dumps(profile))[0]
-                        block_to = find_values('to_', json.dumps(profile))[0]
-                        if block_from in source_nodes[i] and block_to in source_nodes[i]:
-                            source_profiles.append(profile)
-                        elif block_from in dest_nodes[i] and block_to in dest_nodes[i]:
-                            dest_profiles.append(profile)
-
-                    # 4a. If dest leaf switch profile undefined, create new one.
-                    # 5a. Within leaf switch profile, create a switch selector with associated block and policy group
-                    # 	Block is the destination NodeID and policy group would be the same policy group as the source leaf.
-                    # 	(Current CU config shows no defined policy group so would just use fabric defaults)
-                    # 6b. Within leaf switch profile, create a switch selector with associated block and policy group, and add new leaf interface profile.
-                    policy_group = [obj['tDn'] for obj in find_values('infraRsAccNodePGrp', json.dumps(source_profiles))]
-                    int_profile_name = f"{interface_profile_prefix}{dest_nodes[i]}"  # Needs to match when creating both switch profile and int profile
-                    create_switch_profile(f'{dest_nodes[i]}', dest_nodes[i], dest_nodes[i], int_profile_tDn=f'uni/infra/accportprof-{int_profile_name}', policy_group_tDn=policy_group)
-
-                    # 6. -----Interface Profiles------
-                    # 7. Read source switch int profile, storing int profile and int selectors
-                    # GET associated int profiles based on switch profile
-                    source_int_profiles_tDns = []
-                    for profile in source_profiles:
-                        for child in profile['infraNodeP']['children']:
-                            if 'infraRsAccPortP' in child:
-                                source_int_profiles_tDns.append(child['infraRsAccPortP']['attributes']['tDn'])
-
-                    # all_interface_profiles = get_leaf_interface_profiles()
-                    int_profiles = []
-                    for profile in all_interface_profiles['imdata']:
-                        # print(profile['infraAccPortP']['attributes']['dn'])
-                        if profile['infraAccPortP']['attributes']['dn'] in source_int_profiles_tDns:
-                            int_profiles.append(profile)
-
-                    # 8. Copy selector data from source int profile and create same selector data in dest int profile (exactly the same as source)
-                    port_selectors = [] # List of port selector dicts
-                    for profile in int_profiles:
-                        for infraHPorts in profile['infraAccPortP']['children']:   # All children are infraHPorts
-                            port_selector = {'blocks': [], "attributes": infraHPorts['infraHPortS']['attributes']}
-                            for detail in infraHPorts['infraHPortS']['children']:
-                                if 'infraRsAccBaseGrp' in detail.keys():
-                                    port_selector['policy'] = detail['infraRsAccBaseGrp']['attributes']
-                                elif 'infraPortBlk' in detail.keys():
-                                    port_selector['blocks'].append(detail['infraPortBlk']['attributes'])
-                            port_selectors.append(port_selector)
-                    create_int_profile(int_profile_name, port_selectors)
-
-                # If a pair is provided, create VPC protection group
-                if vpc:
-                    pods = md.lookupByClass("fabricExplicitGEp")
-                    used_ids = []
-                    for pod in pods:
-                        used_ids.append(int(pod.id))
-
-                    # Get the lowest unused Id
-                    m = range(1, len(used_ids)+2)
-                    id = min(set(m) - set(used_ids))
-                    vpc_name = f"{vpc_group_prefix}{'-'.join([str(element) for element in dest_nodes])}"
-
-                    # Create VPC Protection
-                    create_vpc_group(vpc_name, id, dest_nodes, podId='1')
-
-                # 9. ----Overlay----
-                # 10. Cycle through Tenants and EPGs locating static path references to Paths from source leafs (will be in the the path data).
-                # Create new paths using same encapsulation data but with updated path the new leaf.
-                overlay_source_nodes = source_nodes.copy()
-                overlay_dest_nodes = dest_nodes.copy()
-                if vpc:
-                    overlay_source_nodes.append(f'{source_nodes[0]}-{source_nodes[1]}')
-                    overlay_dest_nodes.append(f'{dest_nodes[0]}-{dest_nodes[1]}')
-
-                static_bindings_responses = get_static_paths(source_nodes)
-                # print(json.dumps(static_bindings_responses))
-
-                new_path_dicts = []
-                # Create equivalent path for destination nodes
-                for resp in static_bindings_responses:
-                    for path in resp['imdata']:
-                        # print(path['fvRsPathAtt']['attributes']['dn'])
-                        new_path = json.dumps(path.copy())
-                        for j in range(len(overlay_dest_nodes)): # Need to replace references to the old path with the new one (if the reference exists)
-                            new_path = new_path.replace(f'/paths-{overlay_source_nodes[j]}/', f'/paths-{overlay_dest_nodes[j]}/') # single node uses paths
-                            new_path = new_path.replace(f'/protpaths-{overlay_source_nodes[j]}/', f'/protpaths-{overlay_dest_nodes[j]}/') # VPC uses protpaths
-                        new_path_dicts.append(json.loads(new_path))
-                create_static_paths(new_path_dicts)
-                print(f'Fabric Access Migration Complete for source nodes {source_nodes} and destination nodes {dest_nodes}')
+    parser = argparse.ArgumentParser(description='ACI Fabric Access Policy and Static Port Migration')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of independent source/destination pairs to migrate concurrently')
+    parser.add_argument('--bulk-static-paths', action='store_true',
+                        help='Fetch all static bindings once with a paginated query instead of one query per source node')
+    parser.add_argument('--coalesce-selectors', action='store_true',
+                        help='Merge the port selectors sharing a policy group and their adjacent port blocks into ranges')
+    parser.add_argument('--share-int-profiles', action='store_true',
+                        help='Destination nodes with identical port selectors reference one shared interface profile '
+                             'instead of a copy each')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--plan', metavar='PLAN_FILE',
+                      help='Only compute the objects the migration would create, write them to PLAN_FILE and print the '
+                           'diff against the fabric. Nothing is committed')
+    mode.add_argument('--apply', metavar='PLAN_FILE', help='Push a plan computed with --plan using batched commits')
+    mode.add_argument('--resume', action='store_true',
+                      help='Continue an interrupted migration, skipping the steps recorded in the journal')
+    mode.add_argument('--rollback', metavar='PLAN_OR_LOG', nargs='?', const=created_objects_file,
+                      help='Delete the objects created by the last run (default: the created objects log, '
+                           f'{created_objects_file}) or by a plan file, with batched deletes')
+    mode.add_argument('--verify', action='store_true',
+                      help='Compare the source and destination selectors and static bindings of every line and print '
+                           'an equivalence report. Nothing is committed')
+    parser.add_argument('--verify-report', metavar='VERIFY_FILE', help='Also write the --verify report as JSON')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Read the fabric state and push --apply plans with concurrent asyncio requests (requires aiohttp)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Max concurrent APIC requests with --async')
+    parser.add_argument('--cache', metavar='CACHE_FILE', nargs='?', const='fabric_cache.sqlite',
+                        help='Keep the access policies and static bindings in a local SQLite cache and only read the '
+                             'objects changed since the previous run (default file: fabric_cache.sqlite)')
+    parser.add_argument('--report', metavar='REPORT_FILE',
+                        help='Write a JSON run report with time, requests, bytes, latency and MO counts per phase and line')
+    parser.add_argument('--prometheus', metavar='METRICS_FILE',
+                        help='Write the run metrics in the Prometheus text format (ex: for the node_exporter textfile collector)')
+    args = parser.parse_args()
+
+    # Initialize one pooled session shared by the REST queries and the Cobra SDK
+    session = ApicSession(apic, user, password, pool_size=max(10, args.workers * 2),
+                          requests_per_second=apic_requests_per_second)
+
+    # Config snapshot export, tracked in the background and waited for before the first write
+    snapshot = None
+    # Interface profile reduction, computed once the targets are validated
+    optimizer = None
+
+    if args.report or args.prometheus:
+        # Written on every exit, including the early ones, so failed runs are reported too
+        mode = 'apply' if args.apply else 'plan' if args.plan else 'verify' if args.verify else \
+            'rollback' if args.rollback else 'migrate'
+        atexit.register(lambda: METRICS.write(args.report, args.prometheus, apic=apic, mode=mode,
+                                              workers=args.workers, session=session.stats(),
+                                              snapshot=snapshot.summary() if snapshot else None,
+                                              selectors=optimizer.summary() if optimizer else None))
+
+    if args.rollback:
+        with open(args.rollback, 'r') as fp:
+            is_plan = 'plan' in json.loads(fp.readline() or '{}')
+        changes = read_plan(args.rollback)[1] if is_plan else read_created_objects(args.rollback)
+        deletes = rollback_changes(changes)
+        if not deletes:
+            print(f'Nothing to roll back in {args.rollback}')
+            session.close()
+            exit()
+        print(f"Rolling back {len(deletes)} objects created by {'plan ' if is_plan else ''}{args.rollback}")
+        apply_rollback(session, deletes, workers=max(args.workers, 4))
+        print(f"APIC session: {session.stats()}")
+        session.close()
+        exit()
+
+    if args.apply:
+        snapshot = SnapshotWatcher(session, lambda: save_aci_config_snapshot(session), timeout=snapshot_timeout).start()
+        header, changes = read_plan(args.apply)
+        print(f"Applying plan {args.apply} computed {header['created']} ({len(changes)} objects)")
+        if not snapshot.wait():
+            print('Nothing was written to the fabric')
+            session.close()
+            exit(1)
+        created = CreatedObjectsLog(created_objects_file)
+        log_created = lambda batch: created.record(change for change in batch if change['action'] == 'create')
+        if args.use_async:
+            from apic_async import AsyncApicSession
+
+            async def apply_async():
+                async with AsyncApicSession(apic, user, password, concurrency=args.concurrency) as async_session:
+                    return await apply_plan_async(async_session, changes, on_commit=log_created)
+
+            with METRICS.phase('apply_plan'):
+                asyncio.run(apply_async())
+        else:
+            apply_plan(session, changes, on_commit=log_created)
+        created.close()
+        print(f"Plan applied, {created.count} new objects logged in {created_objects_file} for --rollback. "
+              f"Please verify results through the APIC GUI")
+        print(f"APIC session: {session.stats()}")
+        session.close()
+        exit()
+
+    if not args.plan and not args.verify:
+        # The export runs on the APIC while the fabric is read and the targets validated
+        snapshot = SnapshotWatcher(session, lambda: save_aci_config_snapshot(session), timeout=snapshot_timeout).start()
+
+    # Fetch the fabric inventory once, every target line is answered from memory.
+    # Queries are paginated and parsed incrementally so memory stays bounded on large fabrics
+    static_index = None
+    if args.cache:
+        # Only the objects changed since the previous run are read, fabric nodes are small and always read live
+        cache = FabricCache(args.cache, apic, max_age=fabric_cache_max_age)
+        with METRICS.phase('inventory'):
+            inventory = FabricInventory.from_mos(iter_query(session, FABRIC_NODES_URL),
+                                                 cache.mos(session, 'switch_profiles'),
+                                                 cache.mos(session, 'interface_profiles'),
+                                                 cache.mos(session, 'vpc_groups'))
+        with METRICS.phase('static_paths'):
+            static_index = StaticBindingIndex.from_bindings(cache.mos(session, 'static_bindings'))
+        print(f'Fabric cache {args.cache}: ' +
+              ', '.join(f'{name} {kind} ({count} objects)' for name, (kind, count) in cache.stats.items()))
+        cache.close()
+    elif args.use_async:
+        # All the queries and their pages are in flight at once, static bindings are always fetched in bulk
+        from apic_async import AsyncApicSession, get_fabric_state
+
+        async def fetch_state():
+            async with AsyncApicSession(apic, user, password, concurrency=args.concurrency) as async_session:
+                return await get_fabric_state(async_session, page_size=DEFAULT_PAGE_SIZE)
+
+        with METRICS.phase('inventory'):
+            state = asyncio.run(fetch_state())
+            inventory = FabricInventory.from_mos(state['fabric_nodes'], state['switch_profiles'],
+                                                 state['interface_profiles'], state['vpc_groups'])
+            static_index = StaticBindingIndex.from_bindings(state['static_bindings'])
+    else:
+        with METRICS.phase('inventory'):
+            inventory = FabricInventory.from_mos(iter_query(session, FABRIC_NODES_URL),
+                                                 iter_query(session, LEAF_SWITCH_PROFILES_URL),
+                                                 iter_query(session, LEAF_INTERFACE_PROFILES_URL),
+                                                 iter_query(session, VPC_GROUPS_URL))
+
+        if args.bulk_static_paths or args.plan or args.verify:
+            with METRICS.phase('static_paths'):
+                static_index = StaticBindingIndex.from_bindings(iter_static_bindings(session))
+
+    if args.verify:
+        # Reads only, both sides of every line are compared from the state read above
+        targets, errors = parse_targets(spec_file)
+        if errors:
+            print(f'ERROR: {spec_file} has {len(errors)} problems:')
+            for error in errors:
+                print(f'  {error}')
+            session.close()
+            exit(1)
+        if args.coalesce_selectors or args.share_int_profiles:
+            optimizer = SelectorOptimizer(inventory, args.coalesce_selectors, args.share_int_profiles)
+            optimizer.plan(targets, interface_profile_prefix)
+        with METRICS.phase('verify'):
+            reports = verify_targets(inventory, static_index, targets, switch_profile_prefix,
+                                     interface_profile_prefix, vpc_group_prefix, optimizer)
+        print_verify_report(reports)
+        if args.verify_report:
+            with open(args.verify_report, 'w') as fp:
+                json.dump(reports, fp, indent=2)
+            print(f'Verification report written to {args.verify_report}')
+        session.close()
+        exit()
+
+    # Process input file. Every line is validated and every VPC id allocated before the first write,
+    # all the errors are reported at once
+    targets, errors = parse_targets(spec_file)
+    errors += validate_targets(targets, inventory, vpc_group_prefix)
+    vpc_ids = allocate_vpc_ids(targets, inventory, vpc_group_prefix, errors)
+    if errors:
+        print(f'ERROR: {spec_file} has {len(errors)} problems, nothing was changed on the fabric:')
+        for error in errors:
+            print(f'  {error}')
+        session.close()
+        exit(1)
+    print(f'Validated {len(targets)} lines of {spec_file}')
+    if args.coalesce_selectors or args.share_int_profiles:
+        optimizer = SelectorOptimizer(inventory, args.coalesce_selectors, args.share_int_profiles)
+        optimizer.plan(targets, interface_profile_prefix)
+        optimizer.print_summary()
+
+    if snapshot and not snapshot.wait():
+        print('Nothing was written to the fabric')
+        session.close()
+        exit(1)
+
+    if args.plan:
+        # Reads only, every object is recorded against the state read above
+        writer = PlanWriter(inventory, static_index)
+        for target in targets:
+            writer.line = target.line
+            with METRICS.line(target.line):
+                planned = migrate_target(session, inventory, target, vpc_ids.get(target.line), static_index, writer,
+                                         optimizer)
+            if planned is False:
+                print('Exiting migration')
+                exit(1)
+        write_plan(args.plan, writer.changes, apic=apic, spec_file=spec_file)
+        print_plan_diff(writer.changes)
+        print(f"Plan written to {args.plan}. Push it with: python3 fabric_migration.py --apply {args.plan}")
+        session.close()
+        exit()
+
+    # Every committed step is checkpointed so an interrupted run can be continued with --resume
+    journal = MigrationJournal(journal_file, resume=args.resume)
+    if journal.replayed:
+        print(f'Resuming from {journal_file}: {journal.replayed} journal entries replayed')
+    # New objects are logged so the run can be undone with --rollback
+    created = CreatedObjectsLog(created_objects_file, resume=args.resume)
+
+    def migrate(target):
+        if journal.target_done(target):
+            print(f'Line {target.line} already migrated according to the journal, skipping')
+            return True
+        writer = LiveWriter(session, journal, target, created, inventory, static_index)
+        with METRICS.line(target.line):
+            migrated = migrate_target(session, inventory, target, vpc_ids.get(target.line), static_index, writer,
+                                      optimizer)
+        if migrated and writer.complete:
+            journal.record(target, 'done')
+            return True
+        # Objects that could not be committed fail the line, so the lines depending on it are skipped
+        return False
+
+    failed = []
+    if args.workers > 1:
+        results = run_targets(targets, migrate, args.workers, inventory, interface_profile_prefix,
+                              switch_profile_prefix, vpc_group_prefix, optimizer.shared_names if optimizer else None)
+        failed = [target.line for target in targets if not results.get(target.line)]
+        if failed:
+            print(f'Migration FAILED for lines {failed} of {spec_file}')
+    else:
+        for target in targets:
+            if migrate(target) is False:
+                print(f'Migration FAILED for line {target.line} of {spec_file}, exiting migration')
+                exit(1)
+    journal.close()
+    created.close()
     print("Complete Migration Complete. Please verify results through the APIC GUI")
-    md.logout()
+    print(f"{created.count} new objects logged in {created_objects_file}, undo with: python3 fabric_migration.py --rollback")
+    print(f"APIC session: {session.stats()}")
+    session.close()
+    if failed:
+        exit(1)
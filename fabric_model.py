@@ -0,0 +1,184 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Compact model of the fabric objects the migration reads and copies. Every class keeps one slot per attribute the
+# migration configures (the limit_keys of the create_* functions) instead of the full imdata attribute dict
+# (status, modTs, uid, lcOwn, childAction...), and the dns and values repeated across objects (policy group tDns,
+# path tDns, encaps, EPG dns) are interned so every object points to one copy. Objects convert to REST payloads and
+# Cobra MOs directly.
+
+import importlib
+import re
+import sys
+
+_COBRA_CLASS = re.compile(r'^([a-z]+)([A-Z]\w*)$')
+_ALL_SLOTS = {}   # class -> its slots and the slots of its bases
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class ModelObject:
+    '''Base of the model classes: the configurable attributes of APIC class CLASS are the slots listed in FIELDS,
+    None when the source object does not have them. Subclasses add slots for their children'''
+    __slots__ = ()
+    CLASS = None
+    FIELDS = ()
+
+    def __init__(self, **values):
+        for slot in self._all_slots():
+            setattr(self, slot, _intern(values.get(slot)))
+
+    @classmethod
+    def _all_slots(cls):
+        slots = _ALL_SLOTS.get(cls)
+        if slots is None:
+            slots = _ALL_SLOTS[cls] = tuple(slot for klass in reversed(cls.__mro__)
+                                            for slot in getattr(klass, '__slots__', ()))
+        return slots
+
+    @classmethod
+    def from_attributes(cls, attributes, **children):
+        '''Builds the object from an imdata attribute dict, keeping only FIELDS'''
+        return cls(**{field: attributes[field] for field in cls.FIELDS if field in attributes}, **children)
+
+    def attributes(self):
+        '''Configurable attributes that are set, ex: for a payload or Cobra MO'''
+        return {field: getattr(self, field) for field in self.FIELDS if getattr(self, field) is not None}
+
+    def replace(self, **values):
+        '''Copy of the object with some slots changed'''
+        return type(self)(**dict({slot: getattr(self, slot) for slot in self._all_slots()}, **values))
+
+    def payload(self):
+        return {self.CLASS: {'attributes': self.attributes()}}
+
+    def cobra_mo(self, parent):
+        '''Cobra MO of the object under parent (a Cobra MO or dn string)'''
+        package, name = _COBRA_CLASS.match(self.CLASS).groups()
+        return getattr(importlib.import_module(f'cobra.model.{package}'), name)(parent, **self.attributes())
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            all(getattr(self, slot) == getattr(other, slot) for slot in self._all_slots())
+
+    def __hash__(self):
+        # Objects are not modified once built (replace() returns a copy), so they can key dicts
+        return hash((type(self),) + tuple(getattr(self, slot) for slot in self._all_slots()))
+
+    def __repr__(self):
+        values = ', '.join(f'{slot}={getattr(self, slot)!r}' for slot in self._all_slots() if getattr(self, slot) is not None)
+        return f'{type(self).__name__}({values})'
+
+
+class PortBlock(ModelObject):
+    __slots__ = ('annotation', 'descr', 'name', 'nameAlias', 'fromCard', 'fromPort', 'toCard', 'toPort')
+    CLASS = 'infraPortBlk'
+    FIELDS = __slots__
+
+
+class PolicyGroupRelation(ModelObject):
+    '''infraRsAccBaseGrp of a port selector: its access port or port channel policy group'''
+    __slots__ = ('annotation', 'tDn', 'fexId')
+    CLASS = 'infraRsAccBaseGrp'
+    FIELDS = __slots__
+
+
+class PortSelector(ModelObject):
+    '''infraHPortS with its policy group relation (or None) and port blocks'''
+    __slots__ = ('annotation', 'descr', 'name', 'nameAlias', 'ownerKey', 'ownerTag', 'type', 'policy', 'blocks')
+    CLASS = 'infraHPortS'
+    FIELDS = __slots__[:-2]
+
+    @classmethod
+    def from_mo(cls, mo):
+        '''Builds a PortSelector from an infraHPortS dict with its children'''
+        policy = None
+        blocks = []
+        for child in mo['infraHPortS'].get('children', []):
+            if 'infraRsAccBaseGrp' in child:
+                policy = PolicyGroupRelation.from_attributes(child['infraRsAccBaseGrp']['attributes'])
+            elif 'infraPortBlk' in child:
+                blocks.append(PortBlock.from_attributes(child['infraPortBlk']['attributes']))
+        return cls.from_attributes(mo['infraHPortS']['attributes'], policy=policy, blocks=tuple(blocks))
+
+    def mo_count(self):
+        return 1 + (self.policy is not None) + len(self.blocks)
+
+    def payload(self):
+        children = [self.policy.payload()] if self.policy is not None else []
+        children.extend(block.payload() for block in self.blocks)
+        return {self.CLASS: {'attributes': self.attributes(), 'children': children}}
+
+    def cobra_mo(self, parent):
+        mo = super().cobra_mo(parent)
+        if self.policy is not None:
+            self.policy.cobra_mo(mo)
+        for block in self.blocks:
+            block.cobra_mo(mo)
+        return mo
+
+
+class NodeProfile(ModelObject):
+    '''infraNodeP reduced to what the migration reads: its node blocks (from, to), the policy groups of its leaf
+    selectors and the interface profiles it references'''
+    __slots__ = ('name', 'dn', 'node_blocks', 'policy_group_tDns', 'int_profile_tDns')
+    CLASS = 'infraNodeP'
+    FIELDS = ('name',)
+
+    def __init__(self, name, dn, node_blocks=(), policy_group_tDns=(), int_profile_tDns=()):
+        super().__init__(name=name, dn=dn)
+        self.node_blocks = tuple((_intern(block_from), _intern(block_to)) for block_from, block_to in node_blocks)
+        self.policy_group_tDns = tuple(_intern(tDn) for tDn in policy_group_tDns)
+        self.int_profile_tDns = tuple(_intern(tDn) for tDn in int_profile_tDns)
+
+
+class InterfaceProfile(ModelObject):
+    '''infraAccPortP with its port selectors'''
+    __slots__ = ('name', 'dn', 'port_selectors')
+    CLASS = 'infraAccPortP'
+    FIELDS = ('name',)
+
+    def __init__(self, name, dn, port_selectors=()):
+        super().__init__(name=name, dn=dn)
+        self.port_selectors = tuple(port_selectors)
+
+
+class VpcGroup(ModelObject):
+    '''fabricExplicitGEp, a VPC explicit protection group'''
+    __slots__ = ('name', 'dn', 'id')
+    CLASS = 'fabricExplicitGEp'
+    FIELDS = ('name', 'id')
+
+
+class StaticBinding(ModelObject):
+    '''fvRsPathAtt. Its dn (<EPG dn>/rspathAtt-[<tDn>]) is not stored: the EPG dn and the path tDn are, both interned
+    since every EPG has many bindings and every path is bound in many EPGs'''
+    __slots__ = ('annotation', 'descr', 'encap', 'instrImedcy', 'mode', 'primaryEncap', 'tDn', 'parent_dn')
+    CLASS = 'fvRsPathAtt'
+    FIELDS = __slots__[:-1]
+
+    @classmethod
+    def from_mo(cls, mo):
+        '''Builds a StaticBinding from an {'fvRsPathAtt': {'attributes': {...}}} dict'''
+        attributes = mo['fvRsPathAtt']['attributes']
+        return cls.from_attributes(attributes, parent_dn=attributes['dn'].partition('/rspathAtt-[')[0])
+
+    @property
+    def dn(self):
+        return f'{self.parent_dn}/rspathAtt-[{self.tDn}]'
+
+    def payload(self):
+        return {self.CLASS: {'attributes': dict(self.attributes(), dn=self.dn)}}
@@ -0,0 +1,154 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+import json
+import os
+import threading
+import time
+
+# Steps of a target line recorded in the journal
+STEPS = ('switch_profile', 'int_profile', 'vpc_group', 'static_paths', 'done')
+
+
+def target_key(target):
+    '''Identifies a MigrationTargets.txt line by its nodes rather than its line number, so a journal still applies
+    after comments or blank lines were added to the file (ex: 101,102>501,502)'''
+    return f"{','.join(str(node) for node in target.source_nodes)}>{','.join(str(node) for node in target.dest_nodes)}"
+
+
+class MigrationJournal:
+    '''Append-only journal of the completed steps of a migration, one JSON entry per line.
+    Every entry is flushed and fsynced when it is written, which is after each committed object or static path
+    batch, so a run that dies keeps everything it committed. Replaying the journal with resume=True lets the next
+    run skip the finished work.
+    :param path = journal file
+    :param resume = replay an existing journal and append to it, otherwise start a new one'''
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._steps = set()        # (target key, step, key)
+        self._static_paths = {}    # target key -> set of committed static path dns
+        self._done = set()         # target keys
+        self.replayed = 0
+        if resume and os.path.exists(path):
+            self._replay()
+        self._fp = open(path, 'a' if resume else 'w')
+
+    def _replay(self):
+        with open(self.path, 'r') as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last entry of a run that died while writing it, the step is redone
+                    continue
+                self._apply(entry)
+                self.replayed += 1
+
+    def _apply(self, entry):
+        target, step = entry['target'], entry['step']
+        if step == 'done':
+            self._done.add(target)
+        elif step == 'static_paths':
+            self._static_paths.setdefault(target, set()).update(entry['dns'])
+        else:
+            self._steps.add((target, step, entry['key']))
+
+    def record(self, target, step, key=None, **details):
+        '''Appends a completed step and syncs it to disk before returning'''
+        entry = {'ts': time.strftime('%Y-%m-%dT%H:%M:%S'), 'line': target.line, 'target': target_key(target),
+                 'step': step, 'key': key, **details}
+        with self._lock:
+            self._fp.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+            self._apply(entry)
+
+    def is_done(self, target, step, key=None):
+        return (target_key(target), step, key) in self._steps
+
+    def target_done(self, target):
+        return target_key(target) in self._done
+
+    def committed_static_paths(self, target):
+        return self._static_paths.get(target_key(target), set())
+
+    def close(self):
+        self._fp.close()
+
+
+def _rotated_name(path):
+    '''Free name of a log stamped with its last modification time, ex: created_objects.20210914-103000.jsonl'''
+    root, extension = os.path.splitext(path)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(os.path.getmtime(path)))
+    name = f'{root}.{stamp}{extension}'
+    number = 1
+    while os.path.exists(name):
+        number += 1
+        name = f'{root}.{stamp}-{number}{extension}'
+    return name
+
+
+class CreatedObjectsLog:
+    '''Append-only log of the top-level objects a run created, one plan change ({'line', 'step', 'parent', 'mo'})
+    per line, read by --rollback. Objects that already existed and were merged into are not logged, so a rollback
+    never deletes configuration the run did not create. Entries are synced to disk after every commit.
+    :param path = log file
+    :param resume = append to an existing log, otherwise start a new one. The log of the previous run is then kept
+    under a timestamped name (ex: created_objects.20210914-103000.jsonl) so it can still be rolled back'''
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.count = 0
+        self.rotated = None   # Name the previous log was moved to
+        self._lock = threading.Lock()
+        if not resume and os.path.exists(path) and os.path.getsize(path):
+            self.rotated = _rotated_name(path)
+            os.replace(path, self.rotated)
+            print(f'Objects created by the previous run moved to {self.rotated}, '
+                  f'undo them with: python3 fabric_migration.py --rollback {self.rotated}')
+        self._fp = open(path, 'a' if resume else 'w')
+
+    def record(self, changes):
+        '''Appends the changes of one commit, without their children, and syncs them before returning'''
+        lines = []
+        for change in changes:
+            (class_name, body), = change['mo'].items()
+            lines.append(json.dumps({'ts': time.strftime('%Y-%m-%dT%H:%M:%S'), 'line': change.get('line'),
+                                     'step': change['step'], 'parent': change['parent'],
+                                     'mo': {class_name: {'attributes': body['attributes']}}},
+                                    separators=(',', ':')) + '\n')
+        if not lines:
+            return
+        with self._lock:
+            self._fp.writelines(lines)
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+            self.count += len(lines)
+
+    def close(self):
+        self._fp.close()
+
+
+def read_created_objects(path):
+    '''Reads a CreatedObjectsLog. Returns the list of changes, skipping a torn last entry'''
+    changes = []
+    with open(path, 'r') as fp:
+        for line in fp:
+            try:
+                changes.append(json.loads(line))
+            except ValueError:
+                continue
+    return changes
@@ -0,0 +1,393 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ACI_create_objects import (commit_in_batches, create_int_profile, create_static_paths, create_switch_profile,
+                                create_vpc_group, int_profile_payload, print_batch_report, static_path_batch_size,
+                                static_path_payload, switch_profile_payload, vpc_group_payload)
+from apic_queries import static_paths_url
+from run_metrics import instrumented
+
+PLAN_VERSION = 1
+
+# Classes of the containers between a batch root and the objects the migration creates
+_RN_CLASSES = (('tn-', 'fvTenant'), ('ap-', 'fvAp'), ('epg-', 'fvAEPg'))
+_ROOT_CLASSES = {'uni/infra': 'infraInfra', 'uni/fabric/protpol': 'fabricProtPol'}
+# Roots are applied in this order, tenants (static paths) last as they use the VPC groups
+_ROOT_ORDER = ('uni/infra', 'uni/fabric/protpol')
+# Naming properties of the objects the migration creates, the only attributes a delete needs
+NAMING_PROPERTIES = {'infraNodeP': ('name',), 'infraAccPortP': ('name',), 'fabricExplicitGEp': ('name',),
+                     'fvRsPathAtt': ('tDn',)}
+
+
+class LiveWriter:
+    '''Writes the objects of a migration to the APIC through the create_* functions.
+    With a journal, every committed step of the target is checkpointed and the steps the journal already holds
+    (from an interrupted run) are skipped. switch_profile(), int_profile() and vpc_group() return False when the object
+    could not be committed. With a created objects log, every committed object that did not exist before the run is
+    logged for --rollback.
+    :param journal = optional MigrationJournal
+    :param target = MigrationTarget being written, required with a journal or a created objects log
+    :param created = optional CreatedObjectsLog
+    :param inventory = FabricInventory read before the migration, to tell new objects from existing ones
+    :param static_index = optional StaticBindingIndex of the fabric, the destination nodes are queried without it'''
+
+    def __init__(self, session, journal=None, target=None, created=None, inventory=None, static_index=None):
+        self.session = session
+        self.journal = journal
+        self.target = target
+        self.created = created
+        self.inventory = inventory
+        self.static_index = static_index
+        self.complete = True   # False once any object could not be committed
+
+    def _skip(self, step, key):
+        if self.journal and self.journal.is_done(self.target, step, key):
+            print(f'Skipping {step} {key}, already committed according to the journal')
+            return True
+        return False
+
+    def _record(self, step, key, **details):
+        if self.journal:
+            self.journal.record(self.target, step, key, **details)
+
+    def _log_created(self, step, payload, exists):
+        if self.created and not exists:
+            parent, mo = payload
+            self.created.record([{'line': self.target.line, 'step': step, 'parent': parent, 'mo': mo}])
+
+    def switch_profile(self, node_name, from_block, to_block, int_profile_tDn=None, policy_group_tDn=None,
+                       name_prefix=None):
+        if self._skip('switch_profile', node_name):
+            return True
+        payload = switch_profile_payload(node_name, from_block, to_block, int_profile_tDn, policy_group_tDn,
+                                         name_prefix)
+        exists = self.created and _mo_dn(payload[1]) in self.inventory.switch_profiles_by_dn
+        if create_switch_profile(self.session, node_name, from_block, to_block, int_profile_tDn=int_profile_tDn,
+                                 policy_group_tDn=policy_group_tDn, name_prefix=name_prefix):
+            self._record('switch_profile', node_name)
+            self._log_created('switch_profile', payload, exists)
+            return True
+        self.complete = False
+        return False
+
+    def int_profile(self, name, port_selectors):
+        if self._skip('int_profile', name):
+            return True
+        payload = int_profile_payload(name, port_selectors)
+        exists = self.created and _mo_dn(payload[1]) in self.inventory.int_profiles_by_dn
+        if create_int_profile(self.session, name, port_selectors):
+            self._record('int_profile', name)
+            self._log_created('int_profile', payload, exists)
+            return True
+        self.complete = False
+        return False
+
+    def vpc_group(self, name, id, nodes, podId='1'):
+        if self._skip('vpc_group', name):
+            return True
+        exists = self.created and name in self.inventory.vpc_groups_by_name
+        if create_vpc_group(self.session, name, id, nodes, podId=podId):
+            self._record('vpc_group', name, id=id)
+            self._log_created('vpc_group', vpc_group_payload(name, id, nodes, podId), exists)
+            return True
+        self.complete = False
+        return False
+
+    def _existing_static_paths(self):
+        if self.static_index is not None:
+            return self.static_index.dns
+        # Same per-node queries as the source side of the migration
+        return {binding['fvRsPathAtt']['attributes']['dn'] for node in self.target.dest_nodes
+                for binding in self.session.get(static_paths_url(node)).json()['imdata']}
+
+    def static_paths(self, paths):
+        remaining = paths
+        if self.journal:
+            committed = self.journal.committed_static_paths(self.target)
+            remaining = [path for path in paths if path.dn not in committed]
+            if len(remaining) < len(paths):
+                print(f'Skipping {len(paths) - len(remaining)} static paths already committed according to the journal')
+        if not remaining:
+            return
+        new_paths = {}
+        if self.created:
+            existing = self._existing_static_paths()
+            new_paths = {path.dn: path for path in remaining if path.dn not in existing}
+
+        def committed(dns):
+            if self.journal:
+                self.journal.record(self.target, 'static_paths', dns=dns)
+            if self.created:
+                self.created.record([dict(zip(('parent', 'mo'), static_path_payload(new_paths[dn])),
+                                          line=self.target.line, step='static_path')
+                                     for dn in dns if dn in new_paths])
+
+        on_commit = committed if self.journal or self.created else None
+        failures = create_static_paths(self.session, remaining, on_commit=on_commit)
+        self.complete = not failures and self.complete
+
+
+class PlanWriter:
+    '''Records the objects of a migration as REST payloads instead of committing them. Every change is
+    classified against the fabric state read at the start of the run: "create" for new objects,
+    "exists" for objects already on the APIC (the push would merge into them).
+    :param inventory = FabricInventory of the fabric, before the migration records into it
+    :param static_index = StaticBindingIndex of the fabric'''
+
+    def __init__(self, inventory, static_index):
+        self.inventory = inventory
+        self.static_index = static_index
+        self.line = None   # MigrationTargets.txt line being planned
+        self.changes = []
+
+    def _record(self, step, parent, mo, exists):
+        self.changes.append({'line': self.line, 'step': step, 'action': 'exists' if exists else 'create',
+                             'parent': parent, 'mo': mo})
+
+    def switch_profile(self, node_name, from_block, to_block, int_profile_tDn=None, policy_group_tDn=None,
+                       name_prefix=None):
+        parent, mo = switch_profile_payload(node_name, from_block, to_block, int_profile_tDn, policy_group_tDn,
+                                            name_prefix)
+        self._record('switch_profile', parent, mo, mo['infraNodeP']['attributes']['dn'] in self.inventory.switch_profiles_by_dn)
+        return True
+
+    def int_profile(self, name, port_selectors):
+        parent, mo = int_profile_payload(name, port_selectors)
+        self._record('int_profile', parent, mo, mo['infraAccPortP']['attributes']['dn'] in self.inventory.int_profiles_by_dn)
+        return True
+
+    def vpc_group(self, name, id, nodes, podId='1'):
+        parent, mo = vpc_group_payload(name, id, nodes, podId)
+        self._record('vpc_group', parent, mo, name in self.inventory.vpc_groups_by_name)
+        return True
+
+    def static_paths(self, paths):
+        for path in paths:
+            parent, mo = static_path_payload(path)
+            self._record('static_path', parent, mo, path.dn in self.static_index.dns)
+
+
+def _mo_dn(mo):
+    return next(iter(mo.values()))['attributes']['dn']
+
+
+def change_dn(change):
+    return _mo_dn(change['mo'])
+
+
+def write_plan(path, changes, **header):
+    '''Writes a plan as NDJSON: one header line followed by one change per line'''
+    with open(path, 'w') as fp:
+        fp.write(json.dumps(dict(header, plan=PLAN_VERSION, created=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                 changes=len(changes)), separators=(',', ':')) + '\n')
+        for change in changes:
+            fp.write(json.dumps(change, separators=(',', ':')) + '\n')
+
+
+def read_plan(path):
+    '''Reads a plan written by write_plan(). Returns (header, changes)'''
+    with open(path, 'r') as fp:
+        header = json.loads(fp.readline())
+        if header.get('plan') != PLAN_VERSION:
+            raise ValueError(f'{path} is not a plan file of version {PLAN_VERSION}')
+        changes = [json.loads(line) for line in fp if line.strip()]
+    return header, changes
+
+
+def print_plan_diff(changes):
+    '''Prints the change set as a diff against the current fabric: + new objects, ~ objects that already exist'''
+    counts = {}
+    for change in changes:
+        print(f"{'+' if change['action'] == 'create' else '~'} {change_dn(change)}")
+        key = (change['step'], change['action'])
+        counts[key] = counts.get(key, 0) + 1
+    for (step, action), count in sorted(counts.items()):
+        print(f'  {step:<15} {action:<7} {count}')
+    print(f'  {len(changes)} objects in plan')
+
+
+def _batch_root(parent):
+    '''The dn each change is pushed under: uni/infra, uni/fabric/protpol or its tenant'''
+    if parent in _ROOT_CLASSES:
+        return parent
+    return '/'.join(parent.split('/')[:2])
+
+
+def group_changes(changes):
+    '''Plan changes grouped by the dn they are pushed under, in push order: access policies, then VPC groups, then the
+    tenants'''
+    groups = {}
+    for change in changes:
+        groups.setdefault(_batch_root(change['parent']), []).append(change)
+    ordered = {root: groups.pop(root) for root in _ROOT_ORDER if root in groups}
+    ordered.update(groups)
+    return ordered
+
+
+def nest_changes(root, changes, container_status=None):
+    '''Builds one hierarchical payload rooted at root containing every change, so a batch is a single POST
+    :param container_status = status of the root and intermediate containers (ex: "modified" so a delete batch
+                              fails rather than recreates a container that no longer exists)'''
+    root_class = _ROOT_CLASSES.get(root, 'fvTenant')
+    container = {'status': container_status} if container_status else {}
+    root_body = {'attributes': {'dn': root, **container}, 'children': []}
+    containers = {root: root_body}
+    for change in changes:
+        parent = change['parent']
+        if parent not in containers:
+            body = root_body
+            dn = root
+            for rn in parent[len(root) + 1:].split('/'):
+                dn = f'{dn}/{rn}'
+                if dn not in containers:
+                    class_name = next(cls for prefix, cls in _RN_CLASSES if rn.startswith(prefix))
+                    containers[dn] = {'attributes': {'name': rn.split('-', 1)[1], **container}, 'children': []}
+                    body['children'].append({class_name: containers[dn]})
+                body = containers[dn]
+        # Children are identified by their naming properties, the dn only belongs on the root
+        class_name, mo = next(iter(change['mo'].items()))
+        attributes = {key: value for key, value in mo['attributes'].items() if key != 'dn'}
+        containers[parent]['children'].append({class_name: dict(mo, attributes=attributes)})
+    return {root_class: root_body}
+
+
+def rest_commit(session, container_status=None):
+    '''Returns a commit function for commit_in_batches() that pushes a list of plan changes in one POST'''
+    def _commit(changes):
+        root = _batch_root(changes[0]['parent'])
+        response = session.post(f'/mo/{root}.json', nest_changes(root, changes, container_status))
+        if response.status_code != 200:
+            raise RuntimeError(f'{response.status_code}: {response.text}')
+    return _commit
+
+
+@instrumented('apply_plan', mos=lambda failures, session, changes, *args, **kwargs: len(changes) - len(failures))
+def apply_plan(session, changes, batch_size=None, on_commit=None):
+    '''Pushes a precomputed plan with batched hierarchical commits: access policies first, then VPC groups,
+    then the static paths of each tenant. Returns the list of (change, error) that could not be committed
+    :param on_commit = optional function called with the changes of every accepted request'''
+    results, failures = commit_in_batches(rest_commit(session), group_changes(changes),
+                                          batch_size or static_path_batch_size, on_commit=on_commit)
+    for change, e in failures:
+        print(f"ILLEGAL CONFIGURATION ERROR: {change_dn(change)}: {e}")
+    print_batch_report(results)
+    print(f'Applied {len(changes) - len(failures)} of {len(changes)} planned objects')
+    return failures
+
+
+async def apply_plan_async(session, changes, batch_size=None, on_commit=None):
+    '''apply_plan() over an apic_async.AsyncApicSession: access policies, then VPC groups, then the static paths of
+    every tenant, as in apply_plan(), but the batches of a step and the tenants are committed concurrently.
+    A failed batch is bisected like commit_in_batches() does. Returns the list of (change, error) that could not be
+    committed'''
+    batch_size = batch_size or static_path_batch_size
+    groups = group_changes(changes)
+    steps = [[root] for root in _ROOT_ORDER if root in groups] + [[root for root in groups if root not in _ROOT_ORDER]]
+    failures = []
+
+    async def _commit(root, batch):
+        try:
+            await session.post(f'/mo/{root}.json', nest_changes(root, batch))
+        except Exception as e:
+            if len(batch) == 1:
+                failures.append((batch[0], e))
+                return
+            middle = len(batch) // 2
+            await asyncio.gather(_commit(root, batch[:middle]), _commit(root, batch[middle:]))
+        else:
+            if on_commit:
+                on_commit(batch)
+
+    start = time.perf_counter()
+    for roots in steps:
+        await asyncio.gather(*(_commit(root, groups[root][i:i + batch_size])
+                               for root in roots for i in range(0, len(groups[root]), batch_size)))
+    for change, e in failures:
+        print(f"ILLEGAL CONFIGURATION ERROR: {change_dn(change)}: {e}")
+    print(f'Applied {len(changes) - len(failures)} of {len(changes)} planned objects in {time.perf_counter() - start:.2f}s')
+    return failures
+
+
+# ----- Rollback -----
+
+def _ancestors(dn):
+    '''dns of the parents of dn, ignoring the slashes inside [...] (ex: the tDn of an rspathAtt rn)'''
+    depth = 0
+    for i, char in enumerate(dn):
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == '/' and depth == 0:
+            yield dn[:i]
+
+
+def rollback_changes(changes):
+    '''Turns the changes of a plan or a CreatedObjectsLog into delete changes. Only created objects are deleted,
+    objects under another deleted object are dropped (the APIC removes them with their parent), and the objects that
+    reference others come first: static paths, then VPC groups, then switch profiles before the interface profiles
+    they point to'''
+    created = {}
+    for change in changes:
+        if change.get('action', 'create') == 'create':
+            created[change_dn(change)] = change
+    deletes = []
+    for dn, change in created.items():
+        if any(ancestor in created for ancestor in _ancestors(dn)):
+            continue
+        (class_name, body), = change['mo'].items()
+        attributes = {key: body['attributes'][key] for key in NAMING_PROPERTIES.get(class_name, ())
+                      if key in body['attributes']}
+        attributes.update(dn=dn, status='deleted')
+        deletes.append(dict(change, action='delete', mo={class_name: {'attributes': attributes}}))
+    order = {'static_path': 0, 'vpc_group': 1, 'switch_profile': 2, 'int_profile': 3}
+    deletes.sort(key=lambda change: order.get(change['step'], 0))
+    return deletes
+
+
+@instrumented('rollback', mos=lambda failures, session, changes, *args, **kwargs: len(changes) - len(failures))
+def apply_rollback(session, changes, batch_size=None, workers=4):
+    '''Deletes the objects of rollback_changes() with batched status="deleted" requests: the tenants (static paths)
+    in parallel, then the VPC groups, then the access policies, the reverse of apply_plan().
+    Containers are sent with status="modified" so a batch whose EPG or tenant is gone fails instead of recreating
+    it. Returns the list of (change, error) that could not be deleted'''
+    groups = {}
+    for change in changes:
+        groups.setdefault(_batch_root(change['parent']), []).append(change)
+    tenants = {root: mos for root, mos in groups.items() if root not in _ROOT_ORDER}
+    commit = rest_commit(session, container_status='modified')
+    batch_size = batch_size or static_path_batch_size
+
+    results, failures = [], []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for tenant_results, tenant_failures in executor.map(
+                lambda root: commit_in_batches(commit, {root: tenants[root]}, batch_size), tenants):
+            results += tenant_results
+            failures += tenant_failures
+    for root in reversed(_ROOT_ORDER):
+        if root in groups:
+            root_results, root_failures = commit_in_batches(commit, {root: groups[root]}, batch_size)
+            results += root_results
+            failures += root_failures
+
+    for change, e in failures:
+        print(f"ROLLBACK ERROR: {change_dn(change)}: {e}")
+    print_batch_report(results)
+    print(f'Deleted {len(changes) - len(failures)} of {len(changes)} objects')
+    return failures
@@ -0,0 +1,474 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+import csv
+import io
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# One migration of the target file. line is a label: the file line ("12"), or the line and position of each
+# pair/node of a range ("12[3]"). pod and the prefixes are per line overrides, None for the config.py defaults
+# (pod: the pod of the destination nodes)
+MigrationTarget = namedtuple('MigrationTarget', ['line', 'source_nodes', 'dest_nodes', 'vpc', 'pod',
+                                                 'switch_profile_prefix', 'interface_profile_prefix',
+                                                 'vpc_group_prefix'], defaults=(None, None, None, None))
+
+# Per line settings of the CSV and YAML target files
+SPEC_OVERRIDES = ('pod', 'switch_profile_prefix', 'interface_profile_prefix', 'vpc_group_prefix')
+SPEC_FIELDS = ('source', 'dest', 'vpc') + SPEC_OVERRIDES
+
+
+# Valid ids of a VPC explicit protection group
+VPC_ID_RANGE = (1, 1000)
+
+
+def target_prefixes(target, switch_profile_prefix, interface_profile_prefix, vpc_group_prefix):
+    '''(switch profile, interface profile, VPC group) prefixes of a target: its overrides, else the given defaults'''
+    return (switch_profile_prefix if target.switch_profile_prefix is None else target.switch_profile_prefix,
+            interface_profile_prefix if target.interface_profile_prefix is None else target.interface_profile_prefix,
+            vpc_group_prefix if target.vpc_group_prefix is None else target.vpc_group_prefix)
+
+
+def expand_nodes(value):
+    '''Node ids of a target file field, as strings in the given order. A field is an id, an ascending range of ids
+    or a list of both, separated by spaces or semicolons in a CSV file (ex: "101", "101-160", "101 103-104") or a
+    YAML list. Raises ValueError for anything else'''
+    if isinstance(value, list):
+        return [node for item in value for node in expand_nodes(item)]
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f'node IDs must be integers or ranges, received {value!r}')
+    nodes = []
+    for item in str(value).replace(';', ' ').split():
+        first, dash, last = item.partition('-')
+        if not first.isdigit() or (dash and not last.isdigit()):
+            raise ValueError(f'node IDs must be integers or ranges, received {item!r}')
+        if dash and int(last) < int(first):
+            raise ValueError(f'range {item} is not in ascending order')
+        nodes.extend(str(node) for node in range(int(first), int(last if dash else first) + 1))
+    if not nodes:
+        raise ValueError('no node IDs')
+    return nodes
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('yes', 'true', '1', 'y'):
+        return True
+    if text in ('no', 'false', '0', 'n', ''):
+        return False
+    raise ValueError(f'vpc must be yes or no, received {value!r}')
+
+
+def expand_entry(line, entry):
+    '''Expands one entry of a target file (dict of SPEC_FIELDS) into MigrationTargets. Source and destination must
+    have as many nodes, mapped in order: one target per node, or per consecutive pair with vpc
+    (ex: source 101-160, dest 501-560, vpc yes -> 101,102>501,502 ... 159,160>559,560). Raises ValueError'''
+    unknown = sorted(set(entry) - set(SPEC_FIELDS))
+    if unknown:
+        raise ValueError(f'unknown fields {unknown}, valid fields are {list(SPEC_FIELDS)}')
+    for field in ('source', 'dest'):
+        if entry.get(field) in (None, ''):
+            raise ValueError(f'missing {field} node IDs')
+    source_nodes = expand_nodes(entry['source'])
+    dest_nodes = expand_nodes(entry['dest'])
+    vpc = _parse_bool(entry.get('vpc', False))
+    if len(source_nodes) != len(dest_nodes):
+        raise ValueError(f'{len(source_nodes)} source nodes but {len(dest_nodes)} destination nodes')
+    if vpc and len(source_nodes) % 2:
+        raise ValueError(f'vpc needs an even number of nodes, received {len(source_nodes)}')
+    overrides = {key: str(entry[key]) for key in SPEC_OVERRIDES if entry.get(key) not in (None, '')}
+    if 'pod' in overrides and not overrides['pod'].isdigit():
+        raise ValueError(f"pod must be an integer, received {overrides['pod']!r}")
+
+    size = 2 if vpc else 1
+    count = len(source_nodes) // size
+    targets = []
+    for i in range(count):
+        # Pairs in ascending order, like the lines of MigrationTargets.txt
+        source = source_nodes[i * size:(i + 1) * size]
+        dest = dest_nodes[i * size:(i + 1) * size]
+        label = str(line) if count == 1 else f'{line}[{i + 1}]'
+        targets.append(MigrationTarget(label, sorted(source, key=int), sorted(dest, key=int), vpc, **overrides))
+    return targets
+
+
+class _TargetChecks:
+    '''Checks made while the targets are parsed, before anything is read from the fabric: a destination node is
+    migrated to once, and never also migrated from (the result would depend on the order of the lines)'''
+
+    def __init__(self):
+        self.sources = {}   # node id -> first line migrating from it
+        self.dests = {}     # node id -> line migrating to it
+
+    def check(self, target):
+        errors = []
+        for node in target.dest_nodes:
+            if node in target.source_nodes:
+                errors.append(f'Line {target.line}: node {node} is both a source and a destination')
+            elif node in self.dests:
+                errors.append(f'Line {target.line}: destination node {node} is already a destination on line '
+                              f'{self.dests[node]}')
+            elif node in self.sources:
+                errors.append(f'Line {target.line}: destination node {node} is a source on line {self.sources[node]}')
+        for node in target.source_nodes:
+            if node in self.dests and node not in target.dest_nodes:
+                errors.append(f'Line {target.line}: source node {node} is a destination on line {self.dests[node]}')
+        if not errors:
+            for node in target.dest_nodes:
+                self.dests[node] = target.line
+            for node in target.source_nodes:
+                self.sources.setdefault(node, target.line)
+        return errors
+
+
+def _read_txt(fp):
+    '''(line number, entry) of MigrationTargets.txt: 2 comma separated node IDs, or 4 for a VPC pair'''
+    for line_number, line in enumerate(fp, 1):
+        line = line.replace(' ', '').replace('\n', '')
+        if not line or line.startswith('#'):  # Skip commented and blank lines
+            continue
+        nodes = line.split(',')
+        if not all(node.isdigit() for node in nodes):
+            yield line_number, ValueError(f'node IDs must be integers, received {nodes}')
+        elif len(nodes) == 2:
+            yield line_number, {'source': nodes[0], 'dest': nodes[1]}
+        elif len(nodes) == 4:
+            yield line_number, {'source': nodes[:2], 'dest': nodes[2:], 'vpc': True}
+        else:
+            yield line_number, ValueError(f'incorrect number of nodes, received {nodes}. '
+                                          f'Please specify either 1 or 2 source/destination node IDs')
+
+
+def _read_csv(fp):
+    '''(line number, entry) of a CSV file with a header row naming SPEC_FIELDS (source and dest required).
+    Rows whose first cell starts with # are comments'''
+    rows = csv.reader(fp)
+    header = None
+    for row in rows:
+        cells = [cell.strip() for cell in row]
+        if not any(cells) or cells[0].startswith('#'):
+            continue
+        if header is None:
+            header = [cell.lower() for cell in cells]
+            continue
+        if len(cells) > len(header):
+            yield rows.line_num, ValueError(f'{len(cells)} cells but {len(header)} columns')
+            continue
+        yield rows.line_num, {key: value for key, value in zip(header, cells) if value}
+
+
+def _read_yaml(fp):
+    '''(line number, entry) of a YAML file: a list of entries, or a mapping with "targets" (the list) and
+    "defaults" (fields applied to every entry that does not set them). Requires PyYAML'''
+    import yaml
+
+    class LineLoader(yaml.SafeLoader):
+        # Keeps the line of every mapping so errors point to the file
+        def construct_mapping(self, node, deep=False):
+            mapping = super().construct_mapping(node, deep=deep)
+            mapping['__line__'] = node.start_mark.line + 1
+            return mapping
+
+    document = yaml.load(fp, Loader=LineLoader) or []
+    defaults = {}
+    if isinstance(document, dict):
+        defaults = document.get('defaults') or {}
+        unknown = sorted(set(document) - {'defaults', 'targets', '__line__'})
+        if unknown or not isinstance(defaults, dict):
+            yield document['__line__'], ValueError(f'unknown keys {unknown}, expected defaults and targets')
+            return
+        defaults.pop('__line__', None)
+        document = document.get('targets') or []
+    if not isinstance(document, list):
+        yield 1, ValueError('expected a list of targets')
+        return
+    for entry in document:
+        if not isinstance(entry, dict):
+            yield '?', ValueError(f'expected a mapping with source and dest, received {entry!r}')
+            continue
+        line_number = entry.pop('__line__')
+        yield line_number, {**defaults, **entry}
+
+
+SPEC_READERS = {'.csv': _read_csv, '.yaml': _read_yaml, '.yml': _read_yaml}
+
+
+def parse_targets(spec_file):
+    '''Parses the target file in one pass: MigrationTargets.txt format, or CSV/YAML (by extension) with ranges and
+    per line overrides. Every target is checked against the ones before it as it is expanded.
+    Returns (list of MigrationTarget, list of errors for the malformed or conflicting lines)'''
+    reader = SPEC_READERS.get(os.path.splitext(spec_file)[1].lower(), _read_txt)
+    targets = []
+    errors = []
+    checks = _TargetChecks()
+    with open(spec_file, 'r', newline='') as fp:
+        try:
+            for line_number, entry in reader(fp):
+                try:
+                    if isinstance(entry, ValueError):
+                        raise entry
+                    expanded = expand_entry(line_number, entry)
+                except ValueError as e:
+                    errors.append(f'Line {line_number}: {e}')
+                    continue
+                for target in expanded:
+                    target_errors = checks.check(target)
+                    errors += target_errors
+                    if not target_errors:
+                        targets.append(target)
+        except ImportError:
+            errors.append(f'PyYAML is required to read {spec_file}: pip3 install pyyaml')
+        except Exception as e:
+            # Syntax errors of the file itself (ex: invalid YAML)
+            errors.append(f'{spec_file} could not be parsed: {e}')
+    return targets, errors
+
+
+class FreeIdPool:
+    '''Free ids of a range kept as sorted, disjoint [start, end] intervals, so allocating the lowest free id does not
+    rescan the used ids
+    :param used_ids = ids already taken
+    :param low, high = inclusive bounds of the valid ids'''
+
+    def __init__(self, used_ids, low=VPC_ID_RANGE[0], high=VPC_ID_RANGE[1]):
+        self.intervals = []
+        start = low
+        for used in sorted(id for id in set(used_ids) if low <= id <= high):
+            if used > start:
+                self.intervals.append([start, used - 1])
+            start = used + 1
+        if start <= high:
+            self.intervals.append([start, high])
+        self._head = 0
+
+    def __len__(self):
+        return sum(end - start + 1 for start, end in self.intervals[self._head:])
+
+    def allocate(self):
+        '''Returns the lowest free id, or None when the range is exhausted'''
+        if self._head == len(self.intervals):
+            return None
+        interval = self.intervals[self._head]
+        id = interval[0]
+        if interval[0] == interval[1]:
+            self._head += 1
+        else:
+            interval[0] += 1
+        return id
+
+
+def _vpc_group_name(target, vpc_group_prefix):
+    return f"{target_prefixes(target, None, None, vpc_group_prefix)[2]}{'-'.join(target.dest_nodes)}"
+
+
+def allocate_vpc_ids(targets, inventory, vpc_group_prefix, errors=None):
+    '''Pre-allocates the lowest unused VPC protection group id for every VPC target, in file order,
+    so that concurrently running targets never race for the same id. A target whose VPC protection group already
+    exists (ex: when resuming) keeps the id of that group.
+    :param errors = optional list the targets left without an id are reported to
+    Returns a dict of target line -> vpc id'''
+    pool = FreeIdPool(inventory.used_vpc_ids())
+    allocated = {}
+    for target in targets:
+        if not target.vpc:
+            continue
+        existing = inventory.vpc_groups_by_name.get(_vpc_group_name(target, vpc_group_prefix))
+        id = int(existing.id) if existing else pool.allocate()
+        if id is None:
+            if errors is not None:
+                errors.append(f'Line {target.line}: no free VPC protection group id left in {VPC_ID_RANGE}')
+            continue
+        allocated[target.line] = id
+    return allocated
+
+
+def validate_targets(targets, inventory, vpc_group_prefix):
+    '''Checks every line against the fabric before anything is written: source nodes must be leaves of the fabric,
+    destination nodes may not be registered yet but must be leaves if they are. Registered destination pairs must not
+    already be in a VPC protection group (other than the one the line creates, ex: when resuming) and must be in one
+    pod, the pod of the line if it sets one. When the group of the
+    line already exists, its id is reused and must be a valid id no other group holds.
+    Lines conflicting with each other are already reported by parse_targets().
+    Returns the list of errors'''
+    errors = []
+    for target in targets:
+        for role, nodes in (('source', target.source_nodes), ('destination', target.dest_nodes)):
+            for node in nodes:
+                attributes = inventory.nodes.get(str(node))
+                if attributes is None:
+                    # Policies can be staged for destination leaves that are not registered yet
+                    if role == 'source':
+                        errors.append(f'Line {target.line}: source node {node} does not exist in the fabric')
+                elif attributes.get('role', 'leaf') != 'leaf':
+                    errors.append(f"Line {target.line}: {role} node {node} is a {attributes['role']}, not a leaf")
+        pods = {inventory.node_pod(node) for node in target.dest_nodes} - {None}
+        if target.pod is not None and pods and pods != {target.pod}:
+            errors.append(f'Line {target.line}: destination nodes are in pod {",".join(sorted(pods))}, '
+                          f'not in pod {target.pod}')
+        if not target.vpc:
+            continue
+        if len(pods) > 1:
+            errors.append(f'Line {target.line}: destination nodes {",".join(target.dest_nodes)} are in different pods')
+        vpc_name = _vpc_group_name(target, vpc_group_prefix)
+        for node in target.dest_nodes:
+            group = inventory.vpc_group_for_node(node)
+            if group and group.name != vpc_name:
+                errors.append(f"Line {target.line}: destination node {node} is already in VPC protection group "
+                              f"{group.name}")
+        existing = inventory.vpc_groups_by_name.get(vpc_name)
+        if existing is None:
+            continue
+        # The existing group is reused with its own id, which must be the only group holding that id
+        if not existing.id.isdigit() or not VPC_ID_RANGE[0] <= int(existing.id) <= VPC_ID_RANGE[1]:
+            errors.append(f'Line {target.line}: VPC protection group {vpc_name} has id {existing.id}, '
+                          f'outside of {VPC_ID_RANGE}')
+        elif any(group.id == existing.id and group is not existing for group in inventory.vpc_groups_by_name.values()):
+            errors.append(f'Line {target.line}: the id {existing.id} of VPC protection group {vpc_name} is also '
+                          f'used by another VPC protection group')
+    return errors
+
+
+def _target_resources(target, inventory, interface_profile_prefix, switch_profile_prefix, vpc_group_prefix,
+                      shared_names=None):
+    '''Returns (reads, writes): the sets of fabric objects a target reads from and creates'''
+    switch_profile_prefix, interface_profile_prefix, vpc_group_prefix = target_prefixes(
+        target, switch_profile_prefix, interface_profile_prefix, vpc_group_prefix)
+    reads = {f'node:{node}' for node in target.source_nodes}
+    for node in target.source_nodes:
+        for profile in inventory.switch_profiles_for_node(node):
+            reads.add(profile.dn)
+            reads.update(profile.int_profile_tDns)
+    writes = {f'node:{node}' for node in target.dest_nodes}
+    for node in target.dest_nodes:
+        writes.add(f'uni/infra/nprof-{switch_profile_prefix}{node}')
+        # Nodes sharing an interface profile conflict, the first one creates it
+        int_profile = (shared_names or {}).get(node, f'{interface_profile_prefix}{node}')
+        writes.add(f'uni/infra/accportprof-{int_profile}')
+    if target.vpc:
+        writes.add(f"uni/fabric/protpol/expgep-{vpc_group_prefix}{'-'.join(target.dest_nodes)}")
+    return reads, writes
+
+
+def plan_groups(targets, inventory, interface_profile_prefix, switch_profile_prefix, vpc_group_prefix,
+                shared_names=None):
+    '''Groups targets that conflict with each other. Two targets conflict when one creates an object the other
+    also creates or reads (shared destination nodes, interface profiles, switch profiles or VPC groups).
+    Targets in a group keep their file order and run one after another, groups are independent of each other.
+    :param shared_names = optional dict of destination node -> shared interface profile (SelectorOptimizer)
+    Returns a list of target lists'''
+    parent = list(range(len(targets)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        parent[find(i)] = find(j)
+
+    readers = {}
+    writers = {}
+    for i, target in enumerate(targets):
+        reads, writes = _target_resources(target, inventory, interface_profile_prefix, switch_profile_prefix,
+                                          vpc_group_prefix, shared_names)
+        for resource in reads:
+            readers.setdefault(resource, []).append(i)
+        for resource in writes:
+            writers.setdefault(resource, []).append(i)
+    for resource, writer_ids in writers.items():
+        for i in writer_ids[1:] + readers.get(resource, []):
+            union(writer_ids[0], i)
+
+    groups = {}
+    for i, target in enumerate(targets):
+        groups.setdefault(find(i), []).append(target)
+    return list(groups.values())
+
+
+class ThreadOutput(io.TextIOBase):
+    '''stdout replacement that sends print() output of a capturing thread to that thread's buffer,
+    so the logs of concurrently migrated pairs do not interleave'''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def capture(self):
+        self._local.buffer = io.StringIO()
+
+    def release(self):
+        buffer = getattr(self._local, 'buffer', None)
+        self._local.buffer = None
+        return buffer.getvalue() if buffer else ''
+
+    def write(self, text):
+        buffer = getattr(self._local, 'buffer', None)
+        return (buffer or self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def run_targets(targets, migrate, workers, inventory, interface_profile_prefix, switch_profile_prefix,
+                vpc_group_prefix, shared_names=None):
+    '''Runs migrate(target) for every target. Conflicting targets run one after another in file order,
+    independent groups run concurrently on a pool of workers. The output of each pair is printed as one block
+    once the pair is done. Returns a dict of target line -> True/False'''
+    groups = plan_groups(targets, inventory, interface_profile_prefix, switch_profile_prefix, vpc_group_prefix,
+                         shared_names)
+    print(f'Planned {len(targets)} targets into {len(groups)} independent groups, running on {workers} workers')
+
+    output = ThreadOutput(sys.stdout)
+    print_lock = threading.Lock()
+    results = {}
+
+    def _run_group(group):
+        for position, target in enumerate(group):
+            output.capture()
+            start = time.perf_counter()
+            try:
+                succeeded = migrate(target) is not False
+            except Exception as e:
+                print(f'ERROR: migration of line {target.line} failed: {e}')
+                succeeded = False
+            log = output.release()
+            results[target.line] = succeeded
+            with print_lock:
+                output.stream.write(f'----- Line {target.line}: {target.source_nodes} -> {target.dest_nodes} '
+                                    f'({"OK" if succeeded else "FAILED"}, {time.perf_counter() - start:.1f}s) -----\n')
+                output.stream.write(log)
+                output.stream.flush()
+            if not succeeded:
+                # Later targets in the group depend on this one
+                for skipped in group[position + 1:]:
+                    results[skipped.line] = False
+                    with print_lock:
+                        output.stream.write(f'----- Line {skipped.line}: SKIPPED, depends on failed line {target.line} -----\n')
+                return
+
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for future in as_completed([pool.submit(_run_group, group) for group in groups]):
+                future.result()
+    finally:
+        sys.stdout = output.stream
+    return results
@@ -0,0 +1,173 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Post-migration verification: the source and destination side of every MigrationTargets.txt line are reduced to
+# canonical forms (node ids replaced by their position in the line, only the attributes the migration copies) and
+# compared by hash, from the same in-memory FabricInventory and StaticBindingIndex the migration reads.
+
+import hashlib
+
+from migration_runner import target_prefixes
+from static_bindings import parse_path_tdn
+
+# Attributes of a static binding compared, its FIELDS without the tDn (compared through binding_key())
+BINDING_KEYS = ('annotation', 'descr', 'encap', 'instrImedcy', 'mode', 'primaryEncap')
+
+
+def _canonical(obj, keys=None):
+    '''Values of a model object in the fixed order of keys (its FIELDS by default), unit separated, '' for a missing
+    object or attribute. Cheaper than a sorted JSON dump and as stable'''
+    if obj is None:
+        return ''
+    return '\x1f'.join('' if value is None else str(value)
+                        for value in (getattr(obj, key) for key in keys or obj.FIELDS))
+
+
+def _digest(*parts):
+    return hashlib.blake2b('\x1e'.join(parts).encode(), digest_size=16).digest()
+
+
+def canonical_selector(selector):
+    '''Hash of a PortSelector: attributes, policy group and port blocks'''
+    blocks = sorted(_canonical(block) for block in selector.blocks)
+    return _digest(_canonical(selector), _canonical(selector.policy), *blocks)
+
+
+def binding_key(binding, nodes):
+    '''Identity of a static binding with its node ids replaced by their position in nodes (ex: the destination nodes
+    of a line), so a source binding and its migrated copy have the same key:
+        uni/tn-T/ap-A/epg-E|protpaths-{0}-{1}/pathep-[VPC1]
+    Returns None for bindings that are not on a path of those nodes'''
+    key = parse_path_tdn(binding.tDn)
+    if key is None or any(node not in nodes for node in key.nodes):
+        return None
+    positions = '-'.join(f'{{{nodes.index(node)}}}' for node in key.nodes)
+    fex = f'/extpaths-{key.fex}' if key.fex else ''
+    return f'{binding.parent_dn}|pod-{key.pod}/{key.kind}-{positions}{fex}/pathep-[{key.pathep}]'
+
+
+def canonical_binding(binding):
+    return _digest(_canonical(binding, BINDING_KEYS))
+
+
+def compare(source, dest):
+    '''Compares two {key: hash} dicts. Returns {'missing': [...], 'extra': [...], 'different': [...]} of sorted keys,
+    empty lists when they are equivalent'''
+    return {
+        'missing': sorted(key for key in source.keys() - dest.keys()),
+        'extra': sorted(key for key in dest.keys() - source.keys()),
+        'different': sorted(key for key in source.keys() & dest.keys() if source[key] != dest[key]),
+    }
+
+
+def _node_side(inventory, node, optimizer=None):
+    '''({selector name: hash}, sorted policy group tDns) of the switch profiles of one node. With an optimizer, the
+    selectors are the ones the migration creates from them (ex: coalesced)'''
+    profiles = inventory.switch_profiles_for_node(node)
+    port_selectors = [selector for profile in
+                      inventory.interface_profiles([tDn for profile in profiles for tDn in profile.int_profile_tDns])
+                      for selector in profile.port_selectors]
+    if optimizer:
+        port_selectors = optimizer.port_selectors(port_selectors)
+    selectors = {}
+    for selector in port_selectors:
+        selectors[selector.name] = canonical_selector(selector)
+    policy_groups = sorted({tDn for profile in profiles for tDn in profile.policy_group_tDns})
+    return selectors, policy_groups
+
+
+def _bindings_side(static_index, nodes):
+    nodes = [str(node) for node in nodes]
+    return {key: canonical_binding(binding) for key, binding in
+            ((binding_key(binding, nodes), binding) for binding in static_index.bindings_for_sources(nodes)) if key}
+
+
+def verify_target(inventory, static_index, target, switch_profile_prefix, interface_profile_prefix, vpc_group_prefix,
+                  optimizer=None):
+    '''Equivalence report of one MigrationTargets.txt line.
+    :param inventory = FabricInventory read after the migration
+    :param static_index = StaticBindingIndex of every static binding
+    :param target = MigrationTarget, its prefix overrides take precedence over the prefixes given
+    :param optimizer = SelectorOptimizer the migration ran with, if any
+    Returns a dict with the missing, extra and different selectors and bindings of the destination side, the
+    objects the migration should have created but are absent, and an overall 'equivalent' flag'''
+    report = {'line': target.line, 'source_nodes': target.source_nodes, 'dest_nodes': target.dest_nodes,
+              'missing_objects': [], 'selectors': {}, 'policy_groups': {}}
+    switch_profile_prefix, interface_profile_prefix, vpc_group_prefix = target_prefixes(
+        target, switch_profile_prefix, interface_profile_prefix, vpc_group_prefix)
+    for source, dest in zip(target.source_nodes, target.dest_nodes):
+        # Objects named after the configured prefixes, the normalized comparison below ignores the names
+        switch_profile_dn = f'uni/infra/nprof-{switch_profile_prefix}{dest}'
+        int_profile_name = f'{interface_profile_prefix}{dest}'
+        if optimizer:
+            int_profile_name = optimizer.int_profile_name(dest, int_profile_name)
+        int_profile_dn = f'uni/infra/accportprof-{int_profile_name}'
+        profile = inventory.switch_profiles_by_dn.get(switch_profile_dn)
+        if profile is None:
+            report['missing_objects'].append(switch_profile_dn)
+        elif int_profile_dn not in profile.int_profile_tDns:
+            report['missing_objects'].append(f'{switch_profile_dn} -> {int_profile_dn}')
+        if int_profile_dn not in inventory.int_profiles_by_dn:
+            report['missing_objects'].append(int_profile_dn)
+
+        source_selectors, source_policy_groups = _node_side(inventory, source, optimizer)
+        dest_selectors, dest_policy_groups = _node_side(inventory, dest)
+        report['selectors'][dest] = compare(source_selectors, dest_selectors)
+        report['policy_groups'][dest] = [] if source_policy_groups[:1] == dest_policy_groups[:1] else \
+            [f'{source_policy_groups[:1]} != {dest_policy_groups[:1]}']
+    if target.vpc:
+        vpc_name = f"{vpc_group_prefix}{'-'.join(str(node) for node in target.dest_nodes)}"
+        group = inventory.vpc_groups_by_name.get(vpc_name)
+        if group is None or any(inventory.vpc_group_for_node(node) is not group for node in target.dest_nodes):
+            report['missing_objects'].append(f'uni/fabric/protpol/expgep-{vpc_name}')
+
+    report['bindings'] = compare(_bindings_side(static_index, target.source_nodes),
+                                 _bindings_side(static_index, target.dest_nodes))
+    report['equivalent'] = not report['missing_objects'] and \
+        not any(diff for diff in report['policy_groups'].values()) and \
+        not any(keys for diff in report['selectors'].values() for keys in diff.values()) and \
+        not any(report['bindings'].values())
+    return report
+
+
+def verify_targets(inventory, static_index, targets, switch_profile_prefix, interface_profile_prefix,
+                   vpc_group_prefix, optimizer=None):
+    return [verify_target(inventory, static_index, target, switch_profile_prefix, interface_profile_prefix,
+                          vpc_group_prefix, optimizer) for target in targets]
+
+
+def print_verify_report(reports, max_items=10):
+    '''Prints one line per equivalent MigrationTargets.txt line and the differences of the others, max_items keys
+    per list'''
+    def print_keys(label, keys):
+        if keys:
+            more = f' (+{len(keys) - max_items} more)' if len(keys) > max_items else ''
+            print(f'    {label} ({len(keys)}): {", ".join(keys[:max_items])}{more}')
+
+    for report in reports:
+        nodes = f"{','.join(report['source_nodes'])} > {','.join(report['dest_nodes'])}"
+        if report['equivalent']:
+            print(f"Line {report['line']} ({nodes}): equivalent")
+            continue
+        print(f"Line {report['line']} ({nodes}): DIFFERENT")
+        print_keys('missing objects', report['missing_objects'])
+        for dest, diff in report['policy_groups'].items():
+            print_keys(f'node {dest} switch policy group', diff)
+        for dest, diff in report['selectors'].items():
+            for kind, keys in diff.items():
+                print_keys(f'node {dest} {kind} port selectors', keys)
+        for kind, keys in report['bindings'].items():
+            print_keys(f'{kind} static bindings', keys)
+    equivalent = sum(1 for report in reports if report['equivalent'])
+    print(f'{equivalent} of {len(reports)} lines equivalent')
@@ -0,0 +1,59 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+from fabric_model import InterfaceProfile, NodeProfile, PortSelector
+
+
+def walk_mos(mo_list, classes=None):
+    '''Walks a list of MO dicts (imdata or a children list) depth first, parents before children, without
+    serializing anything. Yields (class_name, attributes) for every MO, or only for the class names in classes.
+    :param mo_list = list of {class_name: {'attributes': {}, 'children': []}} dicts
+    :param classes = optional iterable of class names to yield'''
+    wanted = frozenset(classes) if classes is not None else None
+    stack = list(reversed(mo_list))
+    while stack:
+        mo = stack.pop()
+        for class_name, body in mo.items():
+            if wanted is None or class_name in wanted:
+                yield class_name, body.get('attributes', {})
+            children = body.get('children')
+            if children:
+                stack.extend(reversed(children))
+
+
+_NODE_PROFILE_CLASSES = ('infraNodeBlk', 'infraRsAccNodePGrp', 'infraRsAccPortP')
+
+
+def node_profile_record(profile):
+    '''Builds a NodeProfile from an infraNodeP dict in a single walk of its subtree'''
+    attributes = profile['infraNodeP']['attributes']
+    node_blocks = []
+    policy_group_tDns = []
+    int_profile_tDns = []
+    for class_name, child in walk_mos(profile['infraNodeP'].get('children', []), _NODE_PROFILE_CLASSES):
+        if class_name == 'infraNodeBlk':
+            node_blocks.append((child['from_'], child['to_']))
+        elif class_name == 'infraRsAccNodePGrp':
+            policy_group_tDns.append(child['tDn'])
+        else:
+            int_profile_tDns.append(child['tDn'])
+    return NodeProfile(attributes.get('name'), attributes.get('dn'), node_blocks, policy_group_tDns, int_profile_tDns)
+
+
+def interface_profile_record(profile):
+    '''Builds an InterfaceProfile from an infraAccPortP dict, with a PortSelector per infraHPortS'''
+    attributes = profile['infraAccPortP']['attributes']
+    port_selectors = [PortSelector.from_mo(child) for child in profile['infraAccPortP'].get('children', [])
+                      if 'infraHPortS' in child]
+    return InterfaceProfile(attributes.get('name'), attributes['dn'], port_selectors)
@@ -0,0 +1,279 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Runs fabric_migration.py against several APICs from one invocation. Every fabric runs in its own worker process and
+# working directory with a generated config.py, so its APIC session and token, journal, created objects log, cache and
+# plan files are never shared with another fabric. The fabrics run in parallel and their output is merged into one
+# progress stream and one timing report: the migration window is the time of the slowest fabric, not the sum.
+# Usage: python3 multi_fabric.py Fabrics.yaml [--parallel N] [--workdir DIR] [--report FILE] [-- fabric_migration args]
+
+import argparse
+import importlib
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FABRIC_FIELDS = ('name', 'apic', 'user', 'password', 'password_env', 'spec_file', 'args', 'config')
+REQUIRED_FIELDS = ('name', 'apic', 'spec_file')
+# config.py settings of a fabric that are not taken from the base config.py
+FABRIC_SETTINGS = ('apic', 'base', 'user', 'password', 'spec_file')
+
+RUN_REPORT_FILE = 'run_report.json'
+LOG_FILE = 'fabric_migration.log'
+
+# The fabric working directory comes first on sys.path (python -c puts the current directory there), so its config.py
+# is the one fabric_migration.py imports even when the repository has its own
+_RUN_MIGRATION = "import runpy; runpy.run_module('fabric_migration', run_name='__main__', alter_sys=True)"
+
+# Output lines counted as progress: the number of lines to migrate, and one per migrated line
+_VALIDATED = re.compile(r'^Validated (\d+) lines')
+_LINE_DONE = 'Fabric Access Migration Complete'
+
+
+def _read_fabrics(path):
+    '''Fabric entries of a YAML (.yaml/.yml, requires PyYAML) or JSON file: a list of fabrics, or a mapping with
+    "fabrics" (the list) and "defaults" (fields applied to every fabric that does not set them)'''
+    with open(path, 'r') as fp:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            import yaml
+            document = yaml.safe_load(fp)
+        else:
+            document = json.load(fp)
+    defaults = {}
+    if isinstance(document, dict):
+        unknown = sorted(set(document) - {'defaults', 'fabrics'})
+        if unknown:
+            raise ValueError(f'unknown keys {unknown}, expected defaults and fabrics')
+        defaults = document.get('defaults') or {}
+        document = document.get('fabrics') or []
+    if not isinstance(document, list) or not isinstance(defaults, dict):
+        raise ValueError('expected a list of fabrics')
+    return [{**defaults, **entry} if isinstance(entry, dict) else entry for entry in document]
+
+
+def parse_fabrics(path):
+    '''Parses and checks a fabrics file. spec_file paths are relative to the fabrics file.
+    Returns (list of fabric dicts, list of errors)'''
+    try:
+        entries = _read_fabrics(path)
+    except ImportError:
+        return [], [f'PyYAML is required to read {path}: pip3 install pyyaml']
+    except Exception as e:
+        return [], [f'{path} could not be parsed: {e}']
+    fabrics = []
+    errors = []
+    names = set()
+    apics = {}
+    for position, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict):
+            errors.append(f'Fabric {position}: expected a mapping, received {entry!r}')
+            continue
+        label = f"Fabric {entry.get('name', position)}"
+        unknown = sorted(set(entry) - set(FABRIC_FIELDS))
+        missing = [field for field in REQUIRED_FIELDS if not entry.get(field)]
+        if unknown or missing:
+            errors.append(f'{label}: ' + ', '.join(([f'unknown fields {unknown}'] if unknown else []) +
+                                                   ([f'missing {missing}'] if missing else [])))
+            continue
+        fabric = dict(entry, name=str(entry['name']), apic=str(entry['apic']).rstrip('/'))
+        if not re.match(r'^[\w.-]+$', fabric['name']):
+            errors.append(f'{label}: the name is used as a directory, only letters, digits, "_", "-" and "." are allowed')
+        elif fabric['name'] in names:
+            errors.append(f'{label}: duplicate name')
+        names.add(fabric['name'])
+        # Two runs against one APIC would race on its VPC ids and profiles
+        if fabric['apic'] in apics:
+            errors.append(f"{label}: APIC {fabric['apic']} is also the APIC of fabric {apics[fabric['apic']]}")
+        apics.setdefault(fabric['apic'], fabric['name'])
+        if fabric.get('password_env') and fabric['password_env'] not in os.environ:
+            errors.append(f"{label}: environment variable {fabric['password_env']} is not set")
+        spec_file = os.path.join(os.path.dirname(os.path.abspath(path)), str(fabric['spec_file']))
+        if not os.path.exists(spec_file):
+            errors.append(f'{label}: spec_file {spec_file} does not exist')
+        fabric['spec_file'] = spec_file
+        args = fabric.get('args') or []
+        fabric['args'] = shlex.split(args) if isinstance(args, str) else [str(arg) for arg in args]
+        if not isinstance(fabric.get('config') or {}, dict):
+            errors.append(f'{label}: config must be a mapping of config.py settings')
+        fabrics.append(fabric)
+    return fabrics, errors
+
+
+def base_config():
+    '''Settings of the config.py found on the path (ex: prefixes, batch sizes), the base of every fabric's config'''
+    try:
+        config = importlib.import_module('config')
+    except ImportError:
+        return {}
+    return {key: value for key, value in vars(config).items() if not key.startswith('_') and
+            isinstance(value, (str, int, float, bool, type(None)))}
+
+
+def fabric_config(fabric, base):
+    '''config.py source of a fabric: the base settings, then its config overrides and its APIC settings'''
+    settings = {key: value for key, value in base.items() if key not in FABRIC_SETTINGS}
+    settings.update(fabric.get('config') or {})
+    settings.update(apic=fabric['apic'], spec_file=fabric['spec_file'])
+    lines = [f"# Generated by multi_fabric.py for fabric {fabric['name']}", 'import os as _os']
+    lines += [f'{key} = {value!r}' for key, value in settings.items()]
+    lines.append(f"user = {fabric.get('user', base.get('user', ''))!r}")
+    if fabric.get('password_env'):
+        # Read when the run starts, the password is not written to disk
+        lines.append(f"password = _os.environ[{fabric['password_env']!r}]")
+    else:
+        lines.append(f"password = {fabric.get('password', base.get('password', ''))!r}")
+    lines.append("base = apic + '/api'")
+    return '\n'.join(lines) + '\n'
+
+
+class Progress:
+    '''Merges the output of the fabric runs into one stream: every line prefixed with its fabric, or with quiet=True
+    only the start, the progress count, the errors and the end of every fabric'''
+
+    def __init__(self, width, quiet=False):
+        self.width = width
+        self.quiet = quiet
+        self._lock = threading.Lock()
+
+    def print(self, name, message):
+        with self._lock:
+            print(f'[{name:<{self.width}}] {message}', flush=True)
+
+    def output(self, name, line):
+        if not self.quiet or line.startswith('ERROR') or 'FAILED' in line:
+            self.print(name, line)
+
+
+def run_fabric(fabric, workdir, migration_args, progress, base):
+    '''Runs fabric_migration.py for one fabric in its working directory, streaming its output to progress and its
+    log file. Returns the fabric result with the run report the run wrote'''
+    name = fabric['name']
+    os.makedirs(workdir, exist_ok=True)
+    with open(os.path.join(workdir, 'config.py'), 'w') as fp:
+        fp.write(fabric_config(fabric, base))
+    report_path = os.path.join(workdir, RUN_REPORT_FILE)
+    if os.path.exists(report_path):
+        os.remove(report_path)
+    command = [sys.executable, '-c', _RUN_MIGRATION] + fabric['args'] + migration_args + ['--report', RUN_REPORT_FILE]
+    env = dict(os.environ, PYTHONUNBUFFERED='1',
+               PYTHONPATH=os.pathsep.join(filter(None, (REPO_DIR, os.environ.get('PYTHONPATH')))))
+    progress.print(name, f"started against {fabric['apic']} in {workdir}")
+    start = time.perf_counter()
+    total = done = 0
+    with open(os.path.join(workdir, LOG_FILE), 'w') as log:
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, bufsize=1)
+        for line in process.stdout:
+            log.write(line)
+            line = line.rstrip('\n')
+            progress.output(name, line)
+            validated = _VALIDATED.match(line)
+            if validated:
+                total = int(validated.group(1))
+            elif line.startswith(_LINE_DONE):
+                done += 1
+                if progress.quiet:
+                    progress.print(name, f'{done}/{total} lines migrated')
+        returncode = process.wait()
+    seconds = time.perf_counter() - start
+    status = 'ok' if returncode == 0 else f'FAILED (exit {returncode})'
+    progress.print(name, f'{status} in {seconds:.1f}s, log in {os.path.join(workdir, LOG_FILE)}')
+    run_report = None
+    if os.path.exists(report_path):
+        with open(report_path, 'r') as fp:
+            run_report = json.load(fp)
+    return {'name': name, 'apic': fabric['apic'], 'status': status, 'returncode': returncode,
+            'seconds': round(seconds, 3), 'lines': total, 'lines_migrated': done, 'workdir': workdir,
+            'run_report': run_report}
+
+
+def _totals(run_report):
+    phases = (run_report or {}).get('phases', {}).values()
+    return {key: sum(counters[key] for counters in phases) for key in ('requests', 'bytes_sent', 'bytes_received', 'mos')}
+
+
+def print_report(results, window):
+    '''One line per fabric, then the window against running the fabrics one after another'''
+    width = max([len('fabric')] + [len(result['name']) for result in results])
+    print(f"{'fabric':<{width}} {'status':<18} {'seconds':>8} {'lines':>7} {'requests':>9} {'MOs':>8} "
+          f"{'KiB sent':>9} {'KiB recv':>9}  apic")
+    for result in results:
+        totals = _totals(result['run_report'])
+        lines = f"{result['lines_migrated']}/{result['lines']}" if result['lines'] else '-'
+        print(f"{result['name']:<{width}} {result['status']:<18} {result['seconds']:>8.1f} {lines:>7} "
+              f"{totals['requests']:>9} {totals['mos']:>8} {totals['bytes_sent'] / 1024:>9.1f} "
+              f"{totals['bytes_received'] / 1024:>9.1f}  {result['apic']}")
+    sequential = sum(result['seconds'] for result in results)
+    slowest = max(results, key=lambda result: result['seconds'])
+    print(f"Window {window:.1f}s (slowest fabric {slowest['name']}: {slowest['seconds']:.1f}s), "
+          f"{sequential:.1f}s run one after another ({sequential / window if window else 1:.1f}x)")
+
+
+if __name__ == '__main__':
+    # Everything after -- is passed to every fabric_migration.py run
+    argv = sys.argv[1:]
+    migration_args = []
+    if '--' in argv:
+        argv, migration_args = argv[:argv.index('--')], argv[argv.index('--') + 1:]
+    parser = argparse.ArgumentParser(description='Runs fabric_migration.py against several APICs in parallel',
+                                     epilog='Arguments after -- are passed to every fabric_migration.py run, '
+                                            'ex: -- --plan plan.ndjson --bulk-static-paths')
+    parser.add_argument('fabrics_file', help='YAML or JSON file of the fabrics (see Fabrics.example.yaml)')
+    parser.add_argument('--parallel', type=int, default=None, help='Max fabrics run at once (default: all)')
+    parser.add_argument('--workdir', default='fabrics',
+                        help='Directory holding one working directory per fabric (default: fabrics)')
+    parser.add_argument('--quiet', action='store_true',
+                        help='Only print the progress of every fabric, their full output is in their log file')
+    parser.add_argument('--report', metavar='REPORT_FILE',
+                        help='Write the aggregated JSON report, with the run report of every fabric')
+    args = parser.parse_args(argv)
+
+    fabrics, errors = parse_fabrics(args.fabrics_file)
+    if not fabrics and not errors:
+        errors.append(f'{args.fabrics_file} has no fabrics')
+    if errors:
+        print(f'ERROR: {args.fabrics_file} has {len(errors)} problems, nothing was run:')
+        for error in errors:
+            print(f'  {error}')
+        exit(1)
+
+    base = base_config()
+    progress = Progress(max(len(fabric['name']) for fabric in fabrics), quiet=args.quiet)
+    started = time.time()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.parallel or len(fabrics)) as executor:
+        # Each thread only waits on its fabric's process
+        futures = [executor.submit(run_fabric, fabric, os.path.abspath(os.path.join(args.workdir, fabric['name'])),
+                                   migration_args, progress, base) for fabric in fabrics]
+        results = [future.result() for future in futures]
+    window = time.perf_counter() - start
+
+    print()
+    print_report(results, window)
+    if args.report:
+        with open(args.report, 'w') as fp:
+            json.dump({'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+                       'seconds': round(window, 3), 'sequential_seconds': round(sum(r['seconds'] for r in results), 3),
+                       'migration_args': migration_args, 'fabrics': results}, fp, indent=2)
+        print(f'Report written to {args.report}')
+    if any(result['returncode'] != 0 for result in results):
+        exit(1)
@@ -0,0 +1,140 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Optional reduction of the interface profiles the migration creates. Port selectors of a source profile that only
+# differ by their ports (same policy group and attributes) are merged into one selector with their adjacent port blocks
+# coalesced into ranges, and destination nodes whose selector sets are identical reference one shared interface
+# profile instead of a copy each.
+
+import hashlib
+
+from fabric_model import PortSelector
+from migration_runner import target_prefixes
+from migration_verify import canonical_selector
+
+# Selector attributes that must match for two selectors to be merged, the name is the one of the first selector
+_MERGE_KEYS = tuple(key for key in PortSelector.FIELDS if key != 'name')
+
+
+def source_port_selectors(inventory, node):
+    '''PortSelectors of the interface profiles referenced by the switch profiles of a node, the selectors
+    migrate_target() copies to its destination'''
+    tDns = [tDn for profile in inventory.switch_profiles_for_node(node) for tDn in profile.int_profile_tDns]
+    return [selector for profile in inventory.interface_profiles(tDns) for selector in profile.port_selectors]
+
+
+def selector_mos(port_selectors):
+    '''Number of MOs create_int_profile() commits for a list of PortSelectors, the infraAccPortP included'''
+    return 1 + sum(selector.mo_count() for selector in port_selectors)
+
+
+def _merge_key(selector):
+    return tuple(getattr(selector, key) for key in _MERGE_KEYS), selector.policy
+
+
+def _port(value):
+    return int(value) if str(value).isdigit() else 0
+
+
+def coalesce_blocks(blocks):
+    '''Port blocks sorted by card and port, with the blocks of one card whose ports are adjacent or overlapping
+    merged into one range (ex: 1/1-1/1 and 1/2-1/4 -> 1/1-1/4). Blocks spanning cards are kept as they are'''
+    merged = []
+    for block in sorted(blocks, key=lambda block: (_port(block.fromCard), _port(block.fromPort))):
+        last = merged[-1] if merged else None
+        if last is not None and last.fromCard == last.toCard == block.fromCard == block.toCard and \
+                (last.descr or '') == (block.descr or '') and _port(block.fromPort) <= _port(last.toPort) + 1:
+            if _port(block.toPort) > _port(last.toPort):
+                merged[-1] = last.replace(toPort=block.toPort)
+            continue
+        merged.append(block)
+    return merged
+
+
+def coalesce_port_selectors(port_selectors):
+    '''Merges the port selectors that share a policy group and attributes into the first of them and coalesces their
+    port blocks. Returns new PortSelectors, the inputs are not modified'''
+    groups = {}
+    for selector in port_selectors:
+        groups.setdefault(_merge_key(selector), []).append(selector)
+    coalesced = []
+    for selectors in groups.values():
+        blocks = coalesce_blocks([block for selector in selectors for block in selector.blocks])
+        names = [block.name for block in blocks]
+        if len(set(names)) < len(names):
+            # Blocks coming from different selectors can have the same name, which is their rn
+            blocks = [block.replace(name=f'block{i}') for i, block in enumerate(blocks, 1)]
+        coalesced.append(selectors[0].replace(blocks=tuple(blocks)))
+    return coalesced
+
+
+def selector_set_digest(port_selectors):
+    '''Hash of a list of port selectors, independent of their order'''
+    return hashlib.blake2b(b''.join(sorted(canonical_selector(selector) for selector in port_selectors)),
+                           digest_size=8).hexdigest()
+
+
+class SelectorOptimizer:
+    '''Interface profile reduction of one run, computed from the source side of every target before the first write.
+    :param inventory = FabricInventory of the fabric
+    :param coalesce = merge port selectors and their port blocks
+    :param share = destination nodes with identical selector sets reference one shared interface profile, named
+                   <interface profile prefix>Shared_<selector set hash>'''
+
+    def __init__(self, inventory, coalesce=False, share=False):
+        self.inventory = inventory
+        self.coalesce = coalesce
+        self.share = share
+        self.shared_names = {}   # destination node -> shared interface profile name
+        self.copy_mos = 0        # MOs of the plain 1:1 copies
+        self.mos = 0             # MOs of the optimized interface profiles
+
+    def port_selectors(self, port_selectors):
+        return coalesce_port_selectors(port_selectors) if self.coalesce else port_selectors
+
+    def plan(self, targets, interface_profile_prefix):
+        '''Computes the shared profiles and the MOs saved for the targets'''
+        by_digest = {}
+        for target in targets:
+            int_prefix = target_prefixes(target, None, interface_profile_prefix, None)[1]
+            for source, dest in zip(target.source_nodes, target.dest_nodes):
+                selectors = source_port_selectors(self.inventory, source)
+                optimized = self.port_selectors(selectors)
+                self.copy_mos += selector_mos(selectors)
+                self.mos += selector_mos(optimized)
+                if self.share:
+                    by_digest.setdefault((int_prefix, selector_set_digest(optimized)), []).append((dest, optimized))
+        for (int_prefix, digest), dests in by_digest.items():
+            if len(dests) < 2:
+                continue
+            for dest, _ in dests:
+                self.shared_names[str(dest)] = f'{int_prefix}Shared_{digest}'
+            # Created once, referenced by the other destinations
+            self.mos -= (len(dests) - 1) * selector_mos(dests[0][1])
+
+    def int_profile_name(self, dest, name):
+        '''Interface profile of a destination node: its shared profile, else name'''
+        return self.shared_names.get(str(dest), name)
+
+    def summary(self):
+        return {'coalesce': self.coalesce, 'share': self.share, 'copy_mos': self.copy_mos, 'mos': self.mos,
+                'saved_mos': self.copy_mos - self.mos, 'shared_profiles': len(set(self.shared_names.values())),
+                'sharing_nodes': len(self.shared_names)}
+
+    def print_summary(self):
+        summary = self.summary()
+        saved = summary['saved_mos'] / summary['copy_mos'] * 100 if summary['copy_mos'] else 0
+        print(f"Interface profiles: {summary['mos']} MOs instead of {summary['copy_mos']} for 1:1 copies "
+              f"({summary['saved_mos']} saved, {saved:.0f}%), shared profiles: {summary['shared_profiles']} "
+              f"for {summary['sharing_nodes']} destination nodes")
@@ -0,0 +1,190 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the APIC response latency histogram buckets (Prometheus style, plus +Inf)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REPORT_VERSION = 1
+
+# Phase of the work done outside of any instrumented function
+NO_PHASE = 'other'
+
+
+def _new_counters():
+    return {'calls': 0, 'seconds': 0.0, 'requests': 0, 'bytes_sent': 0, 'bytes_received': 0, 'mos': 0,
+            'latency_sum': 0.0, 'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+
+
+class RunMetrics:
+    '''Thread safe per-phase and per-target line counters of one migration run.
+    Phases are entered with phase() (or the instrumented() decorator) and nest; the phase and the MigrationTargets.txt
+    line are tracked per thread, so concurrently migrated lines are attributed correctly.
+    Phase seconds are wall time including nested phases, requests, bytes and MOs count under the innermost phase.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.phases = {}   # phase -> counters
+            self.lines = {}    # MigrationTargets.txt line -> phase -> counters
+
+    def _state(self):
+        local = self._local
+        if not hasattr(local, 'phases'):
+            local.phases = []
+            local.line = None
+        return local
+
+    def _counters(self, phase, line):
+        '''Returns the counters to update for a phase: the run wide ones and the ones of the line, if any'''
+        counters = [self.phases.setdefault(phase, _new_counters())]
+        if line is not None:
+            counters.append(self.lines.setdefault(line, {}).setdefault(phase, _new_counters()))
+        return counters
+
+    def _current(self):
+        state = self._state()
+        return (state.phases[-1] if state.phases else NO_PHASE), state.line
+
+    @contextmanager
+    def phase(self, name):
+        state = self._state()
+        state.phases.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            state.phases.pop()
+            with self._lock:
+                for counters in self._counters(name, state.line):
+                    counters['calls'] += 1
+                    counters['seconds'] += seconds
+
+    @contextmanager
+    def line(self, line):
+        '''Attributes everything done by this thread to a MigrationTargets.txt line'''
+        state = self._state()
+        previous, state.line = state.line, line
+        try:
+            yield
+        finally:
+            state.line = previous
+
+    def record_request(self, seconds, bytes_sent=0, bytes_received=0):
+        '''Records one APIC request and its response latency'''
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+        with self._lock:
+            for counters in self._counters(*self._current()):
+                counters['requests'] += 1
+                counters['bytes_sent'] += bytes_sent
+                counters['bytes_received'] += bytes_received
+                counters['latency_sum'] += seconds
+                counters['latency_buckets'][bucket] += 1
+
+    def record_bytes_received(self, count):
+        '''Adds the bytes of a streamed response body, which are only known once it was read'''
+        with self._lock:
+            for counters in self._counters(*self._current()):
+                counters['bytes_received'] += count
+
+    def record_mos(self, count):
+        '''Records MOs read from or written to the APIC'''
+        with self._lock:
+            for counters in self._counters(*self._current()):
+                counters['mos'] += count
+
+    def report(self, **extra):
+        '''Returns the run report as a dict, extra keys (ex: apic=) are added to the header'''
+        def export(counters):
+            return dict(counters, seconds=round(counters['seconds'], 6), latency_sum=round(counters['latency_sum'], 6))
+
+        with self._lock:
+            return dict(extra, report=REPORT_VERSION, started=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                        seconds=round(time.time() - self.started, 3), latency_buckets=list(LATENCY_BUCKETS),
+                        phases={phase: export(counters) for phase, counters in self.phases.items()},
+                        lines={str(line): {phase: export(counters) for phase, counters in phases.items()}
+                               for line, phases in sorted(self.lines.items())})
+
+    def prometheus(self, **labels):
+        '''Returns the run wide counters in the Prometheus text exposition format. Per line counters are only in the
+        JSON report to keep the label cardinality low'''
+        base_labels = ''.join(f',{key}="{value}"' for key, value in sorted(labels.items()))
+        metrics = (('calls', 'counter', 'Instrumented calls per phase'),
+                   ('seconds', 'counter', 'Wall time per phase in seconds, including nested phases'),
+                   ('requests', 'counter', 'APIC requests per phase'),
+                   ('bytes_sent', 'counter', 'Request bytes sent to the APIC per phase'),
+                   ('bytes_received', 'counter', 'Response bytes received from the APIC per phase'),
+                   ('mos', 'counter', 'MOs read from or written to the APIC per phase'))
+        lines = []
+        with self._lock:
+            phases = sorted(self.phases.items())
+            for key, kind, description in metrics:
+                name = f'aci_migration_phase_{key}_total'
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {kind}')
+                for phase, counters in phases:
+                    lines.append(f'{name}{{phase="{phase}"{base_labels}}} {counters[key]}')
+            name = 'aci_migration_request_latency_seconds'
+            lines.append(f'# HELP {name} APIC response latency per phase')
+            lines.append(f'# TYPE {name} histogram')
+            for phase, counters in phases:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), counters['latency_buckets']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{phase="{phase}"{base_labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{phase="{phase}"{base_labels}}} {counters["latency_sum"]:.6f}')
+                lines.append(f'{name}_count{{phase="{phase}"{base_labels}}} {counters["requests"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, report_path=None, prometheus_path=None, **extra):
+        '''Writes the JSON run report and/or the Prometheus text file'''
+        if report_path:
+            with open(report_path, 'w') as fp:
+                json.dump(self.report(**extra), fp, indent=2)
+            print(f'Run report written to {report_path}')
+        if prometheus_path:
+            labels = {key: value for key, value in extra.items() if isinstance(value, str)}
+            with open(prometheus_path, 'w') as fp:
+                fp.write(self.prometheus(**labels))
+            print(f'Prometheus metrics written to {prometheus_path}')
+
+
+# Metrics of the current run, shared by every module
+METRICS = RunMetrics()
+
+
+def instrumented(phase, mos=None):
+    '''Decorator running a function inside METRICS.phase(phase).
+    :param mos = optional function(result, *args, **kwargs) returning the number of MOs the call read or wrote'''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with METRICS.phase(phase):
+                result = func(*args, **kwargs)
+                if mos is not None:
+                    METRICS.record_mos(mos(result, *args, **kwargs))
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,112 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+import re
+from collections import namedtuple
+
+from apic_queries import STATIC_BINDINGS_URL
+from apic_stream import DEFAULT_PAGE_SIZE, iter_query
+from fabric_model import StaticBinding
+
+# Structured form of a static path tDn, ex:
+#   topology/pod-1/paths-101/pathep-[eth1/1]
+#   topology/pod-1/protpaths-101-102/pathep-[VPC1]
+#   topology/pod-1/paths-101/extpaths-111/pathep-[eth1/1]    (FEX)
+#   topology/pod-1/paths-101/pathep-[eth1/1/1]               (breakout)
+PathKey = namedtuple('PathKey', ['pod', 'kind', 'nodes', 'fex', 'pathep'])
+
+_PATH_TDN = re.compile(r'^topology/pod-(\d+)/(paths|protpaths)-(\d+)(?:-(\d+))?/'
+                       r'(?:ext(?:prot)?paths-(\d+(?:-\d+)?)/)?pathep-\[(.+)\]$')
+
+
+def parse_path_tdn(tDn):
+    '''Parses a static path tDn into a PathKey. Returns None for tDns that are not node paths'''
+    match = _PATH_TDN.match(tDn)
+    if not match:
+        return None
+    pod, kind, node1, node2, fex, pathep = match.groups()
+    nodes = (node1, node2) if node2 else (node1,)
+    return PathKey(pod, kind, nodes, fex, pathep)
+
+
+def iter_static_bindings(session, page_size=DEFAULT_PAGE_SIZE):
+    '''Lazily yields every fvRsPathAtt in the fabric ({'fvRsPathAtt': {...}} dicts) from one paginated, streamed
+    class query instead of one wildcard query per node'''
+    return iter_query(session, STATIC_BINDINGS_URL, page_size)
+
+
+def node_mapping(source_nodes, dest_nodes):
+    '''Maps the node ids of static paths from the source to the destination nodes of a MigrationTargets.txt line.
+    Single node paths map node to node, VPC paths map the source pair to the destination pair.
+    Returns a dict of source node tuple -> destination node tuple'''
+    mapping = {(str(source),): (str(dest),) for source, dest in zip(source_nodes, dest_nodes)}
+    if len(source_nodes) == 2:
+        mapping[tuple(str(node) for node in source_nodes)] = tuple(str(node) for node in dest_nodes)
+    return mapping
+
+
+def rewrite_binding(binding, mapping):
+    '''Returns a copy of a StaticBinding whose tDn (and so dn) point to the destination nodes. Only the node ids of
+    the parsed tDn are swapped, every other attribute is shared with the source binding.
+    Returns None if the binding is not on a path of the mapped source nodes.
+    :param binding = StaticBinding
+    :param mapping = dict from node_mapping()'''
+    tDn = binding.tDn
+    match = _PATH_TDN.match(tDn)
+    if not match:
+        return None
+    nodes = (match.group(3), match.group(4)) if match.group(4) else (match.group(3),)
+    new_nodes = mapping.get(nodes)
+    if new_nodes is None or (match.group(2) == 'paths') != (len(nodes) == 1):
+        return None
+    new_tDn = f"{tDn[:match.start(3)]}{'-'.join(new_nodes)}{tDn[match.end(4) if match.group(4) else match.end(3):]}"
+    return binding.replace(tDn=new_tDn)
+
+
+class StaticBindingIndex:
+    '''In-memory index of fvRsPathAtt static bindings by node id and by VPC node pair'''
+
+    def __init__(self):
+        self.by_node = {}   # node id -> [StaticBindings] on paths-<node> (including FEX paths)
+        self.by_pair = {}   # (node1, node2) -> [StaticBindings] on protpaths-<node1>-<node2>
+        self.dns = set()    # dn of every indexed binding
+
+    @classmethod
+    def from_bindings(cls, bindings):
+        '''Index of fvRsPathAtt dicts (ex: a streamed query), kept as StaticBindings'''
+        index = cls()
+        index.add(StaticBinding.from_mo(binding) for binding in bindings)
+        return index
+
+    def add(self, bindings):
+        '''Indexes StaticBindings, also used to record the bindings created during the run'''
+        for binding in bindings:
+            self.dns.add(binding.dn)
+            key = parse_path_tdn(binding.tDn)
+            if key is None:
+                continue
+            if key.kind == 'paths':
+                self.by_node.setdefault(key.nodes[0], []).append(binding)
+            else:
+                self.by_pair.setdefault(key.nodes, []).append(binding)
+
+    def bindings_for_sources(self, source_nodes):
+        '''Returns the bindings to migrate for a MigrationTargets.txt line: every single node path of the source
+        nodes, plus the VPC paths of the source pair when two source nodes are given'''
+        bindings = []
+        for node in source_nodes:
+            bindings.extend(self.by_node.get(str(node), []))
+        if len(source_nodes) == 2:
+            bindings.extend(self.by_pair.get(tuple(str(node) for node in source_nodes), []))
+        return bindings
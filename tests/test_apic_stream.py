@@ -0,0 +1,125 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Streaming parser of APIC response bodies and paginated queries.
+# Run from the repository root with: python -m pytest tests
+
+import json
+import tracemalloc
+
+import pytest
+
+from apic_stream import CHUNK_SIZE, iter_imdata, iter_query
+
+# Peak memory allowed while streaming, whatever the size of the body: a few chunks and one MO
+STREAM_PEAK_LIMIT = 16 * CHUNK_SIZE
+
+
+def binding(i):
+    tDn = f'topology/pod-1/paths-{101 + i % 200}/pathep-[eth1/{i % 48 + 1}]'
+    return {'fvRsPathAtt': {'attributes': {'dn': f'uni/tn-T{i % 50}/ap-AP/epg-EPG{i % 1000}/rspathAtt-[{tDn}]',
+                                           'tDn': tDn, 'encap': f'vlan-{i % 4000 + 1}', 'mode': 'regular',
+                                           'descr': '', 'modTs': '2021-09-01T10:00:00.000+00:00'}}}
+
+
+def body_chunks(count, chunk_size=CHUNK_SIZE):
+    '''Yields a response body of count fvRsPathAtt in chunk_size pieces, without holding the whole body'''
+    pending = f'{{"totalCount":"{count}","imdata":['
+    for i in range(count):
+        pending += ('' if i == 0 else ',') + json.dumps(binding(i))
+        while len(pending) >= chunk_size:
+            yield pending[:chunk_size].encode()
+            pending = pending[chunk_size:]
+    yield (pending + ']}').encode()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, CHUNK_SIZE])
+def test_iter_imdata_across_chunks(chunk_size):
+    assert list(iter_imdata(body_chunks(50, chunk_size))) == [binding(i) for i in range(50)]
+
+
+def test_iter_imdata_multibyte_characters_split_across_chunks():
+    body = json.dumps({'imdata': [{'fvAEPg': {'attributes': {'descr': 'café – ü'}}}]},
+                      ensure_ascii=False).encode()
+    chunks = [body[i:i + 1] for i in range(len(body))]
+    assert list(iter_imdata(chunks)) == json.loads(body)['imdata']
+
+
+def test_iter_imdata_empty_and_truncated():
+    assert list(iter_imdata([b'{"totalCount":"0","imdata":[]}'])) == []
+    with pytest.raises(ValueError):
+        list(iter_imdata([b'{"totalCount":"2","imdata":[{"a":1},']))
+
+
+def test_iter_imdata_peak_memory_is_bounded():
+    count = 20000
+    body_size = sum(len(chunk) for chunk in body_chunks(count))
+    tracemalloc.start()
+    try:
+        parsed = sum(1 for _ in iter_imdata(body_chunks(count)))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert parsed == count
+    assert peak < STREAM_PEAK_LIMIT, f'peak {peak} bytes streaming a {body_size} bytes body'
+    assert peak * 10 < body_size
+
+
+class _Response:
+    def __init__(self, status_code, items):
+        self.status_code = status_code
+        self.text = json.dumps({'totalCount': str(len(items)), 'imdata': items})
+        self.raw = self
+
+    def iter_content(self, chunk_size):
+        return [self.text[i:i + chunk_size].encode() for i in range(0, len(self.text), chunk_size)]
+
+    def tell(self):
+        return len(self.text)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Session:
+    '''Answers the pages of a query from a list of (status, items)'''
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.paths = []
+
+    def get(self, path, stream=False):
+        self.paths.append(path)
+        status, items = self.pages[len(self.paths) - 1]
+        return _Response(status, items)
+
+
+def test_iter_query_pages():
+    items = [binding(i) for i in range(5)]
+    session = _Session([(200, items[:2]), (200, items[2:4]), (200, items[4:])])
+    assert list(iter_query(session, '/class/fvRsPathAtt.json?order-by=fvRsPathAtt.dn', page_size=2)) == items
+    assert session.paths[-1] == '/class/fvRsPathAtt.json?order-by=fvRsPathAtt.dn&page=2&page-size=2'
+
+
+def test_iter_query_error_status():
+    error = [{'error': {'attributes': {'code': '403', 'text': 'Token was invalid (Error: Token timeout)'}}}]
+    session = _Session([(200, [binding(0), binding(1)]), (403, error)])
+    with pytest.raises(RuntimeError, match='/class/fvRsPathAtt.json failed on page 1: 403'):
+        list(iter_query(session, '/class/fvRsPathAtt.json', page_size=2))
@@ -0,0 +1,101 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Tracking of the config snapshot export gating the first write.
+# Run from the repository root with: python -m pytest tests
+
+import json
+
+import pytest
+
+from config_snapshot import SNAPSHOT_EXPORT_DN, SnapshotWatcher
+
+
+class _Response:
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def _jobs_body(*jobs):
+    return json.dumps({'totalCount': str(len(jobs)), 'imdata': [
+        {'configJob': {'attributes': {'dn': f'uni/backupst/jobs-[{SNAPSHOT_EXPORT_DN}]/run-{name}', 'operSt': state}}}
+        for name, state in jobs]})
+
+
+class _Session:
+    '''Answers the job queries from a list of (status, body), the last one is repeated'''
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+
+    def get(self, path):
+        status, body = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        return _Response(status, body)
+
+
+def _trigger(status):
+    calls = []
+
+    def trigger():
+        calls.append(status)
+        return status
+    return trigger, calls
+
+
+@pytest.mark.parametrize('status, body', [
+    (403, '{"totalCount":"1","imdata":[{"error":{"attributes":{"code":"403","text":"Token was invalid"}}}]}'),
+    (502, '<html><body>Bad Gateway</body></html>'),
+])
+def test_jobs_unreadable_before_the_trigger(status, body):
+    trigger, calls = _trigger(200)
+    watcher = SnapshotWatcher(_Session((status, body)), trigger).start()
+    assert watcher.state == 'trigger-failed'
+    assert calls == []
+    assert watcher.wait() is False
+
+
+def test_error_entries_are_skipped():
+    error = {'error': {'attributes': {'code': '400', 'text': 'Request failed'}}}
+    body = json.loads(_jobs_body(('old', 'success')))
+    body['imdata'].append(error)
+    watcher = SnapshotWatcher(_Session((200, json.dumps(body))), lambda: 200)
+    assert list(watcher._jobs()) == [f'uni/backupst/jobs-[{SNAPSHOT_EXPORT_DN}]/run-old']
+
+
+def test_new_job_success():
+    session = _Session((200, _jobs_body(('old', 'success'))),
+                       (200, _jobs_body(('old', 'success'), ('new', 'running'))),
+                       (200, _jobs_body(('old', 'success'), ('new', 'success'))))
+    watcher = SnapshotWatcher(session, lambda: 200, poll_interval=0.001, timeout=5).start()
+    assert watcher.wait() is True
+    assert watcher.job_dn.endswith('run-new')
+
+
+def test_failed_poll_is_retried():
+    session = _Session((200, _jobs_body(('old', 'success'))),
+                       (403, '{"imdata":[{"error":{"attributes":{"code":"403","text":"Token was invalid"}}}]}'),
+                       (200, _jobs_body(('old', 'success'), ('new', 'success'))))
+    watcher = SnapshotWatcher(session, lambda: 200, poll_interval=0.001, timeout=5).start()
+    assert watcher.wait() is True
+    assert watcher.polls == 2
+
+
+def test_trigger_failed():
+    watcher = SnapshotWatcher(_Session((200, _jobs_body())), lambda: 400).start()
+    assert watcher.state == 'trigger-failed'
+    assert watcher.wait() is False
@@ -0,0 +1,76 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Validation of MigrationTargets.txt lines against the fabric and VPC protection group id allocation.
+# Run from the repository root with: python -m pytest tests
+
+import pytest
+
+from fabric_inventory import FabricInventory
+from migration_runner import allocate_vpc_ids, parse_targets, validate_targets
+
+VPC_PREFIX = 'VPC_ExGrp_'
+
+
+@pytest.fixture
+def inventory():
+    inventory = FabricInventory()
+    for node in ('101', '102', '103', '104'):
+        inventory.nodes[node] = {'dn': f'topology/pod-1/node-{node}', 'role': 'leaf'}
+    inventory.nodes['201'] = {'dn': 'topology/pod-1/node-201', 'role': 'spine'}
+    return inventory
+
+
+def targets(tmp_path, *lines):
+    spec_file = tmp_path / 'MigrationTargets.txt'
+    spec_file.write_text('\n'.join(lines) + '\n')
+    targets, errors = parse_targets(str(spec_file))
+    assert errors == []
+    return targets
+
+
+def test_unregistered_destination(tmp_path, inventory):
+    assert validate_targets(targets(tmp_path, '101,501', '103,104,503,504'), inventory, VPC_PREFIX) == []
+
+
+def test_unknown_source(tmp_path, inventory):
+    errors = validate_targets(targets(tmp_path, '105,501'), inventory, VPC_PREFIX)
+    assert errors == ['Line 1: source node 105 does not exist in the fabric']
+
+
+def test_registered_destination_must_be_a_leaf(tmp_path, inventory):
+    errors = validate_targets(targets(tmp_path, '101,201'), inventory, VPC_PREFIX)
+    assert errors == ['Line 1: destination node 201 is a spine, not a leaf']
+
+
+def test_destination_in_another_vpc_group(tmp_path, inventory):
+    inventory.record_vpc_group('Other', 7, ['103', '104'])
+    errors = validate_targets(targets(tmp_path, '101,102,103,104'), inventory, VPC_PREFIX)
+    assert errors == ['Line 1: destination node 103 is already in VPC protection group Other',
+                      'Line 1: destination node 104 is already in VPC protection group Other']
+
+
+def test_existing_vpc_group_keeps_its_id(tmp_path, inventory):
+    inventory.record_vpc_group(f'{VPC_PREFIX}503-504', 1, ['503', '504'])
+    lines = targets(tmp_path, '101,102,503,504', '103,104,505,506')
+    assert validate_targets(lines, inventory, VPC_PREFIX) == []
+    assert allocate_vpc_ids(lines, inventory, VPC_PREFIX) == {'1': 1, '2': 2}
+
+
+def test_existing_vpc_group_id_held_by_another_group(tmp_path, inventory):
+    inventory.record_vpc_group(f'{VPC_PREFIX}503-504', 1, ['503', '504'])
+    inventory.record_vpc_group('Other', 1, [])
+    errors = validate_targets(targets(tmp_path, '101,102,503,504'), inventory, VPC_PREFIX)
+    assert errors == [f'Line 1: the id 1 of VPC protection group {VPC_PREFIX}503-504 is also used by another VPC '
+                      f'protection group']
@@ -0,0 +1,104 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# This software is licensed to you under the terms of the Cisco Sample
+# Code License, Version 1.1 (the "License"). You may obtain a copy of the
+# License at
+#                https://developer.cisco.com/docs/licenses
+# All use of the material herein must be in accordance with the terms of
+# the License. All rights not expressly granted by the License are
+# reserved. Unless required by applicable law or agreed to separately in
+# writing, software distributed under the License is distributed on an "AS
+# IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied.
+#
+
+# Static path tDn parsing and the DN rewrite of the static bindings copied to the destination nodes.
+# Run from the repository root with: python -m pytest tests
+
+import pytest
+
+from fabric_model import StaticBinding
+from static_bindings import _PATH_TDN, PathKey, node_mapping, parse_path_tdn, rewrite_binding
+
+EPG = 'uni/tn-T1/ap-AP/epg-EPG1'
+
+
+def binding(tDn, descr=''):
+    return StaticBinding.from_mo({'fvRsPathAtt': {'attributes': {
+        'dn': f'{EPG}/rspathAtt-[{tDn}]', 'tDn': tDn, 'encap': 'vlan-10', 'mode': 'regular', 'descr': descr}}})
+
+
+@pytest.mark.parametrize('tDn, expected', [
+    ('topology/pod-1/paths-101/pathep-[eth1/1]', PathKey('1', 'paths', ('101',), None, 'eth1/1')),
+    ('topology/pod-1/protpaths-101-102/pathep-[VPC_101-102]',
+     PathKey('1', 'protpaths', ('101', '102'), None, 'VPC_101-102')),
+    ('topology/pod-2/paths-101/extpaths-111/pathep-[eth1/3]', PathKey('2', 'paths', ('101',), '111', 'eth1/3')),
+    ('topology/pod-1/protpaths-101-102/extprotpaths-111-112/pathep-[eth1/3]',
+     PathKey('1', 'protpaths', ('101', '102'), '111-112', 'eth1/3')),
+    ('topology/pod-1/paths-101/pathep-[eth1/1/4]', PathKey('1', 'paths', ('101',), None, 'eth1/1/4')),
+])
+def test_parse_path_tdn(tDn, expected):
+    assert _PATH_TDN.match(tDn)
+    assert parse_path_tdn(tDn) == expected
+
+
+@pytest.mark.parametrize('tDn', [
+    'uni/tn-T1/ap-AP/epg-EPG1',
+    'topology/pod-1/node-101/sys/phys-[eth1/1]',
+    'topology/pod-1/paths-101',
+    'topology/pod-x/paths-101/pathep-[eth1/1]',
+])
+def test_parse_path_tdn_not_a_path(tDn):
+    assert _PATH_TDN.match(tDn) is None
+    assert parse_path_tdn(tDn) is None
+
+
+@pytest.mark.parametrize('source_nodes, dest_nodes, tDn, expected', [
+    (['101'], ['501'], 'topology/pod-1/paths-101/pathep-[eth1/1]', 'topology/pod-1/paths-501/pathep-[eth1/1]'),
+    (['101', '102'], ['501', '502'], 'topology/pod-1/paths-102/pathep-[eth1/7]',
+     'topology/pod-1/paths-502/pathep-[eth1/7]'),
+    (['101', '102'], ['501', '502'], 'topology/pod-1/protpaths-101-102/pathep-[VPC_101-102]',
+     'topology/pod-1/protpaths-501-502/pathep-[VPC_101-102]'),
+    (['101'], ['501'], 'topology/pod-2/paths-101/extpaths-111/pathep-[eth1/3]',
+     'topology/pod-2/paths-501/extpaths-111/pathep-[eth1/3]'),
+    (['101', '102'], ['501', '502'], 'topology/pod-1/protpaths-101-102/extprotpaths-111-112/pathep-[eth1/3]',
+     'topology/pod-1/protpaths-501-502/extprotpaths-111-112/pathep-[eth1/3]'),
+    (['101'], ['501'], 'topology/pod-1/paths-101/pathep-[eth1/1/4]', 'topology/pod-1/paths-501/pathep-[eth1/1/4]'),
+])
+def test_rewrite_binding(source_nodes, dest_nodes, tDn, expected):
+    source = binding(tDn)
+    result = rewrite_binding(source, node_mapping(source_nodes, dest_nodes))
+    assert result.tDn == expected
+    assert result.dn == f'{EPG}/rspathAtt-[{expected}]'
+    assert result.parent_dn == EPG
+    assert (result.encap, result.mode) == ('vlan-10', 'regular')
+    # The source binding is not modified
+    assert source.tDn == tDn
+
+
+@pytest.mark.parametrize('source_nodes, dest_nodes, tDn', [
+    # A VPC path is only moved with its pair
+    (['101'], ['501'], 'topology/pod-1/protpaths-101-102/pathep-[VPC1]'),
+    # Node ids are matched exactly, not as substrings
+    (['10'], ['50'], 'topology/pod-1/paths-101/pathep-[eth1/1]'),
+    (['101', '102'], ['501', '502'], 'topology/pod-1/paths-103/pathep-[eth1/1]'),
+    (['101', '102'], ['501', '502'], 'topology/pod-1/protpaths-101-103/pathep-[VPC1]'),
+    # A pair of node ids under paths- is not a valid path
+    (['101', '102'], ['501', '502'], 'topology/pod-1/paths-101-102/pathep-[VPC1]'),
+    (['101'], ['501'], 'topology/pod-1/node-101/sys/phys-[eth1/1]'),
+])
+def test_rewrite_binding_not_matching(source_nodes, dest_nodes, tDn):
+    assert rewrite_binding(binding(tDn), node_mapping(source_nodes, dest_nodes)) is None
+
+
+def test_rewrite_binding_keeps_descr():
+    # Descriptions that happen to contain a path are left untouched
+    descr = 'moved from /paths-101/ last year'
+    result = rewrite_binding(binding('topology/pod-1/paths-101/pathep-[eth1/1]', descr), node_mapping(['101'], ['501']))
+    assert result.descr == descr
+
+
+def test_node_mapping():
+    assert node_mapping(['101'], ['501']) == {('101',): ('501',)}
+    assert node_mapping([101, 102], [501, 502]) == {('101',): ('501',), ('102',): ('502',),
+                                                     ('101', '102'): ('501', '502')}